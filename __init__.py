@@ -8,4 +8,8 @@ __versionstr__ = '.'.join(map(str, VERSION))
 
 
 from .elements.document import Doc, Fields
+from .elements.async_document import AsyncDoc
 from .base_element.operate import NOT, OR, datetime_tool
+from .base_element.template import P
+from .base_element.aggs import (Terms, Sum, Avg, Min, Max, Cardinality, ValueCount, Stats, Histogram,
+                                DateHistogram, Composite)
@@ -0,0 +1,173 @@
+"""
+聚合, 统计在服务器上完成, 不需要获取文档
+
+    DocTry().filter(DocTry.num > 50).aggregate(
+        by_day=DateHistogram('date', '1d').aggs(total=Sum('num')),
+        top=Terms('word', size=20),
+    )
+"""
+
+
+class Agg(object):
+    """
+    聚合基类, type为es中的聚合名称
+    """
+    type = None
+
+    def __init__(self, field=None, **params):
+        self.params = dict(params)
+        if field is not None:
+            self.params['field'] = field
+        self._aggs = {}
+
+    def aggs(self, **sub_aggs):
+        """
+        嵌套子聚合
+        :param sub_aggs: name=Agg
+        :return: self
+        """
+        for name, agg in sub_aggs.items():
+            if not isinstance(agg, Agg):
+                raise TypeError('sub aggregation %s must be instance of Agg' % name)
+        self._aggs.update(sub_aggs)
+        return self
+
+    def to_dict(self):
+        body = {self.type: self.params}
+        if self._aggs:
+            body['aggs'] = {name: agg.to_dict() for name, agg in self._aggs.items()}
+        return body
+
+    def parse(self, raw):
+        """
+        将服务器返回的聚合结果转换为普通的值/字典
+        :param raw: 该聚合的响应
+        :return:
+        """
+        return raw
+
+
+class Metric(Agg):
+    """单值统计, 结果为数值"""
+
+    def parse(self, raw):
+        return raw.get('value')
+
+
+class Sum(Metric):
+    type = 'sum'
+
+
+class Avg(Metric):
+    type = 'avg'
+
+
+class Min(Metric):
+    type = 'min'
+
+
+class Max(Metric):
+    type = 'max'
+
+
+class Cardinality(Metric):
+    type = 'cardinality'
+
+
+class ValueCount(Metric):
+    type = 'value_count'
+
+
+class Stats(Agg):
+    """count/min/max/avg/sum"""
+    type = 'stats'
+
+
+class Bucket(Agg):
+    """分组聚合, 结果为 [{'key': .., 'doc_count': .., 子聚合名: 子聚合结果}, ...]"""
+
+    def parse_bucket(self, bucket):
+        result = {'key': bucket.get('key'), 'doc_count': bucket.get('doc_count')}
+        if 'key_as_string' in bucket:
+            result['key_as_string'] = bucket['key_as_string']
+        for name, agg in self._aggs.items():
+            result[name] = agg.parse(bucket.get(name, {}))
+        return result
+
+    def parse(self, raw):
+        return [self.parse_bucket(bucket) for bucket in raw.get('buckets', [])]
+
+
+class Terms(Bucket):
+    type = 'terms'
+
+    def __init__(self, field, size=10, **params):
+        super(Terms, self).__init__(field, size=size, **params)
+
+
+class Histogram(Bucket):
+    type = 'histogram'
+
+    def __init__(self, field, interval, **params):
+        super(Histogram, self).__init__(field, interval=interval, **params)
+
+
+class DateHistogram(Bucket):
+    """
+    es7以后的版本可以使用 calendar_interval='1d' / fixed_interval='30m' 代替 interval
+    """
+    type = 'date_histogram'
+
+    def __init__(self, field, interval=None, **params):
+        if interval is not None:
+            params['interval'] = interval
+        super(DateHistogram, self).__init__(field, **params)
+
+
+class Composite(Bucket):
+    """
+    组合分组, 可以分页获取所有分组, 见Doc.iter_buckets()
+    Composite(day=DateHistogram('date', '1d'), word=Terms('word'), size=1000)
+    """
+    type = 'composite'
+
+    def __init__(self, size=100, after=None, **sources):
+        super(Composite, self).__init__(size=size)
+        self.sources = sources
+        self.after = after
+
+    def to_dict(self):
+        params = dict(self.params)
+        params['sources'] = [{name: {agg.type: {k: v for k, v in agg.params.items() if k != 'size'}}}
+                             for name, agg in self.sources.items()]
+        if self.after is not None:
+            params['after'] = self.after
+        body = {self.type: params}
+        if self._aggs:
+            body['aggs'] = {name: agg.to_dict() for name, agg in self._aggs.items()}
+        return body
+
+    def parse(self, raw):
+        return {'buckets': super(Composite, self).parse(raw), 'after_key': raw.get('after_key')}
+
+
+class AggResult(dict):
+    """
+    聚合结果, {聚合名: 结果}
+    """
+
+    def columns(self, name):
+        """
+        将分组聚合的结果转换为按列的格式 {'key': [..], 'doc_count': [..], 子聚合名: [..]}
+        :param name: 聚合名
+        :return: dict
+        """
+        buckets = self[name]
+        if isinstance(buckets, dict):
+            buckets = buckets['buckets']
+        keys = []
+        for bucket in buckets:
+            for key in bucket:
+                if key not in keys:
+                    keys.append(key)
+        return {key: [bucket.get(key) for bucket in buckets] for key in keys}
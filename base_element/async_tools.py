@@ -0,0 +1,155 @@
+"""
+异步检索工具, 与sql_tools中的Query/Sql一致, 只是所有与服务器交互的方法都是协程
+检索语句的生成仍然由SelectBody完成
+"""
+from . import instrument
+from .cache import query_cache
+from .sql_tools import Sql, EMPTY, hits_total
+from ..config import Config
+
+
+class AsyncQuery(object):
+    """
+    异步检索类, 基于elasticsearch_async, 用法与Query一致: await query('get', ...)
+    """
+
+    def __init__(self):
+        self.__es = None
+
+    async def __get(self, indices=None, types=None, id=None, body=None, _source=None, **kwargs):
+        if _source:
+            kwargs['_source'] = _source
+        if id in EMPTY:
+            return await self.__es.search(index=indices, doc_type=types, body=body, **kwargs)
+        if isinstance(id, (list, tuple)):
+            return await self.__es.mget(index=indices, doc_type=types, body=body or {'ids': list(id)}, **kwargs)
+        return await self.__es.get(index=indices, doc_type=types, id=id, **kwargs)
+
+    async def __put(self, indices=None, types=None, id=None, body=None, params=None, g=False):
+        if id in EMPTY:
+            raise ValueError('id must be not empty value!')
+        if g:
+            return await self.__es.index(index=indices, doc_type=types, id=id, body=body, params=params or {})
+        return await self.__es.update(index=indices, doc_type=types, id=id, body=body, params=params or {})
+
+    async def __post(self, indices=None, types=None, id=None, body=None, params=None):
+        if not body:
+            return await self.__es.indices.create(index=indices)
+        if id in EMPTY:
+            return await self.__es.index(index=indices, doc_type=types, id=id, body=body, params=params or {})
+        return await self.__es.create(index=indices, doc_type=types, id=id, body=body, params=params or {})
+
+    async def __delete(self, indices=None, types=None, id=None):
+        return await self.__es.delete(index=indices, doc_type=types, id=id)
+
+    async def __count(self, indices=None, types=None, body=None, **kwargs):
+        return await self.__es.count(index=indices, doc_type=types, body=body, **kwargs)
+
+    async def __call__(self, method='get', *args, **kwargs):
+        self.__es = Config.get_async_es()
+        methods = {
+            'get': self.__get,
+            'put': self.__put,
+            'del': self.__delete,
+            'post': self.__post,
+            'count': self.__count
+        }
+        if method not in methods.keys():
+            raise ValueError('method argument must be one of [get, put, post, delete, count], not %s' % method)
+        if not instrument.enabled():
+            return await methods[method](*args, **kwargs)
+        # 与Query一致, 事件保存在contextvars中, 每个协程任务各自统计
+        with instrument.operation(method, indices=kwargs.get('indices'), types=kwargs.get('types')):
+            with instrument.phase('request'):
+                resp = await methods[method](*args, **kwargs)
+            instrument.record_response(resp, kwargs.get('body'))
+        return resp
+
+
+class AsyncSql(Sql):
+    """
+    异步查询语句对象, 语句的生成沿用Sql, 执行方法为协程
+    """
+    __query = AsyncQuery()
+
+    async def cached(self, method, params, fetch, use_cache=False):
+        """
+        与Sql.cached一致, fetch为返回协程的函数
+        """
+        if not use_cache:
+            return await fetch()
+        key = query_cache.make_key(self.indices, self.types, self.body, params, method)
+        found, result = query_cache.get(key)
+        if not found:
+            generation = query_cache.generation
+            result = await fetch()
+            query_cache.set(key, self.indices, result, generation)
+        return result
+
+    async def check_exists(self, pk, use_cache=False, body=None):
+        if not isinstance(pk, str):
+            raise TypeError("'pk' must be str type")
+        query_params = {'size': 0, 'terminate_after': 1}
+        body = self.count_query(body)
+        result = await self.cached('exists', query_params, lambda: self.__query(
+            'get', indices=self.indices, types=self.types, id=None, body=body, **query_params), use_cache)
+        return hits_total(result) > 0
+
+    async def check_count(self, pk, use_cache=False, approx=False, threshold=10000, body=None):
+        if not isinstance(pk, str):
+            raise TypeError("'pk' must be str type")
+        query_params = {}
+        if approx:
+            if not isinstance(threshold, int) or threshold < 1:
+                raise ValueError('threshold must be positive int')
+            # 5.x客户端的count()不接受terminate_after关键字参数, 作为url参数直接传入
+            query_params['params'] = {'terminate_after': threshold}
+        body = self.count_query(body)
+        result = await self.cached('count', query_params, lambda: self.__query(
+            'count', indices=self.indices, types=self.types, body=body, **query_params), use_cache)
+        if approx:
+            return min(result['count'], threshold)
+        return result['count']
+
+    async def put(self, doc, g=False, body=None):
+        if g:
+            body = doc.to_source()
+        with query_cache.writing(doc.indices):
+            return await self.__query('put', indices=doc.indices, types=doc.types, id=doc.get_pk(), body=body, g=g)
+
+    async def post(self, doc, **fields):
+        with query_cache.writing(doc.indices):
+            return await self.__query('post', indices=doc.indices, types=doc.types, id=doc.get_pk(),
+                                      body=doc.to_source())
+
+    async def delete(self, doc):
+        with query_cache.writing(self.indices):
+            return await self.__query('del', indices=self.indices, types=self.types, id=doc.get_pk())
+
+    async def mget(self, ids, realtime=True):
+        """与Sql.mget一致"""
+        params = {'realtime': realtime}
+        if self.query_params.get('_source'):
+            params['_source'] = self.query_params['_source']
+        result = await self.__query('get', indices=self.indices, types=self.types, id=list(ids), **params)
+        return result['docs']
+
+    async def aggregate(self, aggs, body=None, use_cache=False):
+        """与Sql.aggregate一致"""
+        body = dict(self.build_body() if body is None else body)
+        body.update(size=0, aggs=aggs)
+        body.pop('sort', None)
+        self.body = body
+        params = {k: v for k, v in self.query_params.items() if k not in ('from_', 'size', '_source')}
+        self.query_params = {}
+        data = self.dumps(body)
+        result = await self.cached('aggs', params, lambda: self.__query(
+            'get', indices=self.indices, types=self.types, id=None, body=data, **params), use_cache)
+        return result.get('aggregations', {})
+
+    async def search(self, use_cache=False):
+        body, params = self.sql_bytes, self.query_params
+        if self.query_params:
+            self.query_params = {}
+        return await self.cached('search', params, lambda: self.__query(
+            'get', indices=self.indices, types=self.types, id=None, body=body, **params), use_cache)
@@ -0,0 +1,175 @@
+"""
+进程内共享的检索结果缓存, LRU + 过期时间 + 内存上限, 写操作会使对应索引的缓存失效
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from fnmatch import fnmatch
+
+
+class QueryCache(object):
+    """
+    检索结果缓存, 缓存的是服务器的原始响应, 取出后仍会重新生成文档对象, 所以缓存内容不会被结果对象修改
+    """
+
+    def __init__(self, max_entries=1024, ttl=60, max_bytes=64 * 1024 * 1024):
+        """
+        :param max_entries: 最多缓存的检索数量
+        :param ttl: 过期时间(秒)
+        :param max_bytes: 缓存内容的大致内存上限(按响应的json长度估算, 见estimate_size)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()      # key: (expire, size, indices, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        # 每次失效加一, 检索开始前记录, 期间有写入完成时结果不再写入缓存
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def configure(self, max_entries=None, ttl=None, max_bytes=None):
+        with self._lock:
+            if max_entries is not None:
+                self.max_entries = max_entries
+            if ttl is not None:
+                self.ttl = ttl
+            if max_bytes is not None:
+                self.max_bytes = max_bytes
+            self._shrink()
+
+    @staticmethod
+    def make_key(indices, types, body, params, method='search'):
+        """
+        根据索引,类型,检索语句和参数生成缓存键, 字典按键排序, 相同的检索得到相同的键
+        :return: str
+        """
+        raw = json.dumps([method, indices, types, body, params], sort_keys=True, default=str)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        :param key: 缓存键
+        :return: (found, value)
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return False, None
+            if item[0] < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[3]
+
+    @staticmethod
+    def estimate_size(value):
+        """
+        估算响应的json长度, 文档列表(hits.hits / docs)只序列化第一条, 按条数乘算, 不序列化整个响应
+        :param value: 服务器的响应
+        :return: int
+        """
+        if not isinstance(value, dict):
+            return len(json.dumps(value, default=str))
+        rest, items = value, None
+        if isinstance(value.get('hits'), dict) and value['hits'].get('hits'):
+            items = value['hits']['hits']
+            rest = dict(value, hits=dict(value['hits'], hits=[]))
+        elif value.get('docs'):
+            items = value['docs']
+            rest = dict(value, docs=[])
+        size = len(json.dumps(rest, default=str))
+        if items:
+            size += (len(json.dumps(items[0], default=str)) + 1) * len(items)
+        return size
+
+    def set(self, key, indices, value, generation=None):
+        """
+        :param key: 缓存键
+        :param indices: 检索的索引, 用于写操作时的失效处理
+        :param value: 服务器的响应
+        :param generation: 检索开始前的generation, 检索期间有缓存失效时不写入, 避免缓存写入前的旧结果
+        :return:
+        """
+        size = self.estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, size, indices, value)
+            self._bytes += size
+            self._shrink()
+
+    def invalidate(self, indices):
+        """
+        移除与该索引相关的缓存, 检索时使用的通配符/多索引(a*,b)同样会被匹配
+        :param indices: 写入的索引名
+        :return:
+        """
+        with self._lock:
+            self.generation += 1
+            keys = [key for key, item in self._data.items() if self._match(item[2], indices)]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+
+    @contextmanager
+    def writing(self, indices):
+        """
+        包裹写操作, 写入完成(或失败)后使缓存失效, 写入前开始的检索结果也不会再写入缓存
+            with query_cache.writing(indices):
+                return es.index(...)
+        :param indices: 写入的索引名
+        """
+        try:
+            yield
+        finally:
+            self.invalidate(indices)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    @property
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._data),
+                'bytes': self._bytes,
+            }
+
+    @staticmethod
+    def _match(pattern, indices):
+        if not pattern or pattern in ('_all', '*'):
+            return True
+        return any(fnmatch(indices, p.strip()) for p in str(pattern).split(','))
+
+    def _remove(self, key):
+        item = self._data.pop(key)
+        self._bytes -= item[1]
+
+    def _shrink(self):
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            key = next(iter(self._data))
+            self._remove(key)
+            self.evictions += 1
+
+
+query_cache = QueryCache()
@@ -0,0 +1,65 @@
+"""
+按列转换检索结果, 每个字段一个NumPy数组, 不创建文档对象, 适合分析类的大量数据获取
+依赖numpy(pip install numpy)
+"""
+from .exceptions import UsageError
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# 字段类型对应的数组类型, 以及空值的填充值
+DTYPES = {
+    'Integer': ('int64', 0),
+    'Float': ('float64', float('nan')),
+    'Boolean': ('bool', False),
+    'Datetime': ('datetime64[ms]', None),
+    'String': (object, None),
+    'List': (object, None),
+}
+
+
+class ColumnBuilder(object):
+    """
+    根据字段声明的类型, 将一批原始文档转换为 {field: numpy.ma.MaskedArray}, 空值在mask中为True
+    """
+
+    def __init__(self, hydrator, fields):
+        """
+        :param hydrator: 文档类的Hydrator, 提供字段类型和Datetime编解码
+        :param fields: 需要的字段名
+        """
+        if numpy is None:
+            raise UsageError('按列获取需要安装numpy。to_columns() requires numpy, pip install numpy')
+        types = dict((name, ele_cls.__name__) for name, ele_cls in hydrator.fields)
+        self.fields = [(name, types[name]) for name in fields]
+        self.codecs = hydrator.codecs
+
+    def column(self, name, t, values):
+        dtype, fill = DTYPES[t]
+        mask = numpy.fromiter((v is None for v in values), dtype=bool, count=len(values))
+        if t == 'Datetime':
+            codec = self.codecs[name]
+            if codec.fmt == 'epoch_millis' and all(isinstance(v, int) for v in values if v is not None):
+                data = numpy.array([0 if v is None else v for v in values], dtype='int64').view(dtype)
+            else:
+                data = numpy.array(codec.decode_many(values), dtype=dtype)
+        elif dtype is object:
+            data = numpy.empty(len(values), dtype=object)
+            data[:] = values
+        elif mask.any():
+            data = numpy.array([fill if v is None else v for v in values], dtype=dtype)
+        else:
+            data = numpy.array(values, dtype=dtype)
+        return numpy.ma.MaskedArray(data, mask=mask)
+
+    def build(self, hits):
+        """
+        :param hits: [{'_source': {...}}, ...]
+        :return: {field: numpy.ma.MaskedArray}
+        """
+        sources = [hit.get('_source', {}) for hit in hits]
+        return {name: self.column(name, t, [source.get(name) for source in sources])
+                for name, t in self.fields}
@@ -0,0 +1,81 @@
+"""
+Datetime字段的编解码, 每个字段一个, 格式在创建时确定
+    __datetime_formats__ = {'date': 'epoch_millis', 'day': '%Y-%m-%d'}
+未声明格式的字段按 ISO-8601 -> 毫秒时间戳 -> datetime_tool 的顺序解析, 写入时使用ISO-8601
+"""
+from datetime import datetime, timedelta
+
+from .operate import datetime_tool
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_FORMATS = ('epoch_millis', 'epoch_second')
+
+
+class DatetimeCodec(object):
+
+    def __init__(self, fmt=None):
+        """
+        :param fmt: None / epoch_millis / epoch_second / strftime格式如 %Y-%m-%d %H:%M:%S
+        """
+        self.fmt = fmt
+        self._scale = {'epoch_millis': 1, 'epoch_second': 1000}.get(fmt)
+
+    def _from_epoch(self, value):
+        return EPOCH + timedelta(milliseconds=value * (self._scale or 1))
+
+    def decode(self, value):
+        """
+        :param value: 服务器返回的值, str / int / float / datetime
+        :return: datetime, 时区会被转换为UTC后去掉
+        """
+        if value is None or isinstance(value, datetime):
+            return value
+        if isinstance(value, (int, float)):
+            return self._from_epoch(value)
+        if self._scale:
+            return self._from_epoch(float(value))
+        if self.fmt:
+            return datetime.strptime(value, self.fmt)
+        try:
+            result = datetime.fromisoformat(value)
+        except ValueError:
+            if value.isdigit():
+                return self._from_epoch(int(value))
+            return datetime_tool(value)
+        if result.tzinfo is not None:
+            result = result.replace(tzinfo=None) - result.utcoffset()
+        return result
+
+    def decode_many(self, values):
+        """
+        批量解析一页结果中同一字段的值, 相同的值只解析一次
+        :param values: [value, ...]
+        :return: [datetime, ...]
+        """
+        decoded = {}
+        result = []
+        for value in values:
+            if value is None or isinstance(value, datetime):
+                result.append(value)
+                continue
+            dt = decoded.get(value)
+            if dt is None:
+                dt = decoded[value] = self.decode(value)
+            result.append(dt)
+        return result
+
+    def encode(self, value):
+        """
+        :param value: datetime
+        :return: 按字段格式编码的值, epoch格式为int
+        """
+        if not isinstance(value, datetime):
+            return value
+        if value.tzinfo is not None:
+            value = value.replace(tzinfo=None) - value.utcoffset()
+        if self._scale:
+            delta = value - EPOCH
+            return (delta.days * 86400000 + delta.seconds * 1000 + delta.microseconds // 1000) // self._scale
+        if self.fmt:
+            return value.strftime(self.fmt)
+        return value.isoformat()
@@ -1,11 +1,13 @@
 """
 字段元素类，基本字段，二级字段
 """
-import copy
 from datetime import datetime
 
 from ..base_element.exceptions import *
-from ..base_element.operate import compare_op, datetime_tool
+from ..base_element.operate import compare_op
+from ..base_element.template import P
+from ..base_element.sql_tools import format_name_to_normal
+from ..base_element.datetime_codec import DatetimeCodec
 
 
 class BaseEle(object):
@@ -72,10 +74,10 @@ class BaseEle(object):
         return compare_op(self, 'ne', other)
 
     def in_(self, li):
-        if isinstance(li, (list, tuple)):
+        if isinstance(li, (list, tuple, P)):
             return compare_op(self, 'in', li)
         else:
-            raise TypeError('method in_ just accept argument of list/tuple')
+            raise TypeError('method in_ just accept argument of list/tuple or placeholder P')
 
     def __get__(self, instance, owner):
         if issubclass(owner, BaseDocument):
@@ -115,25 +117,17 @@ class ClassOperate(type):
                 value.set_name(k)
                 attrs[k] = value
 
-        return type.__new__(cls, cls_name, cls_super, attrs)
+        new_cls = type.__new__(cls, cls_name, cls_super, attrs)
+        # 字段,主键,索引等信息在类创建时确定, 实例化和属性访问时不再重复计算
+        new_cls.__schema__ = Schema(new_cls)
+        return new_cls
 
 
 class BaseDocument(object):
     """
     文档类型基类
     """
-
-    def __getattribute__(self, item):
-        """
-        if get Doc.Ele, return Ele.value
-        else return normal value
-        :param item: attribute of Doc
-        :return:
-        """
-        if item != 'p_c_s' and hasattr(self, 'p_c_s') and item in self.p_c_s:
-            field = super(BaseDocument, self).__getattribute__(item)
-            return field
-        return super(BaseDocument, self).__getattribute__(item)
+    __schema__ = None
 
     def __setattr__(self, key, value):
         """
@@ -144,20 +138,11 @@ class BaseDocument(object):
         :param value: the value to assign
         :return:
         """
-        # 在字段定义的时候改变方案,使用产出的方式,产出一个类,然后这里根据类来创建字段对象!!!
-        if key != 'p_c_s' and key in self.p_c_s and hasattr(self, key):
-            attr = self.__getattribute__(key)
-
-            if attr._type == datetime:
-                if isinstance(value, datetime):
-                    value = Datetime(value.year, value.month, value.day, value.hour, value.minute, value.second)
-                else:
-                    raise TypeError('Datetime field must be instance of datetime')
-            else:
-                if attr._type == bool:
-                    value = True if value else False
-                value = eval(attr.__class__.__name__)(value)
-            value.set_name(key)
+        ele_cls = self.__schema__.field_types.get(key)
+        if ele_cls is not None:
+            if ele_cls is Datetime and not isinstance(value, datetime):
+                raise TypeError('Datetime field must be instance of datetime')
+            value = _make_ele(ele_cls, key, value)
 
         super(BaseDocument, self).__setattr__(key, value)
 
@@ -190,22 +175,119 @@ def ele_factory(doc):
     if doc._wanted:
         return [{k: doc_.get('_source', {}).get(k) for k in doc._wanted} for doc_ in docs]
 
-    def init_field(fields):
-        doc_obj = copy.deepcopy(doc)
+    return Hydrator.of(doc.__class__).hydrate(doc, docs)
 
-        fields = fields.get('_source', {})
-        for field in doc.p_c_s:
-            value = fields.get(field)
-            if isinstance(doc.__getattribute__(field), datetime):
-                value = datetime_tool(value)
-            doc_obj.__setattr__(field, value)
-        doc._id = fields.get(doc.__pk__)
-        return doc_obj
 
+def _make_ele(ele_cls, name, value):
+    """
+    直接创建字段对象, 与 ele_cls(value) + set_name(name) 的结果一致, 但不经过BaseEle.__setattr__的检查
+    :param ele_cls: String / Integer / ...
+    :param name: 字段名
+    :param value: 字段值
+    :return:
+    """
+    t = BaseEle.TYPES[ele_cls.__name__]
+    if t is list:
+        ele = list.__new__(ele_cls)
+        list.extend(ele, value or ())
+    elif t is datetime:
+        value = datetime(value.year, value.month, value.day, value.hour, value.minute, value.second)
+        ele = datetime.__new__(ele_cls, value.year, value.month, value.day, value.hour, value.minute, value.second)
+    elif t is bool:
+        value = True if value else False
+        ele = object.__new__(ele_cls)
+    else:
+        ele = t.__new__(ele_cls, value)
+    ele.__dict__.update(_field_name=name, _t_name=ele_cls.__name__, _type=t, _doc=None, _value=value)
+    return ele
 
-    result = [init_field(doc_) for doc_ in docs]
 
-    return result
+class Hydrator(object):
+    """
+    检索结果转换器, 每个文档类一个, 直接根据_source创建结果对象,
+    结果对象不拷贝检索文档的检索条件和原始响应, 检索语句对象在结果对象需要时才创建
+    """
+    def __init__(self, doc_cls, fields):
+        self.doc_cls = doc_cls
+        self.fields = tuple((name, getattr(doc_cls, name).__class__) for name in fields)
+        formats = getattr(doc_cls, '__datetime_formats__', None) or {}
+        self.codecs = {name: DatetimeCodec(formats.get(name))
+                       for name, ele_cls in self.fields if ele_cls is Datetime}
+
+    def encode(self, values):
+        """
+        按字段的格式编码Datetime字段, 用于写入
+        :param values: {field: value}
+        :return: dict
+        """
+        codecs = self.codecs
+        return {k: codecs[k].encode(v) if k in codecs else v for k, v in values.items()}
+
+    @staticmethod
+    def of(doc_cls):
+        return doc_cls.__schema__.hydrator
+
+    @staticmethod
+    def base_state(doc):
+        """结果对象共同的初始属性, 不包含检索条件和原始响应"""
+        state = {k: v for k, v in doc.__dict__.items() if not isinstance(v, BaseEle)}
+        state.update(_docs={}, _wanted=[], _p_f_map={}, _copy=None, _id=None, _had_request=True)
+        state.pop('_sql', None)
+        return state
+
+    def hydrate(self, doc, hits):
+        """
+        :param doc: 执行检索的文档对象
+        :param hits: 原始文档列表
+        :return: [doc_cls, ...]
+        """
+        base = self.base_state(doc)
+        pk = self.doc_cls.__pk__
+        new = object.__new__
+        sources = [hit.get('_source', {}) for hit in hits]
+        # Datetime字段按列批量解析
+        dates = {name: codec.decode_many([source.get(name) for source in sources])
+                 for name, codec in self.codecs.items()}
+        result = []
+        for i, (hit, source) in enumerate(zip(hits, sources)):
+            obj = new(self.doc_cls)
+            state = base.copy()
+            state['_wanted'] = []
+            state['_p_f_map'] = {}
+            for name, ele_cls in self.fields:
+                value = dates[name][i] if name in dates else source.get(name)
+                if value is None:
+                    continue
+                state[name] = _make_ele(ele_cls, name, value)
+            if pk not in source:
+                state['_id'] = hit.get('_id')
+            obj.__dict__.update(state)
+            result.append(obj)
+        return result
+
+
+class Schema(object):
+    """
+    文档类的结构信息, 由ClassOperate在类创建时生成
+    fields: 按声明顺序的字段名(包含父类的字段)
+    field_types: 字段名 => 字段类型(String/Integer/...)
+    """
+
+    def __init__(self, doc_cls):
+        fields = []
+        for klass in reversed(doc_cls.__mro__):
+            for name, value in vars(klass).items():
+                if isinstance(value, BaseEle) and name not in fields:
+                    fields.append(name)
+        self.fields = tuple(fields)
+        self.field_types = dict((name, getattr(doc_cls, name).__class__) for name in fields)
+        self.pk = getattr(doc_cls, '__pk__', None)
+        self.has_pk = self.pk in self.field_types
+        indices = getattr(doc_cls, '__indices__', None)
+        self.indices = format_name_to_normal(indices) if indices else None
+        self.types = format_name_to_normal(getattr(doc_cls, '__types__', None) or doc_cls.__name__)
+        self.hydrator = Hydrator(doc_cls, self.fields)
+        self.codecs = self.hydrator.codecs
 
 
 def Factory(name):
@@ -0,0 +1,337 @@
+"""
+检索耗时统计, 没有监听器时不做任何记录
+Doc的 all/first/count/exists/save/update/delete 每次调用产生一个Event, 包含各阶段的耗时:
+    build       生成检索语句(SelectBody.create + 语句整理)
+    serialize   检索语句序列化
+    request     请求(网络 + 服务器 + 响应解析), 服务器耗时见 took_ms
+    decode      响应解析
+    hydrate     转换为文档对象
+    network     request - decode - took (估算)
+没有Doc操作时, Query的每次请求单独产生一个Event
+
+Config.add_listener(LoggingListener())
+Config.set_slow_query_log(threshold_ms=500)
+"""
+import contextvars
+import functools
+import inspect
+import logging
+import threading
+import time
+
+from .exceptions import UsageError
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+_listeners = []
+_current = contextvars.ContextVar('elasticsearch_tool_operation', default=None)
+
+
+class Event(object):
+    """一次操作的统计"""
+    __slots__ = ('name', 'doc', 'indices', 'types', 'start', 'duration', 'phases', 'requests', 'hits', 'took_ms',
+                 'response_bytes', 'body', 'error')
+
+    def __init__(self, name, doc=None, indices=None, types=None):
+        self.name = name
+        self.doc = doc
+        self.indices = indices
+        self.types = types
+        self.start = time.time()
+        self.duration = 0.0
+        self.phases = {}
+        self.requests = 0
+        self.hits = None
+        self.took_ms = None
+        self.response_bytes = 0
+        self.body = None
+        self.error = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @property
+    def network(self):
+        """请求中除去服务器耗时和响应解析的时间, 估算值"""
+        request = self.phases.get('request')
+        if request is None:
+            return None
+        return max(request - self.phases.get('decode', 0.0) - (self.took_ms or 0) / 1000.0, 0.0)
+
+    def to_dict(self):
+        phases = dict((k, round(v * 1000, 3)) for k, v in self.phases.items())
+        if self.network is not None:
+            phases['network'] = round(self.network * 1000, 3)
+        return {
+            'name': self.name, 'doc': self.doc, 'indices': self.indices, 'types': self.types,
+            'duration_ms': self.duration * 1000, 'phases_ms': phases, 'requests': self.requests,
+            'hits': self.hits, 'took_ms': self.took_ms, 'response_bytes': self.response_bytes,
+            'error': None if self.error is None else repr(self.error),
+        }
+
+
+def add_listener(listener):
+    """
+    :param listener: 可调用对象, listener(event)
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def enabled():
+    return bool(_listeners)
+
+
+def _emit(event):
+    for listener in list(_listeners):
+        try:
+            listener(event)
+        except Exception:
+            logging.getLogger(__name__).exception('instrument listener %r failed', listener)
+
+
+class _Operation(object):
+    __slots__ = ('event', 'token', 'started')
+
+    def __init__(self, name, doc, indices, types):
+        self.event = None
+        if _listeners and _current.get() is None:
+            self.event = Event(name, doc, indices, types)
+
+    def __enter__(self):
+        if self.event is not None:
+            self.token = _current.set(self.event)
+            self.started = time.perf_counter()
+        return self.event
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        event = self.event
+        if event is not None:
+            event.duration = time.perf_counter() - self.started
+            event.error = exc_val
+            _current.reset(self.token)
+            _emit(event)
+
+
+def operation(name, doc=None, indices=None, types=None):
+    """
+    统计一次操作, 嵌套时只有最外层产生Event
+    :param name: 操作名
+    :param doc: 文档类名
+    :param indices: 索引
+    :param types: 文档类型
+    :return: context manager
+    """
+    return _Operation(name, doc, indices, types)
+
+
+class _Phase(object):
+    __slots__ = ('name', 'event', 'started')
+
+    def __init__(self, name):
+        self.name = name
+        self.event = _current.get()
+
+    def __enter__(self):
+        if self.event is not None:
+            self.started = time.perf_counter()
+        return self.event
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.event is not None:
+            self.event.add(self.name, time.perf_counter() - self.started)
+
+
+def phase(name):
+    """
+    统计当前操作中一个阶段的耗时, 没有进行中的操作时不做记录
+    :param name: build / serialize / request / decode / hydrate
+    :return: context manager
+    """
+    return _Phase(name)
+
+
+def current():
+    """当前进行中的操作的Event, 没有时为None"""
+    return _current.get()
+
+
+def record_response(result, body=None):
+    """
+    记录一次请求的响应
+    :param result: 服务器响应
+    :param body: 请求的检索语句
+    """
+    event = _current.get()
+    if event is None:
+        return
+    event.requests += 1
+    if body is not None:
+        event.body = body
+    if isinstance(result, dict):
+        if 'took' in result:
+            event.took_ms = (event.took_ms or 0) + result['took']
+        hits = result.get('hits')
+        if isinstance(hits, dict) and 'hits' in hits:
+            event.hits = (event.hits or 0) + len(hits['hits'])
+
+
+def record_bytes(size):
+    event = _current.get()
+    if event is not None:
+        event.response_bytes += size
+
+
+def instrumented(name):
+    """
+    Doc方法的装饰器, 每次调用统计一次操作
+    :param name: 操作名
+    """
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(self, *args, **kwargs):
+                if not _listeners:
+                    return await fn(self, *args, **kwargs)
+                with operation(name, self.__class__.__name__, self.indices, self.types):
+                    return await fn(self, *args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(self, *args, **kwargs):
+                if not _listeners:
+                    return fn(self, *args, **kwargs)
+                with operation(name, self.__class__.__name__, self.indices, self.types):
+                    return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LoggingListener(object):
+    """每个操作输出一条日志"""
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('elasticsearch_tool')
+        self.level = level
+
+    def __call__(self, event):
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, 'es %(name)s %(doc)s[%(indices)s] %(duration_ms).1fms phases=%(phases_ms)s '
+                                        'hits=%(hits)s took=%(took_ms)s bytes=%(response_bytes)s', event.to_dict())
+
+
+class SlowQueryLog(object):
+    """
+    记录超过阈值的操作, 包含生成的检索语句
+    """
+
+    def __init__(self, threshold_ms=500, logger=None, level=logging.WARNING):
+        self.threshold = threshold_ms / 1000.0
+        self.logger = logger or logging.getLogger('elasticsearch_tool.slow')
+        self.level = level
+
+    def __call__(self, event):
+        if event.duration < self.threshold:
+            return
+        body = event.body
+        if isinstance(body, bytes):
+            body = body.decode('utf-8', 'replace')
+        data = event.to_dict()
+        data['body'] = body
+        self.logger.log(self.level, 'slow es %(name)s %(doc)s[%(indices)s] %(duration_ms).1fms phases=%(phases_ms)s '
+                                    'took=%(took_ms)s body=%(body)s', data)
+
+
+class MetricsListener(object):
+    """
+    进程内的计数和耗时分布(Prometheus格式), 按 操作名/文档类 分组
+    metrics = MetricsListener(); Config.add_listener(metrics); metrics.render()
+    """
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets=None, prefix='elasticsearch_tool'):
+        self.buckets = tuple(sorted(buckets or self.BUCKETS))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def _observe(self, metric, labels, value):
+        histogram = self.histograms.get((metric, labels))
+        if histogram is None:
+            histogram = self.histograms[(metric, labels)] = [[0] * len(self.buckets), 0, 0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += 1
+        histogram[2] += value
+
+    def _inc(self, metric, labels, value=1):
+        self.counters[(metric, labels)] = self.counters.get((metric, labels), 0) + value
+
+    def __call__(self, event):
+        labels = (('operation', event.name), ('doc', event.doc or ''))
+        with self._lock:
+            self._inc('operations_total', labels)
+            if event.error is not None:
+                self._inc('errors_total', labels)
+            self._inc('response_bytes_total', labels, event.response_bytes)
+            self._inc('hits_total', labels, event.hits or 0)
+            self._observe('duration_seconds', labels, event.duration)
+            for name, seconds in event.phases.items():
+                self._observe('phase_seconds', labels + (('phase', name), ), seconds)
+
+    def render(self):
+        """
+        :return: Prometheus文本格式
+        """
+        def fmt(labels):
+            return ','.join('%s="%s"' % (k, v) for k, v in labels)
+
+        lines = []
+        with self._lock:
+            for (metric, labels), value in sorted(self.counters.items()):
+                lines.append('%s_%s{%s} %s' % (self.prefix, metric, fmt(labels), value))
+            for (metric, labels), (counts, count, total) in sorted(self.histograms.items()):
+                name = '%s_%s' % (self.prefix, metric)
+                for bound, n in zip(self.buckets, counts):
+                    lines.append('%s_bucket{%s} %d' % (name, fmt(labels + (('le', bound), )), n))
+                lines.append('%s_bucket{%s} %d' % (name, fmt(labels + (('le', '+Inf'), )), count))
+                lines.append('%s_count{%s} %d' % (name, fmt(labels), count))
+                lines.append('%s_sum{%s} %f' % (name, fmt(labels), total))
+        return '\n'.join(lines) + '\n'
+
+
+class OpenTelemetryListener(object):
+    """
+    每个操作生成一个span, 各阶段为span的属性, 依赖opentelemetry-api(pip install opentelemetry-api)
+    """
+
+    def __init__(self, tracer=None):
+        if trace is None:
+            raise UsageError('需要安装opentelemetry-api。OpenTelemetryListener requires opentelemetry-api, '
+                             'pip install opentelemetry-api')
+        self.tracer = tracer or trace.get_tracer('elasticsearch_tool')
+
+    def __call__(self, event):
+        start = int(event.start * 1e9)
+        span = self.tracer.start_span('es.%s' % event.name, start_time=start)
+        span.set_attribute('db.system', 'elasticsearch')
+        span.set_attribute('db.elasticsearch.index', str(event.indices))
+        span.set_attribute('db.elasticsearch.doc', str(event.doc))
+        for name, seconds in event.phases.items():
+            span.set_attribute('es.phase.%s_ms' % name, seconds * 1000)
+        for name in ('requests', 'hits', 'took_ms', 'response_bytes'):
+            value = getattr(event, name)
+            if value is not None:
+                span.set_attribute('es.%s' % name, value)
+        if event.error is not None:
+            span.record_exception(event.error)
+        span.end(end_time=start + int(event.duration * 1e9))
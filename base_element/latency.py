@@ -0,0 +1,250 @@
+"""
+检索的尾延迟控制, 通过 Config.set_latency_policy() 开启
+    对冲请求: 检索在一定时间(近期延迟的百分位)内没有返回时, 使用不同的preference再发送一次, 取先返回的结果
+    节点选择: 记录每个节点的延迟(EWMA)和进行中的请求数, 优先选择最快的节点
+    截止时间: 每次检索的最长时间, 超时抛出ServerError
+只用于只读的检索(search/get/mget), 写入和scroll不会重复发送
+"""
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from elasticsearch.connection import Urllib3HttpConnection
+from elasticsearch.connection_pool import ConnectionSelector
+
+from .exceptions import ServerError
+
+
+class NodeStats(object):
+    __slots__ = ('ewma', 'inflight', 'requests', 'errors')
+
+    def __init__(self):
+        self.ewma = None
+        self.inflight = 0
+        self.requests = 0
+        self.errors = 0
+
+
+class LatencyPolicy(object):
+    """
+    Config.set_latency_policy(hedge=True, hedge_percentile=95, deadline_ms=2000)
+    """
+
+    def __init__(self, hedge=True, hedge_percentile=95, hedge_delay_ms=None, hedge_min_delay_ms=5,
+                 min_samples=20, deadline_ms=None, ewma_alpha=0.3, window=1000, max_workers=32):
+        """
+        :param hedge: 是否发送对冲请求
+        :param hedge_percentile: 等待多久后发送对冲请求, 近期检索延迟的百分位
+        :param hedge_delay_ms: 固定的对冲等待时间(毫秒), 给定时不使用百分位
+        :param hedge_min_delay_ms: 对冲等待时间的下限(毫秒)
+        :param min_samples: 记录的延迟少于该数量时不发送对冲请求(固定等待时间除外)
+        :param deadline_ms: 每次检索的截止时间(毫秒), 为None则不限制
+        :param ewma_alpha: 节点延迟EWMA的权重, 越大越偏向最近的请求
+        :param window: 计算百分位使用的最近的延迟数量
+        :param max_workers: 执行对冲/有截止时间的检索的线程数
+        """
+        if not 0 < hedge_percentile < 100:
+            raise ValueError('hedge_percentile must be between 0 and 100')
+        if not 0 < ewma_alpha <= 1:
+            raise ValueError('ewma_alpha must be in (0, 1]')
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay_ms = hedge_delay_ms
+        self.hedge_min_delay_ms = hedge_min_delay_ms
+        self.min_samples = min_samples
+        self.deadline_ms = deadline_ms
+        self.alpha = ewma_alpha
+        self._latencies = deque(maxlen=window)
+        self._nodes = {}
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers) if hedge or deadline_ms else None
+        # 执行线程中当前请求的记录: hosts 为实际发送到的节点, exclude 为选择节点时跳过的节点
+        self._local = threading.local()
+        self._metrics = dict.fromkeys(('requests', 'hedged', 'hedge_wins', 'deadline_exceeded'), 0)
+        self.connection_class = type('TimedConnection', (TimedConnection, ), {'policy': self})
+        self.selector_class = type('EwmaSelector', (EwmaSelector, ), {'policy': self})
+
+    def _node(self, host):
+        node = self._nodes.get(host)
+        if node is None:
+            node = self._nodes.setdefault(host, NodeStats())
+        return node
+
+    def start(self, host):
+        with self._lock:
+            node = self._node(host)
+            node.inflight += 1
+            node.requests += 1
+
+    def finish(self, host, seconds, ok=True):
+        """
+        记录一次请求
+        :param host: 节点
+        :param seconds: 耗时
+        :param ok: 是否成功, 失败的请求不计入百分位
+        """
+        with self._lock:
+            node = self._node(host)
+            node.inflight -= 1
+            node.ewma = seconds if node.ewma is None else self.alpha * seconds + (1 - self.alpha) * node.ewma
+            if ok:
+                self._latencies.append(seconds)
+            else:
+                node.errors += 1
+
+    def score(self, host):
+        """
+        节点的预期延迟, 进行中的请求越多越慢
+        没有延迟记录的节点按其他节点的平均延迟估算, 空闲时为0(优先尝试)
+        """
+        node = self._nodes.get(host)
+        if node is None:
+            return 0.0
+        if node.ewma is None:
+            known = [n.ewma for n in list(self._nodes.values()) if n.ewma is not None]
+            baseline = sum(known) / len(known) if known else 0.001
+            return baseline * node.inflight
+        return node.ewma * (1 + node.inflight)
+
+    def sent(self, host):
+        """记录当前线程中的请求发送到的节点"""
+        hosts = getattr(self._local, 'hosts', None)
+        if hosts is not None:
+            hosts.append(host)
+
+    @property
+    def excluded(self):
+        """当前线程中的请求选择节点时需要跳过的节点(对冲请求跳过原请求的节点)"""
+        return getattr(self._local, 'exclude', None)
+
+    def _run(self, fn, kwargs, hosts, exclude=None):
+        self._local.hosts, self._local.exclude = hosts, exclude
+        try:
+            return fn(**kwargs)
+        finally:
+            self._local.hosts = self._local.exclude = None
+
+    def hedge_delay(self):
+        """
+        :return: 发送对冲请求前的等待时间(秒), 为None则不对冲
+        """
+        if not self.hedge:
+            return None
+        if self.hedge_delay_ms is not None:
+            return self.hedge_delay_ms / 1000.0
+        latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(int(len(latencies) * self.hedge_percentile / 100.0), len(latencies) - 1)
+        return max(latencies[index], self.hedge_min_delay_ms / 1000.0)
+
+    def _count(self, name):
+        with self._lock:
+            self._metrics[name] += 1
+
+    def _deadline_exceeded(self):
+        self._count('deadline_exceeded')
+        return ServerError('检索超过截止时间。Search exceeded the deadline of %sms' % self.deadline_ms)
+
+    def call(self, fn, kwargs):
+        """
+        执行一次只读检索
+        :param fn: 检索函数, 如 es.search
+        :param kwargs: 检索参数, 对冲请求会设置不同的preference
+        :return: 先返回的成功结果
+        """
+        self._count('requests')
+        deadline = None
+        if self.deadline_ms is not None:
+            deadline = time.monotonic() + self.deadline_ms / 1000.0
+            kwargs = dict(kwargs, request_timeout=self.deadline_ms / 1000.0)
+        delay = self.hedge_delay()
+        if 'preference' in kwargs:
+            delay = None
+        if delay is None and deadline is None:
+            return fn(**kwargs)
+
+        # 客户端的重试可能超过request_timeout, 所以在线程中执行, 到截止时间不再等待
+        first_hosts = []
+        first = self._executor.submit(self._run, fn, kwargs, first_hosts)
+        if delay is None:
+            timeout = deadline - time.monotonic()
+        elif deadline is None:
+            timeout = delay
+        else:
+            timeout = min(delay, deadline - time.monotonic())
+        done, _ = wait([first], timeout=max(timeout, 0))
+        if done:
+            return first.result()
+        if delay is None or (deadline is not None and time.monotonic() >= deadline):
+            raise self._deadline_exceeded()
+
+        self._count('hedged')
+        # 对冲请求不发送到原请求所在的节点
+        hedge = self._executor.submit(self._run, fn, dict(kwargs, preference='_hedge_%d' % next(self._counter)),
+                                      [], first_hosts)
+        pending = {first, hedge}
+        error = None
+        while pending:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                raise self._deadline_exceeded()
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    @property
+    def stats(self):
+        """
+        :return: {'requests': .., 'hedged': .., 'hedge_wins': .., 'deadline_exceeded': .., 'hedge_delay_ms': ..,
+                  'nodes': {host: {'ewma_ms': .., 'inflight': .., 'requests': .., 'errors': ..}}}
+        """
+        with self._lock:
+            result = dict(self._metrics)
+            result['nodes'] = dict((host, {'ewma_ms': None if node.ewma is None else node.ewma * 1000,
+                                           'inflight': node.inflight, 'requests': node.requests,
+                                           'errors': node.errors})
+                                   for host, node in self._nodes.items())
+        delay = self.hedge_delay()
+        result['hedge_delay_ms'] = None if delay is None else delay * 1000
+        return result
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class TimedConnection(Urllib3HttpConnection):
+    """记录每个请求的节点延迟"""
+    policy = None
+
+    def perform_request(self, method, url, params=None, body=None, timeout=None, ignore=()):
+        self.policy.sent(self.host)
+        self.policy.start(self.host)
+        start, ok = time.monotonic(), False
+        try:
+            result = super(TimedConnection, self).perform_request(method, url, params, body, timeout=timeout,
+                                                                  ignore=ignore)
+            ok = True
+            return result
+        finally:
+            self.policy.finish(self.host, time.monotonic() - start, ok)
+
+
+class EwmaSelector(ConnectionSelector):
+    """选择预期延迟最小的节点, 对冲请求跳过原请求的节点(只有一个节点时除外)"""
+    policy = None
+
+    def select(self, connections):
+        excluded = self.policy.excluded
+        if excluded:
+            connections = [c for c in connections if c.host not in excluded] or connections
+        return min(connections, key=lambda connection: self.policy.score(connection.host))
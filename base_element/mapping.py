@@ -0,0 +1,121 @@
+"""
+根据文档类的字段声明生成索引的mapping和settings, 不依赖动态映射(动态映射会把每个字符串映射为text+keyword)
+    class Document(Doc):
+        __shards__ = 3
+        __replicas__ = 1
+        __field_options__ = {
+            'code': {'keyword': True},                  # 只做精确匹配, 不分词
+            'title': {'keyword': 'raw'},                # 分词, 并增加 title.raw 子字段用于精确匹配/排序/聚合
+            'text': {'analyzer': 'ik_max_word'},
+            'raw': {'index': False, 'doc_values': False},   # 只保存, 不检索不聚合
+            'tags': {'type': 'keyword'},                # List字段的元素类型, 默认keyword
+        }
+默认类型: String=>text, Integer=>long, Float=>double, Boolean=>boolean, Datetime=>date, List=>keyword
+"""
+import re
+
+from .exceptions import ParamsError
+
+FIELD_TYPES = {
+    'String': 'text',
+    'Integer': 'long',
+    'Float': 'double',
+    'Boolean': 'boolean',
+    'Datetime': 'date',
+    'List': 'keyword',
+}
+DEFAULT_DATE_FORMAT = 'strict_date_optional_time||epoch_millis'
+STRFTIME = {
+    '%Y': 'yyyy', '%m': 'MM', '%d': 'dd', '%H': 'HH', '%M': 'mm', '%S': 'ss', '%f': 'SSSSSS', '%y': 'yy',
+    '%j': 'DDD', '%%': "'%'",
+}
+OPTIONS = ('type', 'keyword', 'index', 'doc_values', 'analyzer', 'search_analyzer', 'format', 'store',
+           'ignore_above', 'null_value', 'norms', 'index_options', 'fields', 'copy_to', 'boost')
+
+
+def date_format(fmt):
+    """
+    :param fmt: __datetime_formats__中的格式, None / epoch_millis / epoch_second / strftime格式
+    :return: mapping中date字段的format
+    """
+    if fmt is None:
+        return DEFAULT_DATE_FORMAT
+    if fmt in ('epoch_millis', 'epoch_second'):
+        return fmt
+    parts = re.split(r'(%.)', fmt)
+    result = []
+    for part in parts:
+        if not part:
+            continue
+        if part.startswith('%'):
+            if part not in STRFTIME:
+                raise ParamsError('无法转换的日期格式%s, 请在__field_options__中指定format。'
+                                  'Can not convert %s to elasticsearch date format, '
+                                  'declare it in __field_options__' % (part, part))
+            result.append(STRFTIME[part])
+        elif re.search(r'[A-Za-z]', part):
+            result.append("'%s'" % part.replace("'", "''"))
+        else:
+            result.append(part)
+    return ''.join(result)
+
+
+def field_mapping(ele_type, options, fmt=None):
+    """
+    :param ele_type: String / Integer / Float / Boolean / Datetime / List
+    :param options: __field_options__中该字段的选项
+    :param fmt: Datetime字段的格式
+    :return: dict
+    """
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+        raise ParamsError('unknown field options: %s, choices is %s' % (
+            ', '.join(sorted(unknown)), ', '.join(OPTIONS)))
+    options = dict(options)
+    keyword = options.pop('keyword', None)
+    mapping = {'type': options.pop('type', FIELD_TYPES[ele_type])}
+    if keyword is True:
+        mapping['type'] = 'keyword'
+    elif keyword:
+        mapping.setdefault('fields', {})[keyword] = {'type': 'keyword', 'ignore_above': 256}
+    if mapping['type'] == 'date' and 'format' not in options:
+        mapping['format'] = date_format(fmt)
+    mapping.update(options)
+    return mapping
+
+
+def build_mapping(doc_cls):
+    """
+    :param doc_cls: 文档类
+    :return: {'properties': {field: {...}}}
+    """
+    schema = doc_cls.__schema__
+    options = getattr(doc_cls, '__field_options__', None) or {}
+    undeclared = set(options) - set(schema.fields)
+    if undeclared:
+        raise ParamsError('__field_options__ has no field named %s, choices is %s' % (
+            ', '.join(sorted(undeclared)), ', '.join(schema.fields)))
+    formats = getattr(doc_cls, '__datetime_formats__', None) or {}
+    properties = {}
+    for name in schema.fields:
+        properties[name] = field_mapping(schema.field_types[name].__name__, options.get(name, {}), formats.get(name))
+    return {'properties': properties}
+
+
+def build_index_body(doc_cls):
+    """
+    创建索引的请求体, 包含settings和该文档类型的mappings
+    :param doc_cls: 文档类
+    :return: {'settings': {...}, 'mappings': {type: {...}}}
+    """
+    settings = {}
+    shards = getattr(doc_cls, '__shards__', None)
+    replicas = getattr(doc_cls, '__replicas__', None)
+    if shards is not None:
+        settings['number_of_shards'] = shards
+    if replicas is not None:
+        settings['number_of_replicas'] = replicas
+    body = {'mappings': {doc_cls.__schema__.types: build_mapping(doc_cls)}}
+    if settings:
+        body['settings'] = {'index': settings}
+    return body
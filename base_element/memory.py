@@ -0,0 +1,871 @@
+"""
+进程内的检索后端, 接口与elasticsearch客户端一致, 用于单元测试/本地开发, 不需要elasticsearch服务
+    Config.set_backend('memory')
+    Config.get_es().clear()         # 清空所有数据
+
+文档按索引保存, 字符串和列表字段建立倒排索引(按标准分词: 英文/数字按单词, 中文按字),
+数值和日期字段建立有序索引, 支持SelectBody生成的检索语句:
+    bool(must/filter/should/must_not/minimum_should_match), term, terms, match, match_phrase,
+    range, exists, ids, match_all, sort, from/size, _source, slice(按_id的哈希分片)
+以及 get/mget/index/create/update/delete/bulk/count/msearch/scroll/explain/update_by_query/delete_by_query
+写入后立即可以检索(相当于每次写入都refresh), 不支持聚合/检索模板/脚本(除了 ctx._source.f = params.p 的赋值)
+各方法的参数与elasticsearch-py 5.5的客户端一致(同样的query_params白名单), 客户端不接受的参数同样抛出TypeError,
+url参数与发送给服务器时一样转为字符串
+"""
+import bisect
+import fnmatch
+import itertools
+import json
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+from elasticsearch.client.utils import query_params
+from elasticsearch.exceptions import ConflictError, NotFoundError, RequestError
+
+TOKEN_RE = re.compile(r'[㐀-鿿豈-﫿]|[^\W_]+', re.UNICODE)
+ASSIGN_RE = re.compile(r'^\s*ctx\._source\.(\w+)\s*=\s*params\.(\w+)\s*$')
+POSITION_GAP = 100
+TIME_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+KEEP_ALIVE_RE = re.compile(r'^(\d+)(ms|s|m|h|d)$')
+
+
+def analyze(text):
+    """标准分词, 小写"""
+    return [token.lower() for token in TOKEN_RE.findall(text)]
+
+
+def keep_alive_seconds(value):
+    """
+    :param value: 1m / 30s / 500ms
+    :return: 秒
+    """
+    matched = KEEP_ALIVE_RE.match(str(value).strip())
+    if not matched:
+        raise RequestError(400, 'parse_exception', 'failed to parse keep alive [%s]' % value)
+    return int(matched.group(1)) * TIME_UNITS[matched.group(2)]
+
+
+def in_slice(doc_id, slice_):
+    """按_id的稳定哈希分片, 与服务器一样每个文档只属于一个slice"""
+    return zlib.crc32(doc_id.encode('utf-8')) % int(slice_['max']) == int(slice_['id'])
+
+
+def _key(value):
+    # True == 1, 所以布尔值需要单独区分
+    return ('bool', value) if isinstance(value, bool) else value
+
+
+def _decode(params):
+    """query_params把url参数转为str/bytes(与发送给服务器时一致), 这里统一为str"""
+    return dict((k, v.decode('utf-8') if isinstance(v, bytes) else v) for k, v in (params or {}).items())
+
+
+def _source_filter(source, fields):
+    if fields is None or fields is True or fields == 'true':
+        return source
+    if fields is False or fields == 'false':
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(',')
+    return dict((k, v) for k, v in source.items() if any(fnmatch.fnmatch(k, f) for f in fields))
+
+
+class _Index(object):
+    """一个索引的文档和索引结构"""
+
+    def __init__(self, name):
+        self.name = name
+        self.docs = OrderedDict()       # id => (type, source)
+        self.versions = {}
+        self.postings = {}              # field => token => {id: [position, ...]}
+        self.keywords = {}              # field => value => set(id)
+        self.terms = {}                 # id => [(field, token/value, is_token), ...], 删除时使用
+        self.settings = {}              # index.* 设置, 只保存, 不影响检索
+        self._sorted = {}               # field => (values, ids), 写入后重新生成
+        self._auto_id = itertools.count(1)
+
+    def put(self, doc_id, doc_type, source):
+        if doc_id in self.docs:
+            self.remove(doc_id)
+        self.docs[doc_id] = (doc_type, source)
+        self.versions[doc_id] = self.versions.get(doc_id, 0) + 1
+        terms = self.terms[doc_id] = []
+        for field, value in source.items():
+            values = value if isinstance(value, list) else [value]
+            position = 0
+            for v in values:
+                if v is None or isinstance(v, dict):
+                    continue
+                self.keywords.setdefault(field, {}).setdefault(_key(v), set()).add(doc_id)
+                terms.append((field, _key(v), False))
+                if isinstance(v, str):
+                    postings = self.postings.setdefault(field, {})
+                    for token in analyze(v):
+                        postings.setdefault(token, {}).setdefault(doc_id, []).append(position)
+                        terms.append((field, token, True))
+                        position += 1
+                    position += POSITION_GAP
+        self._sorted = {}
+        return self.versions[doc_id]
+
+    def remove(self, doc_id):
+        for field, term, is_token in self.terms.pop(doc_id, ()):
+            if is_token:
+                self.postings[field].get(term, {}).pop(doc_id, None)
+            else:
+                self.keywords[field].get(term, set()).discard(doc_id)
+        self.docs.pop(doc_id, None)
+        self._sorted = {}
+
+    def new_id(self):
+        while True:
+            doc_id = 'mem%d' % next(self._auto_id)
+            if doc_id not in self.docs:
+                return doc_id
+
+    def sorted_values(self, field, kind):
+        """
+        有序索引, 数值和字符串(日期)分开保存
+        :return: (values, ids)
+        """
+        key = (field, kind)
+        result = self._sorted.get(key)
+        if result is None:
+            pairs = []
+            for value, ids in self.keywords.get(field, {}).items():
+                if isinstance(value, tuple):
+                    continue
+                if (kind == 'str') == isinstance(value, str):
+                    pairs.extend((value, doc_id) for doc_id in ids)
+            pairs.sort(key=lambda pair: pair[0])
+            result = self._sorted[key] = ([p[0] for p in pairs], [p[1] for p in pairs])
+        return result
+
+
+class _Tasks(object):
+    """wait_for_completion=False 时同步执行, 任务立即完成"""
+
+    def __init__(self):
+        self.results = {}
+        self._ids = itertools.count(1)
+
+    def add(self, response):
+        task_id = 'memory:%d' % next(self._ids)
+        self.results[task_id] = response
+        return task_id
+
+    @query_params('wait_for_completion')
+    def get(self, task_id=None, params=None):
+        if task_id not in self.results:
+            raise NotFoundError(404, 'resource_not_found_exception', {'task': task_id})
+        response = self.results[task_id]
+        status = dict((k, v) for k, v in response.items() if isinstance(v, int))
+        return {'completed': True, 'task': {'id': task_id, 'status': status}, 'response': response}
+
+    @query_params('actions', 'nodes', 'parent_task_id')
+    def cancel(self, task_id=None, params=None):
+        return {'nodes': {}}
+
+
+class _Indices(object):
+
+    def __init__(self, client):
+        self._client = client
+
+    @query_params('master_timeout', 'timeout', 'update_all_types', 'wait_for_active_shards')
+    def create(self, index, body=None, params=None):
+        if index in self._client.store:
+            raise RequestError(400, 'index_already_exists_exception', {'index': index})
+        idx = self._client.store[index] = _Index(index)
+        settings = self._client._load(body).get('settings', {})
+        idx.settings.update((k, str(v)) for k, v in settings.get('index', settings).items())
+        return {'acknowledged': True, 'index': index}
+
+    @query_params('master_timeout', 'timeout')
+    def delete(self, index, params=None):
+        names = self._client.resolve(index)
+        if not names:
+            raise NotFoundError(404, 'index_not_found_exception', {'index': index})
+        for name in names:
+            self._client.store.pop(name, None)
+        return {'acknowledged': True}
+
+    @query_params('allow_no_indices', 'expand_wildcards', 'ignore_unavailable', 'local')
+    def exists(self, index, params=None):
+        return bool(self._client.resolve(index))
+
+    @query_params('allow_no_indices', 'expand_wildcards', 'flat_settings', 'human', 'ignore_unavailable',
+                  'include_defaults', 'local')
+    def get_settings(self, index=None, name=None, params=None):
+        result = {}
+        for idx in (self._client.store[n] for n in self._client.resolve(index)):
+            settings = dict((k, v) for k, v in idx.settings.items()
+                            if name is None or fnmatch.fnmatch('index.' + k, name))
+            result[idx.name] = {'settings': {'index': settings}}
+        return result
+
+    @query_params('allow_no_indices', 'expand_wildcards', 'flat_settings', 'ignore_unavailable', 'master_timeout',
+                  'preserve_existing')
+    def put_settings(self, body, index=None, params=None):
+        settings = self._client._load(body)
+        for idx in (self._client.store[n] for n in self._client.resolve(index)):
+            for k, v in settings.get('index', settings).items():
+                if v is None:
+                    idx.settings.pop(k, None)
+                else:
+                    idx.settings[k] = str(v)
+        return {'acknowledged': True}
+
+    @query_params('allow_no_indices', 'expand_wildcards', 'force', 'ignore_unavailable', 'operation_threading')
+    def refresh(self, index=None, params=None):
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+    @query_params('allow_no_indices', 'expand_wildcards', 'flush', 'ignore_unavailable', 'max_num_segments',
+                  'only_expunge_deletes', 'operation_threading', 'wait_for_merge')
+    def forcemerge(self, index=None, params=None):
+        return {'_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+
+class MemoryElasticsearch(object):
+    """
+    接口与elasticsearch.Elasticsearch一致的进程内后端, 参数中的请求体可以是dict/str/bytes
+    """
+
+    def __init__(self, serializer=None):
+        """
+        :param serializer: 请求体/文档的编解码器, 与Config的编解码器一致
+        """
+        self.serializer = serializer
+        self.transport = self           # helpers.parallel_bulk 使用 client.transport.serializer
+        self.store = {}
+        self.indices = _Indices(self)
+        self.tasks = _Tasks()
+        self._scrolls = {}
+        self._scroll_ids = itertools.count(1)
+        self._lock = threading.RLock()
+
+    def clear(self):
+        """清空所有索引"""
+        with self._lock:
+            self.store.clear()
+            self._scrolls.clear()
+
+    # 工具方法
+    def _load(self, body):
+        if body is None:
+            return {}
+        if not isinstance(body, (str, bytes)):
+            # 与服务器一致, 文档中的datetime等类型按编解码器转换
+            body = self.serializer.dumps(body) if self.serializer else json.dumps(body)
+        # 请求体不是响应, 不计入解析耗时
+        return self.serializer._loads(body) if self.serializer else json.loads(body)
+
+    def resolve(self, index):
+        if index in (None, '', '_all', '*'):
+            return list(self.store)
+        names = []
+        for pattern in (index if isinstance(index, (list, tuple)) else str(index).split(',')):
+            names.extend(name for name in self.store if fnmatch.fnmatch(name, pattern) and name not in names)
+        return names
+
+    def _index(self, index, create=True):
+        idx = self.store.get(index)
+        if idx is None:
+            if not create:
+                raise NotFoundError(404, 'index_not_found_exception', {'index': index})
+            idx = self.store[index] = _Index(index)
+        return idx
+
+    @staticmethod
+    def _meta(index, doc_type, doc_id, version, result):
+        return {'_index': index, '_type': doc_type, '_id': doc_id, '_version': version, 'result': result,
+                '_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+    # 文档接口
+    @query_params('op_type', 'parent', 'pipeline', 'refresh', 'routing', 'timeout', 'timestamp', 'ttl', 'version',
+                  'version_type', 'wait_for_active_shards')
+    def index(self, index, doc_type, body, id=None, params=None):
+        with self._lock:
+            idx = self._index(index)
+            doc_id = str(id) if id not in (None, '') else idx.new_id()
+            created = doc_id not in idx.docs
+            version = idx.put(doc_id, doc_type, self._load(body))
+            result = self._meta(index, doc_type, doc_id, version, 'created' if created else 'updated')
+            result['created'] = created
+            return result
+
+    @query_params('parent', 'pipeline', 'refresh', 'routing', 'timeout', 'timestamp', 'ttl', 'version',
+                  'version_type', 'wait_for_active_shards')
+    def create(self, index, doc_type, id, body, params=None):
+        with self._lock:
+            idx = self._index(index)
+            if str(id) in idx.docs:
+                raise ConflictError(409, 'version_conflict_engine_exception',
+                                    {'_index': index, '_id': str(id), 'reason': 'document already exists'})
+            return self.index(index, doc_type, body=body, id=id)
+
+    @query_params('_source', '_source_exclude', '_source_include', 'fields', 'lang', 'parent', 'refresh',
+                  'retry_on_conflict', 'routing', 'timeout', 'timestamp', 'ttl', 'version', 'version_type',
+                  'wait_for_active_shards')
+    def update(self, index, doc_type, id, body=None, params=None):
+        with self._lock:
+            idx = self._index(index)
+            doc_id = str(id)
+            body = self._load(body)
+            if doc_id not in idx.docs:
+                if 'upsert' in body:
+                    return self.index(index, doc_type, body=body['upsert'], id=doc_id)
+                raise NotFoundError(404, 'document_missing_exception', {'_index': index, '_id': doc_id})
+            stored_type, source = idx.docs[doc_id]
+            source = dict(source)
+            source.update(body.get('doc', {}))
+            if 'script' in body:
+                self._run_script(body['script'], source)
+            version = idx.put(doc_id, stored_type, source)
+            return self._meta(index, stored_type, doc_id, version, 'updated')
+
+    @query_params('parent', 'refresh', 'routing', 'timeout', 'version', 'version_type', 'wait_for_active_shards')
+    def delete(self, index, doc_type, id, params=None):
+        with self._lock:
+            idx = self._index(index)
+            doc_id = str(id)
+            if doc_id not in idx.docs:
+                raise NotFoundError(404, 'not_found', self._meta(index, doc_type, doc_id, 1, 'not_found'))
+            stored_type = idx.docs[doc_id][0]
+            version = idx.versions[doc_id] + 1
+            idx.remove(doc_id)
+            idx.versions[doc_id] = version
+            result = self._meta(index, stored_type, doc_id, version, 'deleted')
+            result['found'] = True
+            return result
+
+    def _get_doc(self, index, doc_type, doc_id, _source=None):
+        doc_id = str(doc_id)
+        for name in self.resolve(index):
+            idx = self.store[name]
+            found = idx.docs.get(doc_id)
+            if found is not None and (doc_type in (None, '_all') or found[0] == doc_type):
+                result = {'_index': name, '_type': found[0], '_id': doc_id, '_version': idx.versions[doc_id],
+                          'found': True}
+                source = _source_filter(found[1], _source)
+                if source is not None:
+                    result['_source'] = source
+                return result
+        return {'_index': index, '_type': doc_type, '_id': doc_id, 'found': False}
+
+    @query_params('_source', '_source_exclude', '_source_include', 'parent', 'preference', 'realtime', 'refresh',
+                  'routing', 'stored_fields', 'version', 'version_type')
+    def get(self, index, id, doc_type='_all', params=None):
+        _source = _decode(params).get('_source')
+        with self._lock:
+            result = self._get_doc(index, doc_type, id, _source)
+        if not result['found']:
+            raise NotFoundError(404, json.dumps(result), result)
+        return result
+
+    @query_params('_source', '_source_exclude', '_source_include', 'preference', 'realtime', 'refresh',
+                  'stored_fields')
+    def mget(self, body, index=None, doc_type=None, params=None):
+        _source = _decode(params).get('_source')
+        body = self._load(body)
+        with self._lock:
+            if 'ids' in body:
+                return {'docs': [self._get_doc(index, doc_type, doc_id, _source) for doc_id in body['ids']]}
+            return {'docs': [self._get_doc(d.get('_index', index), d.get('_type', doc_type), d['_id'],
+                                           d.get('_source', _source)) for d in body.get('docs', [])]}
+
+    @query_params('_source', '_source_exclude', '_source_include', 'fields', 'pipeline', 'refresh', 'routing',
+                  'timeout', 'wait_for_active_shards')
+    def bulk(self, body, index=None, doc_type=None, params=None):
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        lines = body.splitlines() if isinstance(body, str) else list(body)
+        lines = [line for line in lines if line not in ('', b'')]
+        items, errors, i = [], False, 0
+        while i < len(lines):
+            action = self._load(lines[i])
+            op, meta = next(iter(action.items()))
+            i += 1
+            source = None
+            if op != 'delete':
+                source = lines[i]
+                i += 1
+            name, t, doc_id = meta.get('_index', index), meta.get('_type', doc_type), meta.get('_id')
+            try:
+                if op == 'index':
+                    result, status = self.index(name, t, body=source, id=doc_id), 201
+                elif op == 'create':
+                    result, status = self.create(name, t, id=doc_id, body=source), 201
+                elif op == 'update':
+                    result, status = self.update(name, t, id=doc_id, body=source), 200
+                else:
+                    result, status = self.delete(name, t, id=doc_id), 200
+                if op == 'index' and not result.get('created'):
+                    status = 200
+                result['status'] = status
+            except (ConflictError, NotFoundError) as e:
+                errors = True
+                result = {'_index': name, '_type': t, '_id': doc_id, 'status': e.status_code,
+                          'error': {'type': e.error, 'reason': str(e.info)}}
+            items.append({op: result})
+        return {'took': 0, 'errors': errors, 'items': items}
+
+    # 检索接口
+    def _match_ids(self, idx, doc_type, query):
+        """
+        :return: {id: score}
+        """
+        scores = self._eval(idx, query or {'match_all': {}})
+        if doc_type not in (None, '', '_all'):
+            types = doc_type.split(',') if isinstance(doc_type, str) else doc_type
+            scores = dict((k, v) for k, v in scores.items() if idx.docs[k][0] in types)
+        return scores
+
+    def _all(self, idx):
+        return dict.fromkeys(idx.docs, 1.0)
+
+    def _eval(self, idx, query):
+        if not query:
+            return self._all(idx)
+        name, value = next(iter(query.items()))
+        method = getattr(self, '_q_' + name, None)
+        if method is None:
+            raise RequestError(400, 'parsing_exception', 'memory backend does not support query [%s]' % name)
+        return method(idx, value)
+
+    def _q_match_all(self, idx, value):
+        return self._all(idx)
+
+    def _q_bool(self, idx, value):
+        def listed(clauses):
+            if clauses is None:
+                return []
+            return clauses if isinstance(clauses, list) else [clauses]
+
+        result = None
+        for clause in listed(value.get('must')):
+            scores = self._eval(idx, clause)
+            result = scores if result is None else dict(
+                (k, result[k] + scores[k]) for k in result if k in scores)
+        for clause in listed(value.get('filter')):
+            ids = self._eval(idx, clause)
+            result = dict.fromkeys(ids, 0.0) if result is None else dict(
+                (k, v) for k, v in result.items() if k in ids)
+        should = listed(value.get('should'))
+        if should:
+            matched = {}
+            hits = {}
+            for clause in should:
+                for k, score in self._eval(idx, clause).items():
+                    matched[k] = matched.get(k, 0.0) + score
+                    hits[k] = hits.get(k, 0) + 1
+            required = value.get('minimum_should_match')
+            if required is None:
+                required = 0 if result is not None else 1
+            required = self._minimum(required, len(should))
+            if result is None:
+                result = self._all(idx) if required == 0 else {}
+                result = dict((k, 0.0) for k in result)
+                result.update((k, v) for k, v in matched.items() if hits[k] >= required)
+                if required:
+                    result = dict((k, v) for k, v in result.items() if hits.get(k, 0) >= required)
+            else:
+                result = dict((k, v + matched.get(k, 0.0)) for k, v in result.items()
+                              if hits.get(k, 0) >= required)
+        if result is None:
+            result = self._all(idx)
+        for clause in listed(value.get('must_not')):
+            excluded = self._eval(idx, clause)
+            result = dict((k, v) for k, v in result.items() if k not in excluded)
+        return result
+
+    @staticmethod
+    def _minimum(required, total):
+        if isinstance(required, str):
+            if required.endswith('%'):
+                number = int(required[:-1])
+                count = int(total * abs(number) / 100.0)
+                return count if number >= 0 else total - count
+            required = int(required)
+        return total + required if required < 0 else required
+
+    @staticmethod
+    def _field_value(value):
+        if isinstance(value, dict):
+            return value.get('value', value.get('query'))
+        return value
+
+    def _term_ids(self, idx, field, value):
+        ids = set(idx.keywords.get(field, {}).get(_key(value), ()))
+        if isinstance(value, str):
+            ids.update(idx.postings.get(field, {}).get(value, ()))
+        return ids
+
+    def _q_term(self, idx, value):
+        field, v = next(iter(value.items()))
+        return dict.fromkeys(self._term_ids(idx, field, self._field_value(v)), 1.0)
+
+    def _q_terms(self, idx, value):
+        field, values = next(iter(value.items()))
+        ids = set()
+        for v in values:
+            ids.update(self._term_ids(idx, field, v))
+        return dict.fromkeys(ids, 1.0)
+
+    def _q_ids(self, idx, value):
+        return dict.fromkeys((str(v) for v in value.get('values', []) if str(v) in idx.docs), 1.0)
+
+    def _q_exists(self, idx, value):
+        field = value['field']
+        return dict.fromkeys((k for k, (t, source) in idx.docs.items() if source.get(field) not in (None, [])), 1.0)
+
+    def _fields(self, idx, field):
+        if field in ('_all', '*'):
+            return list(set(idx.postings) | set(idx.keywords))
+        return [field]
+
+    def _q_match(self, idx, value):
+        field, v = next(iter(value.items()))
+        options = v if isinstance(v, dict) else {'query': v}
+        query = options.get('query')
+        scores = {}
+        for f in self._fields(idx, field):
+            if not isinstance(query, str) or f not in idx.postings:
+                for k in self._term_ids(idx, f, query):
+                    scores[k] = scores.get(k, 0.0) + 1.0
+                continue
+            tokens = analyze(query)
+            if not tokens:
+                continue
+            counts = {}
+            for token in set(tokens):
+                for k, positions in idx.postings[f].get(token, {}).items():
+                    counts[k] = counts.get(k, 0) + 1
+                    scores[k] = scores.get(k, 0.0) + len(positions)
+            if options.get('operator', 'or').lower() == 'and':
+                required = len(set(tokens))
+            else:
+                required = max(self._minimum(options.get('minimum_should_match', 1), len(set(tokens))), 1)
+            for k in list(scores):
+                if counts.get(k, 0) < required and k in counts:
+                    scores.pop(k)
+        return scores
+
+    def _q_match_phrase(self, idx, value):
+        field, v = next(iter(value.items()))
+        query = self._field_value(v)
+        scores = {}
+        for f in self._fields(idx, field):
+            if not isinstance(query, str) or f not in idx.postings:
+                for k in self._term_ids(idx, f, query):
+                    scores[k] = scores.get(k, 0.0) + 1.0
+                continue
+            tokens = analyze(query)
+            if not tokens:
+                continue
+            postings = [idx.postings[f].get(token, {}) for token in tokens]
+            candidates = set(postings[0]).intersection(*postings[1:])
+            for k in candidates:
+                starts = set(postings[0][k])
+                for offset, posting in enumerate(postings[1:], 1):
+                    starts &= set(p - offset for p in posting[k])
+                if starts:
+                    scores[k] = scores.get(k, 0.0) + len(starts) * len(tokens)
+        return scores
+
+    def _q_range(self, idx, value):
+        field, ops = next(iter(value.items()))
+        ops = dict(ops)
+        for old, new in (('from', 'gte'), ('to', 'lte')):
+            if old in ops:
+                ops[new if ops.pop('include_%s' % ('lower' if old == 'from' else 'upper'), True) else new[:2]] = \
+                    ops.pop(old)
+        bounds = [v for k, v in ops.items() if k in ('gt', 'gte', 'lt', 'lte') and v is not None]
+        kind = 'str' if bounds and isinstance(bounds[0], str) else 'num'
+        values, ids = idx.sorted_values(field, kind)
+        lo, hi = 0, len(values)
+        if ops.get('gte') is not None:
+            lo = max(lo, bisect.bisect_left(values, ops['gte']))
+        if ops.get('gt') is not None:
+            lo = max(lo, bisect.bisect_right(values, ops['gt']))
+        if ops.get('lte') is not None:
+            hi = min(hi, bisect.bisect_right(values, ops['lte']))
+        if ops.get('lt') is not None:
+            hi = min(hi, bisect.bisect_left(values, ops['lt']))
+        return dict.fromkeys(ids[lo:hi], 1.0)
+
+    @staticmethod
+    def _sort(hits, sort):
+        """按sort排序, 多个排序字段从后往前依次稳定排序"""
+        if isinstance(sort, str):
+            sort = [s for s in sort.split(',') if s]
+        for spec in reversed(sort or []):
+            if isinstance(spec, dict):
+                field, order = next(iter(spec.items()))
+                order = order.get('order', 'asc') if isinstance(order, dict) else order
+            elif ':' in spec:
+                field, order = spec.split(':', 1)
+            else:
+                field, order = spec, 'desc' if spec == '_score' else 'asc'
+            if field == '_doc':
+                continue
+            reverse = order == 'desc'
+            if field == '_score':
+                hits.sort(key=lambda hit: hit['_score'], reverse=reverse)
+                continue
+
+            def value(hit):
+                v = hit['_source'].get(field)
+                if isinstance(v, list):
+                    v = (min if not reverse else max)(v) if v else None
+                return v
+
+            present = [hit for hit in hits if value(hit) is not None]
+            missing = [hit for hit in hits if value(hit) is None]
+            present.sort(key=value, reverse=reverse)
+            hits[:] = present + missing
+        return hits
+
+    def _search(self, index, doc_type, body, params):
+        body = self._load(body)
+        with self._lock:
+            if body.get('aggs') or body.get('aggregations'):
+                raise RequestError(400, 'parsing_exception', 'memory backend does not support aggregations')
+            slice_ = body.get('slice')
+            if slice_ is not None and not 0 <= int(slice_.get('id', -1)) < int(slice_.get('max', 0)):
+                raise RequestError(400, 'illegal_argument_exception', 'invalid slice %s' % (slice_, ))
+            hits = []
+            for name in self.resolve(index):
+                idx = self.store[name]
+                for doc_id, score in self._match_ids(idx, doc_type, body.get('query')).items():
+                    if slice_ is not None and not in_slice(doc_id, slice_):
+                        continue
+                    t, source = idx.docs[doc_id]
+                    hits.append({'_index': name, '_type': t, '_id': doc_id, '_score': score, '_source': source})
+        sort = params.get('sort') or body.get('sort')
+        if sort:
+            self._sort(hits, sort)
+        else:
+            hits.sort(key=lambda hit: hit['_score'], reverse=True)
+        terminate_after = params.get('terminate_after', body.get('terminate_after'))
+        if terminate_after:
+            hits = hits[:int(terminate_after)]
+        return body, hits
+
+    @staticmethod
+    def _page(hits, start, size, source):
+        page = []
+        for hit in hits[start:start + size]:
+            hit = dict(hit)
+            filtered = _source_filter(hit['_source'], source)
+            if filtered is None:
+                hit.pop('_source')
+            else:
+                hit['_source'] = filtered
+            page.append(hit)
+        return page
+
+    @query_params('_source', '_source_exclude', '_source_include', 'allow_no_indices', 'analyze_wildcard',
+                  'analyzer', 'batched_reduce_size', 'default_operator', 'df', 'docvalue_fields', 'expand_wildcards',
+                  'explain', 'fielddata_fields', 'from_', 'ignore_unavailable', 'lenient',
+                  'lowercase_expanded_terms', 'pre_filter_shard_size', 'preference', 'q', 'request_cache', 'routing',
+                  'scroll', 'search_type', 'size', 'sort', 'stats', 'stored_fields', 'suggest_field',
+                  'suggest_mode', 'suggest_size', 'suggest_text', 'terminate_after', 'timeout', 'track_scores',
+                  'typed_keys', 'version')
+    def search(self, index=None, doc_type=None, body=None, params=None):
+        started = time.time()
+        params = _decode(params)
+        if 'from_' in params:
+            params['from'] = params.pop('from_')
+        body, hits = self._search(index, doc_type, body, params)
+        start = int(params.get('from', body.get('from', 0)) or 0)
+        size = int(params.get('size', body.get('size', 10)))
+        source = params.get('_source', body.get('_source'))
+        result = {
+            'took': int((time.time() - started) * 1000), 'timed_out': False,
+            '_shards': {'total': 1, 'successful': 1, 'failed': 0},
+            'hits': {'total': len(hits), 'max_score': max([h['_score'] for h in hits] or [None], key=lambda s: s or 0),
+                     'hits': self._page(hits, start, size, source)},
+        }
+        if params.get('terminate_after') or body.get('terminate_after'):
+            result['terminated_early'] = True
+        if params.get('scroll'):
+            scroll_id = 'scroll%d' % next(self._scroll_ids)
+            expires = time.monotonic() + keep_alive_seconds(params['scroll'])
+            with self._lock:
+                self._expire_scrolls()
+                self._scrolls[scroll_id] = (hits, start + size, size, source, expires)
+            result['_scroll_id'] = scroll_id
+        return result
+
+    def _expire_scrolls(self):
+        """与服务器一致, 超过keep alive没有使用的游标被释放"""
+        now = time.monotonic()
+        for sid in [sid for sid, context in self._scrolls.items() if context[-1] <= now]:
+            self._scrolls.pop(sid)
+
+    @query_params('scroll')
+    def scroll(self, scroll_id=None, body=None, params=None):
+        scroll = _decode(params).get('scroll')
+        if body:
+            body = self._load(body)
+            scroll_id, scroll = body.get('scroll_id', scroll_id), body.get('scroll', scroll)
+        with self._lock:
+            self._expire_scrolls()
+            if scroll_id not in self._scrolls:
+                raise NotFoundError(404, 'search_context_missing_exception', {'scroll_id': scroll_id})
+            hits, start, size, source, expires = self._scrolls[scroll_id]
+            # 每次使用时按新的keep alive延长
+            if scroll:
+                expires = time.monotonic() + keep_alive_seconds(scroll)
+            self._scrolls[scroll_id] = (hits, start + size, size, source, expires)
+        return {'_scroll_id': scroll_id, 'took': 0, 'timed_out': False,
+                'hits': {'total': len(hits), 'hits': self._page(hits, start, size, source)}}
+
+    @query_params()
+    def clear_scroll(self, scroll_id=None, body=None, params=None):
+        if body:
+            scroll_id = self._load(body).get('scroll_id', scroll_id)
+        with self._lock:
+            for sid in (scroll_id if isinstance(scroll_id, (list, tuple)) else [scroll_id]):
+                self._scrolls.pop(sid, None)
+            self._expire_scrolls()
+        return {'succeeded': True}
+
+    @query_params('_source', '_source_exclude', '_source_include', 'analyze_wildcard', 'analyzer',
+                  'default_operator', 'df', 'lenient', 'lowercase_expanded_terms', 'parent', 'preference', 'q',
+                  'routing', 'stored_fields')
+    def explain(self, index, doc_type, id, body=None, params=None):
+        body = self._load(body)
+        with self._lock:
+            idx = self._index(index, create=False)
+            doc_id = str(id)
+            if doc_id not in idx.docs:
+                raise NotFoundError(404, 'not_found', {'_index': index, '_id': doc_id})
+            scores = self._match_ids(idx, doc_type, body.get('query'))
+        matched = doc_id in scores
+        explanation = {'value': scores.get(doc_id, 0.0), 'details': [],
+                       'description': 'memory backend, number of matched terms' if matched else 'no matching clause'}
+        return {'_index': index, '_type': idx.docs[doc_id][0], '_id': doc_id, 'matched': matched,
+                'explanation': explanation}
+
+    @query_params('allow_no_indices', 'analyze_wildcard', 'analyzer', 'default_operator', 'df', 'expand_wildcards',
+                  'ignore_unavailable', 'lenient', 'lowercase_expanded_terms', 'min_score', 'preference', 'q',
+                  'routing')
+    def count(self, index=None, doc_type=None, body=None, params=None):
+        body, hits = self._search(index, doc_type, body, _decode(params))
+        return {'count': len(hits), '_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+
+    @query_params('max_concurrent_searches', 'search_type', 'typed_keys')
+    def msearch(self, body, index=None, doc_type=None, params=None):
+        if isinstance(body, (str, bytes)):
+            body = [self._load(line) for line in (body.decode('utf-8') if isinstance(body, bytes)
+                                                  else body).splitlines() if line.strip()]
+        responses = []
+        for header, search in zip(body[::2], body[1::2]):
+            try:
+                responses.append(self.search(header.get('index', index), header.get('type', doc_type), search))
+            except RequestError as e:
+                responses.append({'error': {'type': e.error, 'reason': str(e.info)}, 'status': e.status_code})
+        return {'responses': responses}
+
+    def _run_script(self, script, source):
+        if isinstance(script, str):
+            script = {'source': script}
+        code = script.get('source', script.get('inline', ''))
+        params = script.get('params', {})
+        for statement in (s for s in code.split(';') if s.strip()):
+            matched = ASSIGN_RE.match(statement)
+            if not matched:
+                raise RequestError(400, 'script_exception',
+                                   'memory backend only supports ctx._source.field = params.name, got %s' % statement)
+            source[matched.group(1)] = params[matched.group(2)]
+
+    def _by_query(self, index, doc_type, body, params, handle):
+        body = self._load(body)
+        with self._lock:
+            _, hits = self._search(index, doc_type, {'query': body.get('query')}, {})
+            count = 0
+            for hit in hits:
+                handle(hit, body)
+                count += 1
+        return count
+
+    @query_params('_source', '_source_exclude', '_source_include', 'allow_no_indices', 'analyze_wildcard',
+                  'analyzer', 'conflicts', 'default_operator', 'df', 'docvalue_fields', 'expand_wildcards',
+                  'explain', 'fielddata_fields', 'from_', 'ignore_unavailable', 'lenient',
+                  'lowercase_expanded_terms', 'pipeline', 'preference', 'q', 'refresh', 'request_cache',
+                  'requests_per_second', 'routing', 'scroll', 'scroll_size', 'search_timeout', 'search_type', 'size',
+                  'sort', 'stats', 'stored_fields', 'suggest_field', 'suggest_mode', 'suggest_size', 'suggest_text',
+                  'terminate_after', 'timeout', 'track_scores', 'version', 'version_type', 'wait_for_active_shards',
+                  'wait_for_completion')
+    def update_by_query(self, index, doc_type=None, body=None, params=None):
+        params = _decode(params)
+        def handle(hit, body):
+            source = dict(hit['_source'])
+            if body.get('script'):
+                self._run_script(body['script'], source)
+            self.store[hit['_index']].put(hit['_id'], hit['_type'], source)
+
+        count = self._by_query(index, doc_type, body, params, handle)
+        response = {'took': 0, 'timed_out': False, 'total': count, 'updated': count, 'deleted': 0, 'batches': 1,
+                    'version_conflicts': 0, 'noops': 0, 'failures': []}
+        if params.get('wait_for_completion') == 'false':
+            return {'task': self.tasks.add(response)}
+        return response
+
+    @query_params('_source', '_source_exclude', '_source_include', 'allow_no_indices', 'analyze_wildcard',
+                  'analyzer', 'conflicts', 'default_operator', 'df', 'docvalue_fields', 'expand_wildcards',
+                  'explain', 'from_', 'ignore_unavailable', 'lenient', 'lowercase_expanded_terms', 'preference', 'q',
+                  'refresh', 'request_cache', 'requests_per_second', 'routing', 'scroll', 'slices', 'scroll_size',
+                  'search_timeout', 'search_type', 'size', 'sort', 'stats', 'stored_fields', 'suggest_field',
+                  'suggest_mode', 'suggest_size', 'suggest_text', 'terminate_after', 'timeout', 'track_scores',
+                  'version', 'wait_for_active_shards', 'wait_for_completion')
+    def delete_by_query(self, index, body, doc_type=None, params=None):
+        params = _decode(params)
+        count = self._by_query(index, doc_type, body, params,
+                               lambda hit, body: self.store[hit['_index']].remove(hit['_id']))
+        response = {'took': 0, 'timed_out': False, 'total': count, 'deleted': count, 'batches': 1,
+                    'version_conflicts': 0, 'noops': 0, 'failures': []}
+        if params.get('wait_for_completion') == 'false':
+            return {'task': self.tasks.add(response)}
+        return response
+
+    @query_params()
+    def ping(self, params=None):
+        return True
+
+    @query_params()
+    def info(self, params=None):
+        return {'name': 'memory', 'version': {'number': '5.6.0'}, 'tagline': 'You Know, for Search'}
+
+    def close(self):
+        pass
+
+
+class _Coroutines(object):
+    """把对象的方法包装为协程"""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncMemoryElasticsearch(_Coroutines):
+    """MemoryElasticsearch的协程接口, 供AsyncDoc使用, indices/tasks的方法同样需要await"""
+
+    def __init__(self, client):
+        super(AsyncMemoryElasticsearch, self).__init__(client)
+        self.indices = _Coroutines(client.indices)
+        self.tasks = _Coroutines(client.tasks)
@@ -0,0 +1,251 @@
+"""
+检索语句的整理, 在SelectBody生成语句之后执行, 根据文档声明的字段类型生成规范的bool查询:
+    精确值字段(Integer/Float/Boolean/Datetime)使用term/terms, 文本字段(String)使用match_phrase
+    不参与评分的条件(term/terms/range/exists/ids)放入bool.filter, 可以被节点的查询缓存复用
+    filter()的条件由SelectBody放入bool.filter, 其中文本字段的match_phrase同样不评分, bool.must只保留search()/get()的条件
+    同一字段的范围条件合并为一个range, 运算符规范为gt/gte/lt/lte
+    Datetime字段的条件值按 __datetime_formats__ 编码, 与写入的格式一致
+    嵌套的must/should/must_not统一为bool, 展开只有一种条件的嵌套bool, 去除重复的条件
+    should与must/filter同时存在时, 设置minimum_should_match=1(至少满足一个)
+"""
+import json
+
+OCCURS = ('must', 'filter', 'should', 'must_not')
+EXACT_TYPES = ('Integer', 'Float', 'Boolean', 'Datetime')
+TEXT_TYPES = ('String', )
+FILTER_QUERIES = ('term', 'terms', 'range', 'exists', 'ids')
+RANGE_OPS = {'ge': 'gte', 'le': 'lte'}
+LOWER, UPPER = ('gt', 'gte'), ('lt', 'lte')
+
+
+def _key(clause):
+    return json.dumps(clause, sort_keys=True, default=repr)
+
+
+class Planner(object):
+    """
+    Planner(Doc.__schema__.field_types).plan(body)
+    """
+
+    def __init__(self, field_types=None, codecs=None):
+        """
+        :param field_types: 字段名 => 字段类型, 未声明的字段保持原样
+        :param codecs: Datetime字段名 => DatetimeCodec
+        """
+        self.types = dict((name, t.__name__) for name, t in (field_types or {}).items())
+        self.codecs = codecs or {}
+        # Datetime字段上的模板占位符, 参数名 => DatetimeCodec, 执行模板时按字段格式编码参数值
+        self.placeholders = {}
+
+    def plan(self, body):
+        """
+        :param body: SelectBody生成的检索语句
+        :return: 整理后的检索语句, 没有条件时为match_all
+        """
+        body = dict(body)
+        query = self.clause(body.get('query') or {})
+        body['query'] = query or {'match_all': {}}
+        return body
+
+    def clause(self, clause):
+        """
+        规范一个查询条件, 空条件返回None
+        :param clause: dict / list(全部满足)
+        :return: dict
+        """
+        if isinstance(clause, (list, tuple)):
+            return self.bool({'must': list(clause)})
+        if not clause:
+            return None
+        if len(clause) == 1:
+            name, value = next(iter(clause.items()))
+            if name in OCCURS:
+                # treat_values生成的 {'should': [...]} / {'must_not': ...}
+                return self.bool({name: value})
+            if name == 'bool':
+                return self.bool(value)
+            if name in ('term', 'match_phrase'):
+                return self.leaf(name, value)
+            if name == 'terms' and self.codecs:
+                return {'terms': dict((f, self.encode(f, v)) for f, v in value.items())}
+            if name == 'range':
+                return {'range': dict((f, self.encode_ops(f, self.range_ops(ops))) for f, ops in value.items())}
+        return clause
+
+    def encode(self, field, value):
+        """Datetime字段的条件值按字段格式编码"""
+        codec = self.codecs.get(field)
+        if codec is None:
+            return value
+        if isinstance(value, (list, tuple)):
+            return [self.encode(field, v) for v in value]
+        from .template import P
+        if isinstance(value, P):
+            self.placeholders[value.name] = codec
+            return value
+        return codec.encode(value)
+
+    def encode_ops(self, field, ops):
+        if not self.codecs or not isinstance(ops, dict):
+            return ops
+        return dict((op, self.encode(field, v) if op in LOWER + UPPER else v) for op, v in ops.items())
+
+    def leaf(self, name, value):
+        """根据字段类型选择term/match_phrase"""
+        if len(value) != 1:
+            return {name: value}
+        field, v = next(iter(value.items()))
+        t = self.types.get(field)
+        if self.codecs and not isinstance(v, dict):
+            v = self.encode(field, v)
+            value = {field: v}
+        if name == 'match_phrase' and t in EXACT_TYPES and not isinstance(v, dict):
+            return {'term': {field: v}}
+        if name == 'term' and t in TEXT_TYPES and not isinstance(v, dict):
+            return {'match_phrase': {field: v}}
+        return {name: value}
+
+    @staticmethod
+    def range_ops(ops):
+        if not isinstance(ops, dict):
+            return ops
+        return dict((RANGE_OPS.get(op, op), v) for op, v in ops.items())
+
+    @staticmethod
+    def is_filter(clause):
+        """不参与评分的条件"""
+        name, value = next(iter(clause.items()))
+        if name in FILTER_QUERIES:
+            return True
+        if name == 'bool' and 'minimum_should_match' not in value:
+            return all(Planner.is_filter(c) for occur in OCCURS for c in value.get(occur, []))
+        return False
+
+    def flatten(self, clauses):
+        """展开嵌套的列表, 规范每个条件"""
+        if isinstance(clauses, dict):
+            clauses = [clauses]
+        result = []
+        for clause in clauses or []:
+            if isinstance(clause, (list, tuple)) and not any(isinstance(c, (list, tuple)) for c in clause):
+                result.extend(filter(None, (self.clause(c) for c in clause)))
+            elif isinstance(clause, (list, tuple)):
+                result.extend(self.flatten(clause))
+            else:
+                clause = self.clause(clause)
+                if clause:
+                    result.append(clause)
+        return result
+
+    @staticmethod
+    def only(clause, *occurs):
+        """clause为只包含occurs中条件的bool时, 返回bool的内容"""
+        if 'bool' not in clause or len(clause) != 1:
+            return None
+        value = clause['bool']
+        if 'minimum_should_match' in value or not value or any(k not in occurs for k in value):
+            return None
+        return value
+
+    def bool(self, value):
+        occurs = dict((occur, self.flatten(value.get(occur))) for occur in OCCURS)
+        others = dict((k, v) for k, v in value.items() if k not in OCCURS)
+
+        # 嵌套的bool中只有must/filter/must_not时展开到上层, NOT(a or b) 等价于 NOT a and NOT b
+        for occur, allowed in (('must', ('must', 'filter', 'must_not')), ('filter', ('must', 'filter', 'must_not')),
+                               ('must_not', ('should', ))):
+            clauses = []
+            for clause in occurs[occur]:
+                inner = self.only(clause, *allowed)
+                if inner is None:
+                    clauses.append(clause)
+                elif occur == 'must_not':
+                    clauses.extend(inner['should'])
+                elif occur == 'must':
+                    clauses.extend(inner.get('must', []))
+                    occurs['filter'].extend(inner.get('filter', []))
+                    occurs['must_not'].extend(inner.get('must_not', []))
+                else:
+                    clauses.extend(inner.get('must', []) + inner.get('filter', []))
+                    occurs['must_not'].extend(inner.get('must_not', []))
+            occurs[occur] = clauses
+
+        # 不参与评分的条件放入filter
+        occurs['filter'].extend(c for c in occurs['must'] if self.is_filter(c))
+        occurs['must'] = [c for c in occurs['must'] if not self.is_filter(c)]
+        occurs['filter'] = self.merge_ranges(occurs['filter'])
+
+        result = {}
+        for occur in OCCURS:
+            seen, clauses = set(), []
+            for clause in occurs[occur]:
+                key = _key(clause)
+                if key not in seen:
+                    seen.add(key)
+                    clauses.append(clause)
+            if clauses:
+                result[occur] = clauses
+        if not result:
+            return None
+        result.update(others)
+        if result.get('should') and (result.get('must') or result.get('filter')):
+            result.setdefault('minimum_should_match', 1)
+        if not others and len(result) == 1:
+            occur, clauses = next(iter(result.items()))
+            if len(clauses) == 1 and occur in ('must', 'should'):
+                return clauses[0]
+        return {'bool': result}
+
+    @staticmethod
+    def merge_ranges(clauses):
+        """
+        同一字段的range合并为一个, 同一方向有多个界限时保留更严格的(gt/gte取大, lt/lte取小, 相等时取gt/lt)
+        带有其他参数(如format)或值无法比较的range保留为单独的条件
+        """
+        result, ranges = [], {}
+        for clause in clauses:
+            if 'range' not in clause or len(clause['range']) != 1:
+                result.append(clause)
+                continue
+            field, ops = next(iter(clause['range'].items()))
+            if not isinstance(ops, dict) or not ops or set(ops) - set(LOWER + UPPER):
+                result.append(clause)
+                continue
+            merged = ranges.get(field)
+            if merged is None:
+                merged = ranges[field] = {}
+                result.append({'range': {field: merged}})
+            bounds = dict(merged)
+            try:
+                for op, value in ops.items():
+                    Planner.tighten(bounds, op, value)
+            except TypeError:
+                result.append({'range': {field: dict(ops)}})
+                continue
+            merged.clear()
+            merged.update(bounds)
+        return result
+
+    @staticmethod
+    def tighten(bounds, op, value):
+        """
+        将界限op: value加入bounds, 同一方向只保留更严格的一个
+        :param bounds: {'gt': .., 'lte': ..}
+        """
+        side = LOWER if op in LOWER else UPPER
+        current = [o for o in side if o in bounds]
+        if not current:
+            bounds[op] = value
+            return
+        old = current[0]
+        if value == bounds[old]:
+            # 相等时不含等号的更严格
+            strict = side[0]
+            if strict in (op, old):
+                bounds.pop(old)
+                bounds[strict] = value
+            return
+        tighter = value > bounds[old] if side is LOWER else value < bounds[old]
+        if tighter:
+            bounds.pop(old)
+            bounds[op] = value
@@ -0,0 +1,195 @@
+"""
+检索分析: Doc().filter(...).profile() 与 Doc().search(...).explain(pk)
+profile的结果按分片整理为各子句的耗时树, 并按字段对应到生成该子句的 filter()/search()/get() 调用
+"""
+import re
+
+from .operate import HtEsOperator
+
+SYMBOLS = {'eq': '==', 'ne': '!=', 'gt': '>', 'ge': '>=', 'lt': '<', 'le': '<=', 'in': 'in'}
+FIELD_RE = re.compile(r'([\w.]+):')
+
+
+def describe(condition):
+    """
+    filter()条件的可读形式
+    :param condition: HtEsOperator 或 or_()的结果(列表)
+    :return: (描述, 涉及的字段)
+    """
+    if isinstance(condition, (list, tuple)):
+        parts = [describe(c) for c in condition]
+        return 'OR(%s)' % ', '.join(p[0] for p in parts), set().union(*(p[1] for p in parts))
+    if not isinstance(condition, HtEsOperator):
+        return repr(condition), set()
+    field, op, value = condition.params
+    if op == 'or':
+        left, right = describe(field), describe(value)
+        return '%s | %s' % (left[0], right[0]), left[1] | right[1]
+    if op == 'not':
+        parts = [describe(c) for c in (value if isinstance(value, (list, tuple)) else [value])]
+        return 'NOT(%s)' % ', '.join(p[0] for p in parts), set().union(*(p[1] for p in parts))
+    return '%s %s %r' % (field, SYMBOLS.get(op, op), value), {field}
+
+
+def origin(call, args):
+    """
+    :param call: filter / search / get
+    :param args: filter()的条件 或 search()/get()的关键字参数
+    :return: (调用描述, 涉及的字段), 如 ('filter(num > 1)', {'num'})
+    """
+    if call == 'filter':
+        text, fields = describe(args)
+        return 'filter(%s)' % text, fields
+    text = ', '.join('%s=%r' % item for item in args.items())
+    return '%s(%s)' % (call, text), set('_all' if k == 'q' else k for k in args if k != 'match')
+
+
+def _ms(nanos):
+    return round(nanos / 1e6, 3)
+
+
+class ProfileNode(object):
+    """
+    一个检索子句的耗时
+    type: lucene查询类型, 如 TermQuery / BooleanQuery
+    description: lucene查询语句, 如 num:[1 TO 1]
+    time_ms: 包含子句的总耗时, self_ms: 除去子句的耗时
+    breakdown: 各步骤耗时(毫秒), 如 build_scorer / next_doc / score, 只保留非零项
+    origins: 对应的 filter()/search()/get() 调用
+    """
+    __slots__ = ('type', 'description', 'time_ms', 'self_ms', 'breakdown', 'origins', 'children')
+
+    def __init__(self, raw, origins):
+        self.type = raw.get('type')
+        self.description = raw.get('description', '')
+        self.time_ms = _ms(raw.get('time_in_nanos', 0))
+        self.breakdown = dict((k, _ms(v)) for k, v in raw.get('breakdown', {}).items()
+                              if not k.endswith('_count') and v)
+        self.children = [ProfileNode(child, origins) for child in raw.get('children', [])]
+        self.self_ms = round(max(self.time_ms - sum(c.time_ms for c in self.children), 0.0), 3)
+        if self.children:
+            self.origins = []
+            for child in self.children:
+                self.origins.extend(o for o in child.origins if o not in self.origins)
+        else:
+            fields = set(FIELD_RE.findall(self.description))
+            self.origins = [label for label, names in origins if fields & names or '_all' in names]
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            for node in child.walk():
+                yield node
+
+    def to_dict(self):
+        return {'type': self.type, 'description': self.description, 'time_ms': self.time_ms,
+                'self_ms': self.self_ms, 'breakdown': self.breakdown, 'origins': self.origins,
+                'children': [child.to_dict() for child in self.children]}
+
+    def format(self, indent=0):
+        lines = ['%s%s %.3fms (self %.3fms) %s%s' % (
+            '  ' * indent, self.type, self.time_ms, self.self_ms, self.description,
+            ' <- %s' % ', '.join(self.origins) if self.origins else '')]
+        for child in self.children:
+            lines.append(child.format(indent + 1))
+        return '\n'.join(lines)
+
+
+class ProfileResult(object):
+    """
+    result = Doc().filter(Doc.num > 1).search(text='单词').profile()
+    print(result)                   # 各分片的耗时树
+    result.by_origin()              # {'filter(num > 1)': 0.8, "search(text='单词')": 2.1} 毫秒
+    result.slowest(3)               # 耗时最多的子句
+    """
+
+    def __init__(self, raw, origins):
+        """
+        :param raw: profile: true 的检索响应
+        :param origins: Sql.note()记录的 [(调用, 参数), ...]
+        """
+        origins = [origin(call, args) for call, args in origins]
+        self.raw = raw
+        self.took_ms = raw.get('took')
+        hits = raw.get('hits', {}).get('total')
+        self.total_hits = hits.get('value') if isinstance(hits, dict) else hits
+        self.shards = []
+        for shard in raw.get('profile', {}).get('shards', []):
+            searches = shard.get('searches', [])
+            self.shards.append({
+                'id': shard.get('id'),
+                'queries': [ProfileNode(q, origins) for s in searches for q in s.get('query', [])],
+                'rewrite_ms': _ms(sum(s.get('rewrite_time', 0) for s in searches)),
+                'collectors_ms': _ms(sum(c.get('time_in_nanos', 0) for s in searches
+                                         for c in s.get('collector', []))),
+            })
+
+    def nodes(self):
+        for shard in self.shards:
+            for query in shard['queries']:
+                for node in query.walk():
+                    yield shard['id'], node
+
+    def by_origin(self):
+        """
+        各调用的耗时合计(毫秒, 所有分片), 每个子句的自身耗时平均分配给其对应的调用
+        :return: {调用描述: 毫秒}, 从大到小
+        """
+        result = {}
+        for _, node in self.nodes():
+            origins = node.origins or ['(unmapped)']
+            for label in origins:
+                result[label] = result.get(label, 0.0) + node.self_ms / len(origins)
+        return dict(sorted(((k, round(v, 3)) for k, v in result.items()), key=lambda kv: -kv[1]))
+
+    def slowest(self, n=5):
+        """
+        :return: 自身耗时最多的n个子句 [(分片, ProfileNode), ...]
+        """
+        return sorted(self.nodes(), key=lambda item: -item[1].self_ms)[:n]
+
+    def to_dict(self):
+        return {'took_ms': self.took_ms, 'total_hits': self.total_hits,
+                'shards': [dict(shard, queries=[q.to_dict() for q in shard['queries']]) for shard in self.shards]}
+
+    def __str__(self):
+        lines = ['took %sms, hits %s' % (self.took_ms, self.total_hits)]
+        for shard in self.shards:
+            lines.append('shard %s (rewrite %.3fms, collectors %.3fms)' % (
+                shard['id'], shard['rewrite_ms'], shard['collectors_ms']))
+            lines.extend(query.format(1) for query in shard['queries'])
+        return '\n'.join(lines)
+
+
+class Explanation(object):
+    """
+    文档得分的计算过程
+    matched: 文档是否符合检索条件
+    value: 得分, description: 计算方式, details: 子项(Explanation)
+    """
+    __slots__ = ('matched', 'value', 'description', 'details')
+
+    def __init__(self, raw, matched=None):
+        self.matched = matched
+        self.value = raw.get('value')
+        self.description = raw.get('description', '')
+        self.details = [Explanation(detail) for detail in raw.get('details', [])]
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.get('explanation', {}), matched=response.get('matched'))
+
+    def to_dict(self):
+        return {'value': self.value, 'description': self.description,
+                'details': [detail.to_dict() for detail in self.details]}
+
+    def format(self, indent=0):
+        lines = ['%s%s %s' % ('  ' * indent, self.value, self.description)]
+        for detail in self.details:
+            lines.append(detail.format(indent + 1))
+        return '\n'.join(lines)
+
+    def __str__(self):
+        if self.matched is None:
+            return self.format()
+        return 'matched=%s\n%s' % (self.matched, self.format())
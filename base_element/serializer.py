@@ -0,0 +1,142 @@
+"""
+json编解码, 请求体,批量NDJSON和响应解析统一使用同一个编解码器
+默认使用标准库json, 安装了orjson/ujson时可以通过 Config.set_serializer('orjson') 切换
+编解码器同时作为elasticsearch客户端的serializer使用
+"""
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+from elasticsearch.exceptions import SerializationError
+
+from . import instrument
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def default(data):
+    """标准json不支持的类型"""
+    if isinstance(data, (date, datetime)):
+        return data.isoformat()
+    elif isinstance(data, Decimal):
+        return float(data)
+    elif isinstance(data, uuid.UUID):
+        return str(data)
+    raise TypeError("Unable to serialize %r (type: %s)" % (data, type(data)))
+
+
+class JsonCodec(object):
+    """
+    标准库json, dumps返回str, 已经是str/bytes的请求体不再序列化
+    """
+    name = 'json'
+    mimetype = 'application/json'
+
+    def loads(self, s):
+        """解析响应, 统计解析耗时和响应大小"""
+        if instrument.current() is None:
+            return self._loads(s)
+        # 传输层已解码为str时按utf-8字节数统计, 纯ascii时与字符数相同(isascii不需要遍历)
+        instrument.record_bytes(len(s) if not isinstance(s, str) or s.isascii() else len(s.encode('utf-8')))
+        with instrument.phase('decode'):
+            return self._loads(s)
+
+    def _loads(self, s):
+        try:
+            return json.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        if isinstance(data, (str, bytes)):
+            return data
+        try:
+            return json.dumps(data, default=default, ensure_ascii=False)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(data, e)
+
+    def dumps_bytes(self, data):
+        """
+        序列化为utf-8编码的bytes, 传给客户端时不会再次编码
+        :param data:
+        :return: bytes
+        """
+        data = self.dumps(data)
+        if isinstance(data, str):
+            return data.encode('utf-8')
+        return data
+
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    def _loads(self, s):
+        try:
+            return orjson.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps_bytes(self, data):
+        if isinstance(data, bytes):
+            return data
+        if isinstance(data, str):
+            return data.encode('utf-8')
+        try:
+            return orjson.dumps(data, default=default, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError as e:
+            raise SerializationError(data, e)
+
+    def dumps(self, data):
+        # 批量接口会用换行拼接序列化结果, 所以这里需要返回str
+        if isinstance(data, (str, bytes)):
+            return data
+        return self.dumps_bytes(data).decode('utf-8')
+
+
+class UjsonCodec(JsonCodec):
+    name = 'ujson'
+
+    def _loads(self, s):
+        try:
+            return ujson.loads(s)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(s, e)
+
+    def dumps(self, data):
+        if isinstance(data, (str, bytes)):
+            return data
+        try:
+            return ujson.dumps(data, ensure_ascii=False, default=default)
+        except TypeError:
+            # 旧版本ujson不支持default参数
+            return super(UjsonCodec, self).dumps(data)
+        except (ValueError, OverflowError) as e:
+            raise SerializationError(data, e)
+
+
+CODECS = {'json': JsonCodec}
+if orjson is not None:
+    CODECS['orjson'] = OrjsonCodec
+if ujson is not None:
+    CODECS['ujson'] = UjsonCodec
+
+
+def get_codec(name='json'):
+    """
+    :param name: json / orjson / ujson / auto(已安装的最快的编解码器)
+    :return: 编解码器实例
+    """
+    if name == 'auto':
+        name = next(n for n in ('orjson', 'ujson', 'json') if n in CODECS)
+    if name not in CODECS:
+        raise ValueError('serializer %s is not available, choices is %s' % (name, ', '.join(sorted(CODECS))))
+    return CODECS[name]()
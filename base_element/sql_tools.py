@@ -1,12 +1,15 @@
 """
 此处主要是根据elasticsearch的文档整理的检索关键词,用于检索语句的生成,包括所有相关的工具
 """
-import json
 
-from ..base_element.exceptions import UsageError
+from ..base_element.exceptions import UsageError, ParamsError
 from .operate import HtEsOperator
-from elasticsearch import Elasticsearch as ES
+from elasticsearch.helpers import parallel_bulk
 from ..config import Config
+from .cache import query_cache
+from .planner import Planner
+from .profile import ProfileResult, Explanation
+from . import instrument
 
 
 EMPTY = (None, '', b'', [], (), {})
@@ -30,6 +33,28 @@ def format_name_to_normal(name):
     return ''.join(lower)
 
 
+def hits_total(result):
+    """
+    获取检索结果的总数, 兼容7.x以后 hits.total 为 {'value': n, 'relation': 'eq'} 的格式
+    :param result: 检索结果
+    :return: int
+    """
+    total = result['hits'].get('total', 0)
+    if isinstance(total, dict):
+        return total.get('value', 0)
+    return total
+
+
+def url_params(options):
+    """
+    转为直接通过params=传给客户端的url参数, 不经过客户端方法的参数白名单(如5.x的update_by_query不接受slices)
+    值为None的参数不会发送, 布尔值与客户端一致转为 true/false
+    :param options: {name: value}
+    :return: dict
+    """
+    return {k: str(v).lower() if isinstance(v, bool) else v for k, v in options.items() if v is not None}
+
+
 class SelectBody(object):
 
     def __init__(self):
@@ -96,19 +121,10 @@ class SelectBody(object):
         if op not in ('or', 'not', 'ne', 'eq', 'in'):
             raise ValueError('argument op must be one of or, not, ne, eq, in')
 
+        # filter()的条件只过滤文档, 放入bool.filter, 不参与评分(文本字段的match_phrase也一样)
+        # search()/get()的条件保留在bool.must
         if op == 'in':
-            if self._filter.get('terms'):
-                new_terms = [{'terms': {field: value}}, self._filter.pop('terms')]
-                new_terms.extend(self.q_bool.pop('must', []))
-                self.q_bool['must'] = new_terms
-
-            elif self.q_bool.get('must'):
-                terms = [{'terms': {field: value}}, ]
-                terms.extend(self.q_bool.pop('must'))
-                self.q_bool['must'] = terms
-
-            else:
-                self.q_bool['must'] = [{'terms': {field: value}}]
+            self._filter['filter'].append({'terms': {field: value}})
 
         elif op == 'not':
             terms = []
@@ -125,16 +141,14 @@ class SelectBody(object):
             self.q_bool['must_not'] = terms
 
         elif op == 'eq':
-            terms = [{'match_phrase': {field: value}}, ]
-            terms.extend(self.q_bool.pop('must', []))
-            self.q_bool['must'] = terms
+            self._filter['filter'].append({'match_phrase': {field: value}})
 
         else:
+            # 每组 or 条件单独作为一个bool, 多组之间为 and
             terms = []
             for condition in value:
                 terms.extend(self.treat_values(condition))
-            terms.extend(self.q_bool.pop('should', []))
-            self.q_bool['should'] = terms
+            self._filter['filter'].append({'bool': {'should': terms}})
 
     def range(self, field, op, v):
         """
@@ -144,16 +158,8 @@ class SelectBody(object):
         :param v:
         :return:
         """
-        if self._range['range']:
-            done = False
-            for d in self._range['range']:
-                if d.get(field):
-                    self._range['range'][field].update({op: v})
-                    done = True
-            if not done:
-                self._range['range'].append({field: {op: v}})
-        else:
-            self._range['range'].append({field: {op: v}})
+        # 每个比较单独作为一个range, 同一字段的界限由Planner.merge_ranges合并
+        self._range['range'].append({field: {op: v}})
 
     def create(self):
         if self._range['range']:
@@ -193,14 +199,30 @@ class Query(object):
         if id in EMPTY:
             if _source:
                 kwargs['_source'] = _source
-            return self.__es.search(index=indices, doc_type=types, body=body, **kwargs)
+            kwargs.update(index=indices, doc_type=types, body=body)
+            # scroll和point-in-time(不指定索引)的检索有状态, 不做对冲
+            if indices and 'scroll' not in kwargs:
+                return self.__read(self.__es.search, kwargs)
+            return self.__es.search(**kwargs)
         else:
             if isinstance(id, (list, tuple)):
-                return self.__es.mget(body=body)
+                if _source:
+                    kwargs['_source'] = _source
+                kwargs.update(index=indices, doc_type=types, body=body or {'ids': list(id)})
+                return self.__read(self.__es.mget, kwargs)
             else:
                 if _source:
                     kwargs['_source'] = _source
-                return self.__es.get(index=indices, doc_type=types, id=id, **kwargs)
+                kwargs.update(index=indices, doc_type=types, id=id)
+                return self.__read(self.__es.get, kwargs)
+
+    @staticmethod
+    def __read(fn, kwargs):
+        """只读请求, 配置了延迟策略时由策略执行(对冲/截止时间)"""
+        policy = Config.latency_policy
+        if policy is None:
+            return fn(**kwargs)
+        return policy.call(fn, kwargs)
 
     def __put(self, indices=None, types=None, id=None, body=None, params=None, g=False):
         """
@@ -218,9 +240,9 @@ class Query(object):
         if id in EMPTY:
             raise ValueError('id must be not empty value!')
         if g:
-            return self.__es.index(index=indices, doc_type=types, id=id, body=body, params=params)
+            return self.__es.index(index=indices, doc_type=types, id=id, body=body, params=params or {})
         else:
-            return self.__es.update(index=indices, doc_type=types, id=id, body=body, params=params)
+            return self.__es.update(index=indices, doc_type=types, id=id, body=body, params=params or {})
 
     def __post(self, indices=None, types=None, id=None, body=None, params=None):
         """
@@ -250,34 +272,167 @@ class Query(object):
             return self.__es.indices.create(index=indices)
         if id in EMPTY:
             # 创建文档索引
-            return self.__es.index(index=indices, doc_type=types, id=id, body=body, params=params)
+            return self.__es.index(index=indices, doc_type=types, id=id, body=body, params=params or {})
         # id不为空,那么创建文档,并检验该id是否可创建
-        return self.__es.create(index=indices, doc_type=types, id=id, body=body, params=params)
+        return self.__es.create(index=indices, doc_type=types, id=id, body=body, params=params or {})
+
+    def __indices(self, action, indices=None, body=None, **kwargs):
+        """
+        索引管理
+        :param action: create / exists / get_settings / put_settings / refresh / forcemerge
+        :param indices: 索引
+        :param body: 请求体, 如创建索引时的mappings/settings
+        :return:
+        """
+        if body is not None:
+            kwargs['body'] = body
+        return getattr(self.__es.indices, action)(index=indices, **kwargs)
 
     def __delete(self, indices=None, types=None, id=None):
         return self.__es.delete(index=indices, doc_type=types, id=id)
 
-    def __make_es(self):
-        if isinstance(Config.host, str):
-            return ES([Config.host])
-        elif isinstance(Config.host, (list, tuple)):
-            return ES(*Config.host)
-        else:
-            raise TypeError("Query.HOST must be a str like '127.0.0.1:9200' or a list/tuple contains host str,"
-                            "but Your HOST is type %s" % type(Config.host))
+    def __bulk(self, actions, chunk_size=500, max_chunk_bytes=100 * 1024 * 1024, thread_count=4, queue_size=4):
+        """
+        批量操作,将文档操作流式地打包成_bulk请求(NDJSON),按数量和字节大小分批发送
+        单条失败不会中断整个批量,而是在结果中体现
+        :param actions: 可迭代的操作, {'_op_type': 'index', '_index': .., '_type': .., '_id': .., '_source': ..}
+        :param chunk_size: 每批最多文档数
+        :param max_chunk_bytes: 每批最大字节数
+        :param thread_count: 同时发送中的批次数量
+        :param queue_size: 等待发送的批次队列长度
+        :return: generator of (ok, item), 与actions顺序一致
+        """
+        return parallel_bulk(self.__es, actions, thread_count=thread_count, chunk_size=chunk_size,
+                             max_chunk_bytes=max_chunk_bytes, queue_size=queue_size,
+                             raise_on_error=False, raise_on_exception=False)
+
+    def __bulk_lines(self, lines, **kwargs):
+        """
+        发送已序列化的_bulk请求, 不再分批和序列化
+        :param lines: NDJSON的各行(str), 操作行与文档行交替
+        :return: _bulk的响应
+        """
+        return self.__es.bulk(body=lines, **kwargs)
+
+    def __msearch(self, body=None, **kwargs):
+        """
+        多个检索合并为一次_msearch请求
+        :param body: [header, body, header, body, ...]
+        :return:
+        """
+        return self.__es.msearch(body=body, **kwargs)
+
+    def __count(self, indices=None, types=None, body=None, **kwargs):
+        """
+        计数, 走_count接口, 不计算评分也不获取文档
+        :param body: {'query': ...}
+        :return:
+        """
+        return self.__es.count(index=indices, doc_type=types, body=body, **kwargs)
+
+    def __explain(self, indices=None, types=None, id=None, body=None, **kwargs):
+        """
+        文档得分的计算过程
+        :param id: 文档id
+        :param body: {'query': ...}
+        :return:
+        """
+        return self.__es.explain(index=indices, doc_type=types, id=id, body=body, **kwargs)
+
+    def __template(self, indices=None, types=None, body=None, **kwargs):
+        """
+        服务器端检索模板
+        :param body: {'source': 模板, 'params': 参数}
+        :return:
+        """
+        return self.__es.search_template(index=indices, doc_type=types, body=body, **kwargs)
+
+    def __pit(self, indices=None, keep_alive='1m', id=None):
+        """
+        打开/关闭point-in-time, 需要服务器和客户端都支持(elasticsearch>=7.10), 不支持时返回None
+        :param indices: 索引值, 打开时使用
+        :param keep_alive: 保持时间
+        :param id: pit id, 给定时关闭该pit
+        :return: pit id
+        """
+        if not hasattr(self.__es, 'open_point_in_time'):
+            return None
+        if id:
+            return self.__es.close_point_in_time(body={'id': id})
+        return self.__es.open_point_in_time(index=indices, keep_alive=keep_alive)['id']
+
+    def __scroll(self, scroll_id=None, scroll='1m', clear=False):
+        """
+        游标翻页, 旧版本服务器不支持point-in-time时使用
+        :param scroll_id: 游标id
+        :param scroll: 游标保持时间
+        :param clear: 是否释放该游标
+        :return:
+        """
+        if clear:
+            return self.__es.clear_scroll(scroll_id=scroll_id, ignore=(404, ))
+        return self.__es.scroll(scroll_id=scroll_id, scroll=scroll)
+
+    def __update_by_query(self, indices=None, types=None, body=None, **kwargs):
+        """
+        在服务器上更新所有符合条件的文档
+        :param body: {'query': ..., 'script': ...}
+        :param kwargs: slices, requests_per_second, conflicts, wait_for_completion, refresh...
+        :return:
+        """
+        return self.__es.update_by_query(index=indices, doc_type=types, body=body, **kwargs)
+
+    def __delete_by_query(self, indices=None, types=None, body=None, **kwargs):
+        """
+        在服务器上删除所有符合条件的文档
+        :param body: {'query': ...}
+        :return:
+        """
+        return self.__es.delete_by_query(index=indices, doc_type=types, body=body, **kwargs)
+
+    def __task(self, task_id=None, cancel=False):
+        """
+        查询/取消服务器上的后台任务
+        :param task_id: node_id:task_number
+        :param cancel: 是否取消
+        :return:
+        """
+        if cancel:
+            return self.__es.tasks.cancel(task_id=task_id)
+        return self.__es.tasks.get(task_id=task_id)
 
     def __call__(self, method='get', *args, **kwargs):
-        if not self.__es:
-            self.__es = self.__make_es()
+        # 客户端由Config统一管理, 相同配置在进程内共享一个线程安全的连接池
+        self.__es = Config.get_es()
         methods = {
             'get': self.__get,
             'put': self.__put,
             'del': self.__delete,
-            'post': self.__post
+            'post': self.__post,
+            'bulk': self.__bulk,
+            'bulk_lines': self.__bulk_lines,
+            'pit': self.__pit,
+            'scroll': self.__scroll,
+            'msearch': self.__msearch,
+            'template': self.__template,
+            'count': self.__count,
+            'explain': self.__explain,
+            'indices': self.__indices,
+            'update_by_query': self.__update_by_query,
+            'delete_by_query': self.__delete_by_query,
+            'task': self.__task
         }
         if method not in methods.keys():
-            raise ValueError('method argument must be one of [get, put, post, delete], not %s' % method)
-        resp = methods[method](*args, **kwargs)
+            raise ValueError('method argument must be one of [get, put, post, delete, bulk, bulk_lines, pit, scroll, '
+                             'msearch, template, count, explain, indices, update_by_query, delete_by_query, task], '
+                             'not %s' % method)
+        if not instrument.enabled() or method == 'bulk':
+            # bulk的请求在消费生成器时发送, 由Sql.bulk_actions统计
+            return methods[method](*args, **kwargs)
+        with instrument.operation(method, indices=kwargs.get('indices'), types=kwargs.get('types')):
+            with instrument.phase('request'):
+                resp = methods[method](*args, **kwargs)
+            instrument.record_response(resp, kwargs.get('body'))
         return resp
 
 
@@ -287,8 +442,15 @@ class Sql(object):
     """
     __query = Query()
 
-    def __init__(self, indices, types):
+    def __init__(self, indices, types, field_types=None, codecs=None):
+        """
+        :param indices: 索引
+        :param types: 文档类型
+        :param field_types: 字段名 => 字段类型, 用于整理检索语句(见planner)
+        :param codecs: Datetime字段名 => DatetimeCodec, 条件值按写入的格式编码
+        """
         self._stb = SelectBody()
+        self._planner = Planner(field_types, codecs)
         self.__sql_string = ''
         self.indices = indices
         self.types = types
@@ -296,6 +458,7 @@ class Sql(object):
         self.query_params = {}
         self.other_params = {}
         self.with_raw = {}
+        self.origins = []
 
     def __add__(self, other):
         """
@@ -309,19 +472,41 @@ class Sql(object):
                                                                                    other.__class__.__name__))
         return True
 
-    @property
-    def sql_string(self):
+    def build_body(self):
+        """
+        生成检索语句(字典格式), 调用后已拼接的检索条件会被清空
+        :return: dict
+        """
         if self.with_raw:
             self.body = self.with_raw
             self.with_raw = {}
 
         else:
-            self.body = self._stb.create().body
+            with instrument.phase('build'):
+                self.body = self._planner.plan(self._stb.create().body)
             self._stb.init()
+        self.origins = []
 
         if self.other_params.get('order'):
             self.body.update(self.other_params.pop('order'))
-        return json.dumps(self.body)
+        return self.body
+
+    @staticmethod
+    def dumps(body):
+        """序列化检索语句为bytes"""
+        with instrument.phase('serialize'):
+            return Config.codec.dumps_bytes(body)
+
+    @property
+    def sql_string(self):
+        body = self.build_body()
+        with instrument.phase('serialize'):
+            return Config.codec.dumps(body)
+
+    @property
+    def sql_bytes(self):
+        """编码后的检索语句, 直接作为请求体发送, 客户端不会再次序列化"""
+        return self.dumps(self.build_body())
 
     def some_field(self, *args):
         """
@@ -331,25 +516,87 @@ class Sql(object):
         """
         self.query_params['_source'] = ','.join(args)
 
-    def check_exists(self, pk):
+    def cached(self, method, params, fetch, use_cache=False):
+        """
+        通过进程内缓存执行检索, 缓存键由索引,类型,检索语句和参数生成
+        :param method: 检索方式, 用于区分相同语句的不同用途
+        :param params: 检索参数
+        :param fetch: 缓存未命中时执行的检索函数
+        :param use_cache: 为False时直接检索
+        :return:
+        """
+        if not use_cache:
+            return fetch()
+        key = query_cache.make_key(self.indices, self.types, self.body, params, method)
+        found, result = query_cache.get(key)
+        if not found:
+            generation = query_cache.generation
+            result = fetch()
+            query_cache.set(key, self.indices, result, generation)
+        return result
+
+    def count_body(self):
+        """
+        计数/判断存在时使用的检索语句, 只保留检索条件, 排序和分页对结果没有影响
+        调用后条件会被清空
+        :return: dict
+        """
+        body = self.build_body()
+        self.query_params = {}
+        self.body = {'query': body['query']} if body.get('query') else {}
+        return self.body
+
+    def count_query(self, body=None):
         """
-        检查是否存在
+        :param body: 已序列化的计数语句, 如预编译模板绑定参数后的语句
+        :return: 序列化后的计数语句, body为空时使用当前条件生成
+        """
+        if body is None:
+            return self.dumps(self.count_body())
+        self.body = body
+        return body
+
+    def check_exists(self, pk, use_cache=False, body=None):
+        """
+        检查是否存在, size=0且每个分片找到一条即停止(terminate_after=1), 不会统计全部符合条件的文档
         :param pk: 主键的字段名
+        :param use_cache: 是否使用缓存
+        :param body: 已序列化的计数语句(只有query), 为空则使用当前条件生成
         :return:
         """
-        return bool(self.check_count(pk))
+        if not isinstance(pk, str):
+            raise TypeError("'pk' must be str type")
+        query_params = {'size': 0, 'terminate_after': 1}
+        body = self.count_query(body)
+        result = self.cached('exists', query_params, lambda: self.__query(
+            'get', indices=self.indices, types=self.types, id=None, body=body, **query_params), use_cache)
+        return hits_total(result) > 0
 
-    def check_count(self, pk):
+    def check_count(self, pk, use_cache=False, approx=False, threshold=10000, body=None):
         """
-        检查合规数量
+        检查合规数量, 走_count接口
+        :param pk: 主键的字段名
+        :param use_cache: 是否使用缓存
+        :param approx: 为True时每个分片数到threshold即停止(terminate_after), 结果最大为threshold,
+            等于threshold时表示至少有这么多, 适合"是否有新数据/是否超过N条"一类的轮询
+        :param threshold: approx为True时的计数上限
+        :param body: 已序列化的计数语句(只有query), 为空则使用当前条件生成
         :return:
         """
         if not isinstance(pk, str):
             raise TypeError("'pk' must be str type")
-        query_params = {'from_': 0, 'size': 1, '_source': pk}
-        result = self.__query('get', indices=self.indices, types=self.types, id=None, body=self.sql_string,
-                              **query_params)
-        return result['hits'].get('total', 0)
+        query_params = {}
+        if approx:
+            if not isinstance(threshold, int) or threshold < 1:
+                raise ValueError('threshold must be positive int')
+            # 5.x客户端的count()不接受terminate_after关键字参数, 作为url参数直接传入
+            query_params['params'] = {'terminate_after': threshold}
+        body = self.count_query(body)
+        result = self.cached('count', query_params, lambda: self.__query(
+            'count', indices=self.indices, types=self.types, body=body, **query_params), use_cache)
+        if approx:
+            return min(result['count'], threshold)
+        return result['count']
 
     def put(self, doc, g=False, body=None):
         """
@@ -360,17 +607,19 @@ class Sql(object):
         :return:
         """
         if g:
-            body = doc.query_to_dict()
+            body = doc.to_source()
         indices, types = doc.indices, doc.types
-        return self.__query('put', indices=indices, types=types, id=doc.get_pk(), body=body, g=g)
+        with query_cache.writing(indices):
+            return self.__query('put', indices=indices, types=types, id=doc.get_pk(), body=body, g=g)
 
     def post(self, doc, **fields):
         """
         创建文档索引
         :param doc: 文档对象 Doc instance
         """
-        indices, types, body = doc.indices, doc.types, doc.query_to_dict()
-        return self.__query('post', indices=indices, types=types, id=doc.get_pk(), body=body)
+        indices, types, body = doc.indices, doc.types, doc.to_source()
+        with query_cache.writing(indices):
+            return self.__query('post', indices=indices, types=types, id=doc.get_pk(), body=body)
 
     def delete(self, doc):
         """
@@ -378,9 +627,230 @@ class Sql(object):
         :param doc: 文档对象 Doc instance
         :return:
         """
-        return self.__query('del', indices=self.indices, types=self.types, id=doc.get_pk())
+        with query_cache.writing(self.indices):
+            return self.__query('del', indices=self.indices, types=self.types, id=doc.get_pk())
+
+    def msearch_entry(self, method='all'):
+        """
+        生成_msearch中的一条检索, 包含分页/字段等参数, 调用后条件会被清空
+        :param method: all / first / count / exists
+        :return: header, body
+        """
+        body = dict(self.build_body())
+        params = self.query_params
+        self.query_params = {}
+        if method == 'first':
+            body.update({'from': 0, 'size': 1})
+        elif method in ('count', 'exists'):
+            body['size'] = 0
+            if method == 'exists':
+                body['terminate_after'] = 1
+        else:
+            if 'from_' in params:
+                body['from'] = params['from_']
+            if 'size' in params:
+                body['size'] = params['size']
+        if params.get('_source') and method in ('all', 'first'):
+            body['_source'] = params['_source'].split(',')
+        return {'index': self.indices, 'type': self.types}, body
+
+    def msearch(self, entries, chunk_size=50):
+        """
+        执行多条检索
+        :param entries: [(header, body), ...]
+        :param chunk_size: 每个_msearch请求最多包含的检索数量
+        :return: 与entries顺序一致的响应列表
+        """
+        responses = []
+        for i in range(0, len(entries), chunk_size):
+            body = []
+            for header, search in entries[i:i + chunk_size]:
+                body.extend((header, search))
+            responses.extend(self.__query('msearch', body=body)['responses'])
+        return responses
+
+    def by_query(self, method, script=None, **options):
+        """
+        使用当前条件在服务器上批量更新/删除, 调用后条件会被清空
+        :param method: update_by_query / delete_by_query
+        :param script: 更新脚本 {'source': .., 'lang': 'painless', 'params': {..}}
+        :param options: slices, requests_per_second, conflicts, wait_for_completion, refresh, scroll_size,
+            值为None的参数不会发送
+        :return: 服务器响应, wait_for_completion=False时为 {'task': task_id}
+        """
+        body = dict(self.count_body())
+        if script:
+            body['script'] = script
+        with query_cache.writing(self.indices):
+            return self.__query(method, indices=self.indices, types=self.types, body=self.dumps(body),
+                                params=url_params(options))
+
+    def task(self, task_id, cancel=False):
+        """
+        查询/取消后台任务
+        :param task_id: 任务id
+        :param cancel: 是否取消
+        :return:
+        """
+        return self.__query('task', task_id=task_id, cancel=cancel)
+
+    def mget(self, ids, realtime=True):
+        """
+        根据主键批量获取文档, 走_mget接口, 实时且不计算评分
+        :param ids: 主键列表
+        :param realtime: 是否实时获取(不等待refresh)
+        :return: [{'_id': .., 'found': True, '_source': {..}}, ...] 与ids顺序一致
+        """
+        params = {'realtime': realtime}
+        if self.query_params.get('_source'):
+            params['_source'] = self.query_params['_source']
+        result = self.__query('get', indices=self.indices, types=self.types, id=list(ids), **params)
+        return result['docs']
+
+    @staticmethod
+    def doc_action(doc, op_type, fields=None):
+        """
+        将文档对象转换为一条bulk操作
+        :param doc: 文档对象 Doc instance
+        :param op_type: index / create / update / delete
+        :param fields: 局部更新时需要更新的字段, 为空则更新全部字段
+        :return:
+        """
+        action = {'_op_type': op_type, '_index': doc.indices, '_type': doc.types}
+        pk = doc.get_pk()
+        if pk not in EMPTY:
+            action['_id'] = pk
+        elif op_type in ('update', 'delete'):
+            raise ValueError('id must be not empty value!')
+
+        if op_type == 'delete':
+            return action
+        body = doc.to_source()
+        if op_type == 'update':
+            action['doc'] = {k: body[k] for k in fields} if fields else body
+        else:
+            action['_source'] = body
+        return action
+
+    def bulk(self, docs, op_type=None, fields=None, **options):
+        """
+        批量创建/更新/删除文档
+        :param docs: 可迭代的文档对象, 可以是生成器, 不会一次性读入内存
+        :param op_type: index / create / update / delete, 为空时与save()一致:
+                        已检索出的文档全量索引, 新文档有id则create, 否则index
+        :param fields: 局部更新的字段
+        :param options: chunk_size, max_chunk_bytes, thread_count, queue_size
+        :return: [(ok, item), ...]
+        """
+        def actions():
+            for doc in docs:
+                if op_type:
+                    yield self.doc_action(doc, op_type, fields)
+                elif doc._had_request or doc.get_pk() in EMPTY:
+                    yield self.doc_action(doc, 'index')
+                else:
+                    yield self.doc_action(doc, 'create')
+
+        return self.bulk_actions(actions(), **options)
+
+    def bulk_actions(self, actions, **options):
+        """
+        执行已生成的bulk操作(见doc_action), 写入的索引的缓存会失效
+        :param actions: 可迭代的bulk操作
+        :param options: chunk_size, max_chunk_bytes, thread_count, queue_size
+        :return: [(ok, item), ...]
+        """
+        written = set()
+
+        def tracked():
+            for action in actions:
+                written.add(action['_index'])
+                yield action
+
+        try:
+            # parallel_bulk返回生成器, 请求在消费时才发送, 所以在这里统计整个批量写入
+            with instrument.operation('bulk', indices=self.indices, types=self.types):
+                with instrument.phase('request'):
+                    return list(self.__query('bulk', tracked(), **options))
+        finally:
+            for indices in written:
+                query_cache.invalidate(indices)
+
+    def bulk_lines(self, lines, indices):
+        """
+        发送已序列化的bulk操作(一次_bulk请求), 写入的索引的缓存会失效
+        :param lines: NDJSON的各行(str), 操作行与文档行交替
+        :param indices: 写入的索引名
+        :return: _bulk的响应
+        """
+        try:
+            return self.__query('bulk_lines', lines)
+        finally:
+            for index in indices:
+                query_cache.invalidate(index)
+
+    def scan_body(self):
+        """
+        生成遍历用的检索语句和参数, 分页参数会被忽略
+        :return: body, params
+        """
+        body = dict(self.build_body())
+        source = self.query_params.get('_source')
+        self.query_params = {}
+        return body, ({'_source': source} if source else {})
+
+    def scan(self, pk, chunk_size=1000, keep_alive='1m', body=None, params=None):
+        """
+        遍历全部检索结果, 每次产出一批原始文档(hits), 不受from_/size的10000条限制
+        服务器支持point-in-time时使用pit + search_after(按order_by的排序, 并以主键作为最后的排序字段),
+        否则使用scroll游标. 生成器关闭时释放pit/游标
+        :param pk: 主键的字段名
+        :param chunk_size: 每批的文档数量
+        :param keep_alive: pit/游标的保持时间
+        :param body: 已生成的检索语句(如分片遍历时带有slice), 为空则使用当前条件生成
+        :param params: 与body对应的参数
+        :return: generator of [hit, ...]
+        """
+        if body is None:
+            body, params = self.scan_body()
+        body, params = dict(body), params or {}
+
+        pit_id = self.__query('pit', indices=self.indices, keep_alive=keep_alive)
+        if pit_id:
+            sort = list(body.get('sort', []))
+            if not any(pk in s if isinstance(s, dict) else s == pk for s in sort):
+                sort.append({pk: {'order': 'asc'}})
+            body.update({'sort': sort, 'size': chunk_size, 'pit': {'id': pit_id, 'keep_alive': keep_alive}})
+            try:
+                while True:
+                    result = self.__query('get', body=body, **params)
+                    hits = result['hits']['hits']
+                    body['pit']['id'] = result.get('pit_id', body['pit']['id'])
+                    if hits:
+                        yield hits
+                    if len(hits) < chunk_size:
+                        break
+                    body['search_after'] = hits[-1]['sort']
+            finally:
+                self.__query('pit', id=body['pit']['id'])
+        else:
+            body.setdefault('sort', ['_doc'])
+            result = self.__query('get', indices=self.indices, types=self.types, body=body, scroll=keep_alive,
+                                  size=chunk_size, **params)
+            scroll_id = result.get('_scroll_id')
+            try:
+                while result['hits']['hits']:
+                    yield result['hits']['hits']
+                    result = self.__query('scroll', scroll_id=scroll_id, scroll=keep_alive)
+                    scroll_id = result.get('_scroll_id', scroll_id)
+            finally:
+                if scroll_id:
+                    self.__query('scroll', scroll_id=scroll_id, clear=True)
 
     def range(self, f, op, v):
+        if op == 'or' and isinstance(f, HtEsOperator):
+            # a | b
+            f, v = None, [f, v]
         if op in ('gt', 'ge', 'lt', 'le'):
             self._stb.range(f, op, v)
         else:
@@ -420,10 +890,117 @@ class Sql(object):
     def raw_search(self, body):
         self.with_raw = body
 
-    def search(self):
-        result = self.__query('get', indices=self.indices, types=self.types, id=None, body=self.sql_string,
-                              **self.query_params)
+    def aggregate(self, aggs, body=None, use_cache=False):
+        """
+        聚合检索, 不返回文档(size=0)
+        :param aggs: {name: agg_body}
+        :param body: 已生成的检索语句, 为空则使用当前条件生成
+        :param use_cache: 是否使用进程内缓存
+        :return: 响应中的aggregations
+        """
+        body = dict(self.build_body() if body is None else body)
+        body.update(size=0, aggs=aggs)
+        body.pop('sort', None)
+        self.body = body
+        params = {k: v for k, v in self.query_params.items() if k not in ('from_', 'size', '_source')}
+        self.query_params = {}
+        data = self.dumps(body)
+        result = self.cached('aggs', params, lambda: self.__query(
+            'get', indices=self.indices, types=self.types, id=None, body=data, **params), use_cache)
+        return result.get('aggregations', {})
+
+    def create_index(self, body=None):
+        """
+        创建索引
+        :param body: {'settings': .., 'mappings': ..}
+        :return:
+        """
+        return self.__query('indices', 'create', indices=self.indices, body=body)
+
+    def index_exists(self):
+        return self.__query('indices', 'exists', indices=self.indices)
+
+    def index_settings(self, name=None):
+        """
+        :param name: 设置项, 如 index.refresh_interval, 为空则获取全部
+        :return: {索引名: {'settings': {...}}}
+        """
+        kwargs = {'name': name} if name else {}
+        return self.__query('indices', 'get_settings', indices=self.indices, **kwargs)
+
+    def put_settings(self, settings):
+        """
+        :param settings: {'index': {'refresh_interval': '-1'}}
+        :return:
+        """
+        return self.__query('indices', 'put_settings', indices=self.indices, body=settings)
+
+    def refresh(self):
+        with query_cache.writing(self.indices):
+            return self.__query('indices', 'refresh', indices=self.indices)
+
+    def forcemerge(self, max_num_segments=None):
+        kwargs = {'max_num_segments': max_num_segments} if max_num_segments else {}
+        return self.__query('indices', 'forcemerge', indices=self.indices, **kwargs)
+
+    def note(self, call, args):
+        """
+        记录检索条件来自哪个调用, 用于profile()的结果对应, 只保存参数, 需要时再生成描述
+        :param call: filter / search / get
+        :param args: filter()的条件 或 search()/get()的关键字参数
+        :return:
+        """
+        self.origins.append((call, args))
+
+    def profile(self):
+        """
+        使用 profile: true 执行当前检索
+        :return: ProfileResult
+        """
+        origins = self.origins
+        body = dict(self.build_body())
+        body['profile'] = True
+        params, self.query_params = self.query_params, {}
+        result = self.__query('get', indices=self.indices, types=self.types, id=None, body=self.dumps(body),
+                              **params)
+        return ProfileResult(result, origins)
+
+    def explain(self, doc_id):
+        """
+        文档在当前检索条件下的得分计算过程
+        :param doc_id: 文档id
+        :return: Explanation
+        """
+        if not isinstance(self.indices, str) or ',' in self.indices or '*' in self.indices:
+            raise ParamsError('explain() requires a single index, got %s' % (self.indices, ))
+        body = self.build_body()
+        self.query_params = {}
+        body = {'query': body.get('query') or {'match_all': {}}}
+        result = self.__query('explain', indices=self.indices, types=self.types or '_doc', id=doc_id,
+                              body=self.dumps(body))
+        return Explanation.from_response(result)
+
+    def execute(self, body, params=None, template=False):
+        """
+        使用已生成的检索语句执行检索, 不经过SelectBody
+        :param body: 检索语句, json字符串或字典; template=True时为 {'source': 模板, 'params': 参数}
+        :param params: 检索参数, from_/size/_source等
+        :param template: 是否为服务器端检索模板
+        :return:
+        """
+        if template:
+            return self.__query('template', indices=self.indices, types=self.types, body=body, **(params or {}))
+        return self.__query('get', indices=self.indices, types=self.types, id=None, body=body, **(params or {}))
+
+    def search(self, use_cache=False):
+        """
+        执行检索
+        :param use_cache: 是否使用进程内缓存
+        :return:
+        """
+        body, params = self.sql_bytes, self.query_params
         if self.query_params:
             self.query_params = {}
 
-        return result
+        return self.cached('search', params, lambda: self.__query(
+            'get', indices=self.indices, types=self.types, id=None, body=body, **params), use_cache)
@@ -0,0 +1,91 @@
+"""
+服务器上的后台任务(update_by_query/delete_by_query 使用 wait_for_completion=False 时)
+"""
+import time
+
+from .cache import query_cache
+from .exceptions import ServerError
+
+
+class Task(object):
+    """
+    task = Doc().filter(...).delete_all(wait=False)
+    task.progress        # 0.0 ~ 1.0
+    result = task.wait(poll_interval=5)
+    """
+
+    def __init__(self, sql, task_id):
+        """
+        :param sql: 提交任务的Sql, 用于查询任务和使缓存失效
+        :param task_id: node_id:task_number
+        """
+        self._sql = sql
+        self.task_id = task_id
+        self._info = None
+
+    def refresh(self):
+        """
+        从服务器获取任务状态
+        :return: tasks.get的响应
+        """
+        self._info = self._sql.task(self.task_id)
+        if self._info.get('completed'):
+            query_cache.invalidate(self._sql.indices)
+        return self._info
+
+    @property
+    def info(self):
+        if self._info is None:
+            self.refresh()
+        return self._info
+
+    @property
+    def done(self):
+        """任务是否完成(每次访问都会查询服务器)"""
+        return bool(self.refresh().get('completed'))
+
+    @property
+    def status(self):
+        """
+        任务进度 {'total': .., 'updated': .., 'created': .., 'deleted': .., 'batches': .., 'version_conflicts': ..}
+        分片执行(slices)时为各分片的合计
+        """
+        return self.info.get('task', {}).get('status', {})
+
+    @property
+    def progress(self):
+        """
+        已处理的比例, 0.0 ~ 1.0
+        """
+        status = self.refresh().get('task', {}).get('status', {})
+        total = status.get('total') or 0
+        if not total:
+            return 1.0 if self._info.get('completed') else 0.0
+        handled = sum(status.get(k, 0) for k in ('updated', 'created', 'deleted', 'noops', 'version_conflicts'))
+        return min(handled / float(total), 1.0)
+
+    def wait(self, poll_interval=1.0, timeout=None):
+        """
+        等待任务完成
+        :param poll_interval: 查询间隔(秒)
+        :param timeout: 最长等待时间(秒), 超时抛出ServerError
+        :return: 任务完成后的响应, 与wait_for_completion=True时的返回一致
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.done:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise ServerError('任务未在%s秒内完成。Task %s not completed in %ss' % (timeout, self.task_id, timeout))
+            time.sleep(poll_interval)
+        if self._info.get('error'):
+            raise ServerError('任务失败。Task %s failed: %s' % (self.task_id, self._info['error']))
+        return self._info.get('response', {})
+
+    def cancel(self):
+        """
+        取消任务, 已处理的文档不会回滚
+        :return:
+        """
+        return self._sql.task(self.task_id, cancel=True)
+
+    def __repr__(self):
+        return '<Task %s>' % self.task_id
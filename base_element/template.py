@@ -0,0 +1,200 @@
+"""
+预编译的参数化检索模板, 检索语句只生成和序列化一次, 执行时仅替换参数值
+
+    tpl = DocTry().filter(DocTry.num > P('min_num')).search(text=P('word')).compile()
+    tpl.all(min_num=30, word='单词')
+"""
+import re
+
+from ..config import Config
+from .exceptions import ParamsError
+from .sql_tools import hits_total
+
+PLACEHOLDER = '__tpl_param__%s__'
+PLACEHOLDER_RE = re.compile(r'"__tpl_param__(.+?)__"')
+
+
+class P(object):
+    """
+    检索模板中的参数占位符, 可用在filter()/search()/get()的值以及limit()/offset()中
+    """
+    __slots__ = ('name', )
+
+    def __init__(self, name):
+        if not isinstance(name, str) or not name:
+            raise TypeError('placeholder name must be a non-empty str')
+        self.name = name
+
+    def __repr__(self):
+        return 'P(%r)' % self.name
+
+    # 字段与占位符比较时(Doc.num > P('n'))只需要生成检索条件, 比较结果没有意义
+    def __eq__(self, other):
+        return False
+
+    def __ne__(self, other):
+        return False
+
+    def __lt__(self, other):
+        return False
+
+    def __le__(self, other):
+        return False
+
+    def __gt__(self, other):
+        return False
+
+    def __ge__(self, other):
+        return False
+
+    def __contains__(self, item):
+        return False
+
+    def __hash__(self):
+        return hash((P, self.name))
+
+
+def _mark(value):
+    """将检索语句中的占位符替换为标记字符串, 序列化后再切分出参数位置"""
+    if isinstance(value, P):
+        return PLACEHOLDER % value.name
+    if isinstance(value, dict):
+        return dict((k, _mark(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [_mark(v) for v in value]
+    return value
+
+
+def _dumps(body):
+    """使用Config.codec序列化, 与其他检索语句的编码一致"""
+    return Config.codec.dumps(_mark(body))
+
+
+def _dumps_value(value):
+    """
+    序列化单个参数值
+    codec.dumps会原样返回str(视为已序列化的请求体), 所以放在列表中序列化后去掉方括号
+    """
+    return Config.codec.dumps([value])[1:-1]
+
+
+class CompiledQuery(object):
+    """
+    由Doc.compile()生成, 保存序列化后的检索语句片段, 执行时将参数值序列化后拼接
+    server=True时使用服务器端检索模板(mustache), 参数由服务器替换
+    """
+
+    def __init__(self, doc, server=False):
+        self._doc_cls = doc.__class__
+        self._wanted = list(doc._wanted)
+        self.server = server
+
+        self._params = doc._query.query_params
+        doc._query.query_params = {}
+        self._body = doc._query.build_body()
+        # Datetime字段上的占位符, 参数值按字段格式编码
+        self._codecs = dict(doc._query._planner.placeholders)
+        self._template = _dumps(self._body)
+        # 偶数位为固定的json片段, 奇数位为参数名
+        self._segments = PLACEHOLDER_RE.split(self._template)
+        # _count接口的请求体只接受query
+        self._count_segments = PLACEHOLDER_RE.split(_dumps({'query': self._body['query']})
+                                                    if self._body.get('query') else '{}')
+        self.names = sorted(set(self._segments[1::2]) | set(
+            v.name for v in self._params.values() if isinstance(v, P)))
+        self._sources = {}
+
+    def _check(self, values, override=None):
+        """
+        :param values: 参数值
+        :param override: 执行时覆盖的分页参数(first/count/exists), 只在被覆盖参数中使用的占位符不需要提供
+        """
+        names = self.names
+        if override:
+            names = sorted(set(self._segments[1::2]) | set(
+                v.name for k, v in self._params.items() if isinstance(v, P) and k not in override))
+        missing = [name for name in names if name not in values]
+        if missing:
+            raise ParamsError('检索模板缺少参数: %s。Missing template params: %s' % (missing, missing))
+
+    def _encode(self, values):
+        if not self._codecs:
+            return values
+        return dict((k, self._codecs[k].encode(v) if k in self._codecs else v) for k, v in values.items())
+
+    def _bind_params(self, values, **override):
+        params = {k: values[v.name] if isinstance(v, P) else v for k, v in self._params.items()
+                  if k not in override}
+        params.update(override)
+        return params
+
+    def body(self, **values):
+        """
+        生成绑定参数后的检索语句
+        :param values: 参数值
+        :return: json str
+        """
+        self._check(values)
+        return self._render(values)
+
+    def _render(self, values, segments=None):
+        values = self._encode(values)
+        parts = []
+        for i, segment in enumerate(segments or self._segments):
+            if i % 2:
+                parts.append(_dumps_value(values[segment]))
+            else:
+                parts.append(segment)
+        return ''.join(parts)
+
+    def _source(self, params):
+        """服务器端模板, 分页参数写在模板中"""
+        key = tuple(sorted((k, repr(v)) for k, v in params.items()))
+        source = self._sources.get(key)
+        if source is None:
+            body = dict(self._body)
+            for name, k in (('from_', 'from'), ('size', 'size'), ('_source', '_source'),
+                            ('terminate_after', 'terminate_after')):
+                if name in params:
+                    body[k] = params[name].split(',') if name == '_source' else params[name]
+            source = PLACEHOLDER_RE.sub(lambda m: '{{#toJson}}%s{{/toJson}}' % m.group(1),
+                                        _dumps(body))
+            self._sources[key] = source
+        return source
+
+    def _execute(self, values, **override):
+        doc = self._doc_cls()
+        self._check(values, override)
+        if self.server:
+            params = dict(self._params, **override)
+            body = {'source': self._source(params), 'params': self._encode(values)}
+            return doc, doc._query.execute(body, template=True)
+        return doc, doc._query.execute(self._render(values), self._bind_params(values, **override))
+
+    def all(self, **values):
+        doc, result = self._execute(values)
+        doc._wanted = list(self._wanted)
+        return doc._hydrate(result['hits']['hits'])
+
+    def first(self, **values):
+        doc, result = self._execute(values, from_=0, size=1)
+        doc._wanted = list(self._wanted)
+        result = doc._hydrate(result['hits']['hits'])
+        return result[0] if result else None
+
+    def count(self, **values):
+        """走_count接口, 与Doc.count()一致; 服务器端模板没有对应的计数接口, 使用size=0的检索"""
+        if self.server:
+            doc, result = self._execute(values, from_=0, size=0)
+            return hits_total(result)
+        self._check(values, self._params)
+        doc = self._doc_cls()
+        return doc._query.check_count(doc.__pk__, body=self._render(values, self._count_segments))
+
+    def exists(self, **values):
+        if self.server:
+            doc, result = self._execute(values, from_=0, size=0, terminate_after=1)
+            return hits_total(result) > 0
+        self._check(values, self._params)
+        doc = self._doc_cls()
+        return doc._query.check_exists(doc.__pk__, body=self._render(values, self._count_segments))
@@ -0,0 +1,5 @@
+"""
+性能测试, 运行方式: python -m elasticsearch_tool.benchmarks.bench_codec
+完整测试(使用本地替身服务, 输出json): python -m elasticsearch_tool.benchmarks.run --output result.json
+真实客户端的参数检查(使用本地替身服务): python -m elasticsearch_tool.benchmarks.check_client
+"""
@@ -0,0 +1,67 @@
+"""
+json编解码器对比: 解析大量结果的检索响应, 以及序列化检索语句/批量请求
+python -m elasticsearch_tool.benchmarks.bench_codec [hits]
+"""
+import json
+import random
+import sys
+import time
+from datetime import datetime
+
+from ..base_element.serializer import CODECS, get_codec
+
+
+def make_response(hits):
+    words = ['单词', '词汇', '检索', '那么', '奶茶店', '全网通', '雨天', '已收到']
+    return {
+        'took': 3,
+        'timed_out': False,
+        'hits': {
+            'total': hits,
+            'max_score': 1.0,
+            'hits': [{
+                '_index': 'fifth',
+                '_type': 'docs',
+                '_id': str(i),
+                '_score': 1.0,
+                '_source': {
+                    'id': i,
+                    'text': ''.join(random.choice(words) for _ in range(10)),
+                    'word': [random.choice(words) for _ in range(3)],
+                    'num': random.randint(0, 999),
+                    'date': datetime(2019, 8, 15, 12, 59, 59).isoformat(),
+                    'has_go': bool(i % 2),
+                    'height': random.random() * 1000,
+                }
+            } for i in range(hits)]
+        }
+    }
+
+
+def timeit(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main(hits=10000, repeat=10):
+    response = make_response(hits)
+    raw = json.dumps(response, ensure_ascii=False)
+    actions = [{'index': {'_index': 'fifth', '_type': 'docs', '_id': h['_id']}} for h in response['hits']['hits']]
+    sources = [h['_source'] for h in response['hits']['hits']]
+    results = {'hits': hits, 'response_bytes': len(raw.encode('utf-8')), 'codecs': {}}
+    for name in sorted(CODECS):
+        codec = get_codec(name)
+        results['codecs'][name] = {
+            'loads_ms': round(timeit(lambda: codec.loads(raw), repeat) * 1000, 3),
+            'dumps_ms': round(timeit(lambda: codec.dumps_bytes(response), repeat) * 1000, 3),
+            'bulk_ndjson_ms': round(timeit(lambda: '\n'.join(
+                codec.dumps(line) for pair in zip(actions, sources) for line in pair), repeat) * 1000, 3),
+        }
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
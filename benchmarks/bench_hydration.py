@@ -0,0 +1,108 @@
+"""
+检索结果转换为文档对象的速度: 当前的Hydrator与之前逐个deepcopy文档对象的方式对比
+之前的方式由LegacyBenchDoc复现: 原来的__getattribute__/__setattr__(eval创建字段对象), 检索语句对象在实例化时创建
+python -m elasticsearch_tool.benchmarks.bench_hydration [hits]
+"""
+import copy
+import json
+import sys
+import time
+from datetime import datetime
+
+from ..base_element import elements
+from ..base_element.elements import BaseDocument, Datetime
+from ..base_element.operate import datetime_tool
+from ..base_element.sql_tools import Sql
+from ..elements.document import Doc, Fields
+from .bench_codec import make_response
+
+
+class BenchDoc(Doc):
+    __indices__ = 'fifth'
+    __types__ = 'docs'
+    __pk__ = 'id'
+
+    text = Fields.String
+    word = Fields.List
+    id = Fields.Integer
+    num = Fields.Integer
+    date = Fields.Datetime
+    has_go = Fields.Boolean
+    height = Fields.Float
+
+
+class LegacyBenchDoc(BenchDoc):
+    """之前的文档类: 每次属性访问都检查p_c_s, 赋值时按类名eval出字段类再创建字段对象"""
+
+    def __init__(self, *args, **kwargs):
+        super(LegacyBenchDoc, self).__init__(*args, **kwargs)
+        # 之前检索语句对象在实例化时创建, deepcopy时会一起拷贝
+        self._query = Sql(self.indices, self.types)
+
+    def __getattribute__(self, item):
+        if item != 'p_c_s' and hasattr(self, 'p_c_s') and item in self.p_c_s:
+            field = super(BaseDocument, self).__getattribute__(item)
+            return field
+        return super(BaseDocument, self).__getattribute__(item)
+
+    def __setattr__(self, key, value):
+        if key != 'p_c_s' and key in self.p_c_s and hasattr(self, key):
+            attr = self.__getattribute__(key)
+
+            if attr._type == datetime:
+                if isinstance(value, datetime):
+                    value = Datetime(value.year, value.month, value.day, value.hour, value.minute, value.second)
+                else:
+                    raise TypeError('Datetime field must be instance of datetime')
+            else:
+                if attr._type == bool:
+                    value = True if value else False
+                value = eval(attr.__class__.__name__, vars(elements))(value)
+            value.set_name(key)
+
+        object.__setattr__(self, key, value)
+
+
+def deepcopy_factory(doc):
+    """之前的转换方式(原ele_factory), 每个结果deepcopy一次检索文档对象, doc为LegacyBenchDoc"""
+    def init_field(fields):
+        doc_obj = copy.deepcopy(doc)
+
+        fields = fields.get('_source', {})
+        for field in doc.p_c_s:
+            value = fields.get(field)
+            if isinstance(doc.__getattribute__(field), datetime):
+                value = datetime_tool(value)
+            doc_obj.__setattr__(field, value)
+        doc._id = fields.get(doc.__pk__)
+        return doc_obj
+
+    return [init_field(doc_) for doc_ in doc.ele_fields]
+
+
+def measure(fn, doc, hits):
+    start = time.perf_counter()
+    result = fn(doc)
+    elapsed = time.perf_counter() - start
+    assert len(result) == hits
+    return round(hits / elapsed)
+
+
+def main(hits=1000):
+    response = make_response(hits)
+    legacy = LegacyBenchDoc()
+    legacy._docs = response
+    doc = BenchDoc()
+    doc._docs = response
+    results = {
+        'hits': hits,
+        'deepcopy_hits_per_sec': measure(deepcopy_factory, legacy, hits),
+        'hydrator_hits_per_sec': measure(lambda d: d._clone(), doc, hits),
+    }
+    results['speedup'] = round(results['hydrator_hits_per_sec'] / results['deepcopy_hits_per_sec'], 1)
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
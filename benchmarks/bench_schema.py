@@ -0,0 +1,39 @@
+"""
+文档对象的创建,字段读取,字段赋值速度
+python -m elasticsearch_tool.benchmarks.bench_schema [repeat]
+"""
+import json
+import sys
+import time
+from datetime import datetime
+
+from .bench_hydration import BenchDoc
+
+
+def ops_per_sec(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return round(repeat / (time.perf_counter() - start))
+
+
+def main(repeat=100000):
+    doc = BenchDoc()
+    now = datetime.now()
+
+    def set_fields():
+        doc.id = 1
+        doc.text = '单词'
+        doc.date = now
+
+    results = {
+        'construct_per_sec': ops_per_sec(BenchDoc, repeat),
+        'get_per_sec': ops_per_sec(lambda: doc.num, repeat),
+        'set_per_sec': ops_per_sec(set_fields, repeat) * 3,
+    }
+    print(json.dumps(results, indent=2))
+    return results
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
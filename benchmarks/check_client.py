@@ -0,0 +1,78 @@
+"""
+使用真实的elasticsearch-py客户端对替身服务(stub_server)发送请求, 检查各接口的参数能被当前版本的客户端接受,
+并且以url参数的形式到达服务器. 内存后端的参数检查与5.5的客户端一致, 这里覆盖实际安装的客户端版本
+python -m elasticsearch_tool.benchmarks.check_client
+"""
+import sys
+
+from ..base_element.template import P
+from ..config import Config
+from .bench_hydration import BenchDoc
+from .stub_server import StubServer
+
+
+def last(server, endpoint):
+    """
+    :return: 最近一次该接口请求的url参数
+    """
+    for method, path, params in reversed(server.recent):
+        if path.rstrip('/').endswith(endpoint):
+            return params
+    raise AssertionError('no %s request sent' % endpoint)
+
+
+def expect(server, endpoint, **params):
+    sent = last(server, endpoint)
+    for k, v in params.items():
+        if sent.get(k) != v:
+            raise AssertionError('%s: expected %s=%s, sent %s' % (endpoint, k, v, sent))
+
+
+def check_count(server):
+    assert BenchDoc().filter(BenchDoc.num > 1).count(approx=True, threshold=5) == 5
+    expect(server, '_count', terminate_after='5')
+    assert BenchDoc().filter(BenchDoc.num > 1).exists()
+    expect(server, '_search', size='0', terminate_after='1')
+
+
+def check_compiled_count(server):
+    tpl = BenchDoc().filter(BenchDoc.num > P('n')).limit(P('size')).compile()
+    server.recent.clear()
+    assert tpl.count(n=1) == 100
+    assert [path for method, path, params in server.recent if path.rstrip('/').endswith('_count')]
+    assert tpl.exists(n=1)
+    expect(server, '_search', size='0', terminate_after='1')
+
+
+def check_update_all(server):
+    BenchDoc().filter(BenchDoc.num > 1).update_all(num=1, slices=2, requests_per_second=100, conflicts='proceed',
+                                                   refresh=True)
+    expect(server, '_update_by_query', slices='2', requests_per_second='100', conflicts='proceed', refresh='true')
+
+
+def check_delete_all(server):
+    task = BenchDoc().filter(BenchDoc.num > 1).delete_all(slices='auto', wait=False)
+    assert task.task_id == 'stub:1'
+    expect(server, '_delete_by_query', slices='auto', wait_for_completion='false')
+
+
+CHECKS = (check_count, check_compiled_count, check_update_all, check_delete_all)
+
+
+def main():
+    failed = 0
+    with StubServer(total=100) as server:
+        Config.set_host('127.0.0.1', server.port)
+        for check in CHECKS:
+            try:
+                check(server)
+                print('ok      %s' % check.__name__)
+            except Exception as e:
+                failed += 1
+                print('FAILED  %s: %s: %s' % (check.__name__, e.__class__.__name__, e))
+    Config.close()
+    return failed
+
+
+if __name__ == '__main__':
+    sys.exit(1 if main() else 0)
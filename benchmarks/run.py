@@ -0,0 +1,139 @@
+"""
+完整的性能测试, 检索相关的部分使用本地的替身服务(stub_server), 结果为json, 可以在不同的提交之间对比
+python -m elasticsearch_tool.benchmarks.run [--output result.json] [--compare old.json] [--quick]
+
+    build_ops_per_sec           生成检索语句(filter/search/order_by + 整理 + 序列化)
+    search_{n}_hits_per_sec     n条结果的检索(请求 + 解析 + 转换为文档对象)
+    count_ops_per_sec           count()
+    save_ops_per_sec            逐个save()
+    bulk_docs_per_sec           bulk_save()
+    *_peak_bytes                单次操作的内存峰值(tracemalloc)
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from ..config import Config
+from ..base_element.operate import OR
+from .bench_hydration import BenchDoc
+from .stub_server import StubServer
+
+PAGES = (10, 1000, 10000)
+
+
+def rate(fn, units=1, min_time=1.0):
+    """
+    重复执行直到超过min_time
+    :return: 每秒处理的数量
+    """
+    fn()
+    count, start = 0, time.perf_counter()
+    while True:
+        fn()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return round(count * units / elapsed, 1)
+
+
+def peak(fn):
+    """单次执行的内存峰值(字节)"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def build_query():
+    doc = BenchDoc().filter(BenchDoc.num > 10, BenchDoc.num <= 500, OR(BenchDoc.has_go == True, BenchDoc.id > 100))
+    return doc.search(text='单词').order_by('-num').limit(20)._query.sql_bytes
+
+
+def new_docs(n):
+    for i in range(n):
+        doc = BenchDoc()
+        doc.id, doc.num, doc.text = i, i % 1000, '单词'
+        yield doc
+
+
+def commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick=False):
+    min_time = 0.2 if quick else 1.0
+    results = {}
+    results['build_ops_per_sec'] = rate(build_query, min_time=min_time)
+    results['build_peak_bytes'] = peak(build_query)
+
+    with StubServer() as server:
+        Config.set_host('127.0.0.1', server.port)
+        for size in PAGES:
+            def search():
+                docs = BenchDoc().filter(BenchDoc.num > 10).limit(size).all()
+                assert len(docs) == size
+            results['search_%d_hits_per_sec' % size] = rate(search, units=size, min_time=min_time)
+            results['search_%d_peak_bytes' % size] = peak(search)
+
+        results['count_ops_per_sec'] = rate(lambda: BenchDoc().filter(BenchDoc.num > 10).count(), min_time=min_time)
+
+        docs = list(new_docs(200))
+        it = iter(docs * 1000)
+        results['save_ops_per_sec'] = rate(lambda: next(it).save(), min_time=min_time)
+        results['save_peak_bytes'] = peak(lambda: docs[0].save())
+
+        n = 2000 if quick else 10000
+        results['bulk_docs_per_sec'] = rate(lambda: BenchDoc.bulk_save(new_docs(n), chunk_size=500),
+                                            units=n, min_time=min_time)
+        results['bulk_%d_peak_bytes' % n] = peak(lambda: BenchDoc.bulk_save(new_docs(n), chunk_size=500))
+        results['stub_requests'] = server.requests
+    Config.close()
+    return results
+
+
+def compare(new, old):
+    """
+    :return: {metric: new / old}, 对于 *_peak_bytes 越小越好, 其他越大越好
+    """
+    return dict((k, round(v / old[k], 3)) for k, v in new.items()
+                if isinstance(v, (int, float)) and old.get(k) and k != 'stub_requests')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='elasticsearch_tool benchmarks')
+    parser.add_argument('--output', help='结果写入文件')
+    parser.add_argument('--compare', help='与之前的结果文件对比')
+    parser.add_argument('--quick', action='store_true', help='缩短每项的测试时间')
+    args = parser.parse_args(argv)
+
+    report = {
+        'commit': commit(),
+        'python': platform.python_version(),
+        'serializer': Config.codec.name,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': run(quick=args.quick),
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report['ratio'] = compare(report['results'], json.load(f)['results'])
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,172 @@
+"""
+本地的elasticsearch替身服务, 用于性能测试, 只实现客户端用到的接口, 返回生成的数据:
+    _search / _count / _msearch / _mget / _bulk / _update_by_query / _delete_by_query
+    /index/type/id 的 GET / PUT / POST / DELETE, /_create, /_update
+最近的请求(方法, 路径, url参数)保存在recent中, 用于检查客户端实际发送的参数
+
+    with StubServer(total=100000, delay=0) as server:
+        Config.set_host('127.0.0.1', server.port)
+"""
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+from .bench_codec import make_response
+
+
+def make_source(i):
+    """默认生成的文档内容, 与bench_codec一致"""
+    source = make_response(1)['hits']['hits'][0]['_source']
+    source['id'] = i
+    return source
+
+
+class StubServer(object):
+    """
+    :param total: 检索命中的总数
+    :param delay: 每个请求的延迟(秒)
+    """
+
+    def __init__(self, total=100000, delay=0.0, host='127.0.0.1', port=0):
+        self.total = total
+        self.delay = delay
+        self.requests = 0
+        self.recent = deque(maxlen=100)
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def host(self):
+        return '%s:%s' % self._server.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def page(self, size):
+        """相同页大小的检索响应只生成一次"""
+        body = self._pages.get(size)
+        if body is None:
+            response = make_response(min(size, self.total))
+            response['hits']['total'] = self.total
+            body = self._pages.setdefault(size, json.dumps(response).encode('utf-8'))
+        return body
+
+    def handle(self, method, path, params, body):
+        """
+        :return: (status, dict 或 已编码的bytes)
+        """
+        parts = [p for p in path.split('/') if p]
+        endpoint = parts[-1] if parts else ''
+        if endpoint == '_search':
+            size = params.get('size')
+            if size is None and body:
+                size = json.loads(body).get('size')
+            return 200, self.page(int(10 if size is None else size))
+        if endpoint == '_count':
+            return 200, {'count': self.total, '_shards': {'total': 1, 'successful': 1, 'failed': 0}}
+        if endpoint == '_msearch':
+            lines = [line for line in body.splitlines() if line.strip()]
+            responses = []
+            for i in range(0, len(lines), 2):
+                search = json.loads(lines[i + 1])
+                responses.append(json.loads(self.page(int(search.get('size', 10)))))
+            return 200, {'responses': responses}
+        if endpoint == '_mget':
+            ids = json.loads(body).get('ids', [])
+            index, doc_type = (parts + ['', ''])[:2]
+            return 200, {'docs': [{'_index': index, '_type': doc_type, '_id': str(i), 'found': True,
+                                   '_source': make_source(i)} for i in ids]}
+        if endpoint == '_bulk':
+            return 200, self.bulk(body)
+        if endpoint in ('_update_by_query', '_delete_by_query'):
+            if params.get('wait_for_completion') == 'false':
+                return 200, {'task': 'stub:1'}
+            done = 'updated' if endpoint == '_update_by_query' else 'deleted'
+            return 200, {'took': 1, 'timed_out': False, 'total': self.total, done: self.total, 'batches': 1,
+                         'version_conflicts': 0, 'noops': 0, 'failures': []}
+        if len(parts) >= 3:
+            return self.document(method, parts, body)
+        return 200, {'name': 'stub', 'version': {'number': '5.6.0'}, 'tagline': 'You Know, for Search'}
+
+    @staticmethod
+    def bulk(body):
+        lines = [line for line in body.splitlines() if line.strip()]
+        items, i = [], 0
+        while i < len(lines):
+            action = json.loads(lines[i])
+            op, meta = next(iter(action.items()))
+            i += 1 if op == 'delete' else 2
+            status = 201 if op in ('index', 'create') else 200
+            items.append({op: {'_index': meta.get('_index'), '_type': meta.get('_type'),
+                               '_id': meta.get('_id', str(i)), '_version': 1,
+                               'result': 'created' if status == 201 else 'updated', 'status': status}})
+        return {'took': 1, 'errors': False, 'items': items}
+
+    @staticmethod
+    def document(method, parts, body):
+        index, doc_type, doc_id = parts[:3]
+        meta = {'_index': index, '_type': doc_type, '_id': doc_id, '_version': 1}
+        if method == 'GET':
+            return 200, dict(meta, found=True, _source=make_source(int(doc_id) if doc_id.isdigit() else 0))
+        if method == 'DELETE':
+            return 200, dict(meta, result='deleted', found=True)
+        if parts[-1] == '_update':
+            return 200, dict(meta, result='updated')
+        return 201, dict(meta, result='created', created=True)
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头和响应体分开发送, 不关闭Nagle时每个请求会多出约40ms的延迟确认
+            disable_nagle_algorithm = True
+
+            def _serve(self):
+                url = urlsplit(self.path)
+                params = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+                length = int(self.headers.get('content-length') or 0)
+                body = self.rfile.read(length).decode('utf-8') if length else ''
+                with stub._lock:
+                    stub.requests += 1
+                    stub.recent.append((self.command, url.path, params))
+                if stub.delay:
+                    time.sleep(stub.delay)
+                status, data = stub.handle(self.command, url.path, params, body)
+                if not isinstance(data, bytes):
+                    data = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('content-type', 'application/json; charset=UTF-8')
+                self.send_header('content-length', str(len(data)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
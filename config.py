@@ -1,6 +1,40 @@
+import asyncio
+import os
+import threading
+import weakref
+
+from elasticsearch import Elasticsearch as ES
+from urllib3 import Timeout
+
+from .base_element.cache import query_cache
+from .base_element.exceptions import UsageError
+from .base_element.serializer import get_codec
+from .base_element.latency import LatencyPolicy
+from .base_element.memory import MemoryElasticsearch, AsyncMemoryElasticsearch
+from .base_element import instrument
+
+try:
+    from elasticsearch_async import AsyncElasticsearch
+except ImportError:
+    AsyncElasticsearch = None
+
+
 class Conf(object):
     inst = None
 
+    # 连接池默认参数
+    TRANSPORT = {
+        'maxsize': 25,              # 每个节点保持的最大连接数
+        'keep_alive': True,         # 是否复用连接
+        'connect_timeout': 5,       # 建立连接超时(秒)
+        'timeout': 10,              # 读取超时(秒)
+        'dead_timeout': 60,         # 节点失败后多久重新尝试(秒), 连续失败时递增
+        'timeout_cutoff': 5,        # 连续失败多少次后不再增加dead_timeout
+        'max_retries': 3,
+        'retry_on_timeout': True,
+        'sniff_on_connection_fail': False,
+    }
+
     def __new__(cls, *args, **kwargs):
         if not cls.inst:
             cls.inst = object.__new__(cls)
@@ -8,6 +42,19 @@ class Conf(object):
 
     def __init__(self):
         self._host = ['localhost:9200']
+        self._use_ssl = False
+        self._transport = dict(self.TRANSPORT)
+        self._codec = get_codec('json')
+        self._latency = None
+        self._slow_log = None
+        self._backend = 'elasticsearch'
+        self._memory = None
+        self._clients = {}
+        # 事件循环 => {key: 异步客户端}, 循环被回收时随之移除
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        # 创建客户端的进程, fork出的子进程不能使用继承来的连接池
+        self._pid = os.getpid()
 
     def set_host(self, host, port=None, use_ssl=False):
         """
@@ -16,15 +63,279 @@ class Conf(object):
             :param use_ssl: if host:port = 443, host on ssl
             :return:
             """
+        old = (self.hosts, self._use_ssl)
         if isinstance(host, (list, tuple)):
-            self._host = [host, use_ssl]
+            self._host = list(host)
         else:
             self._host = '{host}:{port}'.format(host=host, port=port or 9200)
-            print(self.host)
+        self._use_ssl = use_ssl
+        if (self.hosts, self._use_ssl) != old:
+            self.close()
+
+    def set_transport(self, **options):
+        """
+        配置连接池参数, 同一组服务器地址在进程内共享同一个连接池, 线程安全
+        参数改变时关闭已创建的连接池, 之后的请求使用新的参数
+        :param options: maxsize, keep_alive, connect_timeout, timeout, dead_timeout,
+                        timeout_cutoff, max_retries, retry_on_timeout, sniff_on_connection_fail
+        :return:
+        """
+        unknown = set(options) - set(self.TRANSPORT)
+        if unknown:
+            raise ValueError('unknown transport options: %s, choices is %s' % (
+                ', '.join(sorted(unknown)), ', '.join(sorted(self.TRANSPORT))))
+        transport = dict(self._transport, **options)
+        if transport != self._transport:
+            self._transport = transport
+            self.close()
+
+    def set_serializer(self, name):
+        """
+        设置json编解码器, 用于请求体,批量请求和响应的解析
+        :param name: json / orjson / ujson / auto(已安装的最快的编解码器)
+        :return:
+        """
+        codec = get_codec(name)
+        if codec.name != self._codec.name:
+            self._codec = codec
+            self.close()
+
+    @property
+    def codec(self):
+        return self._codec
+
+    def set_latency_policy(self, enabled=True, **options):
+        """
+        检索的尾延迟控制: 对冲请求, 按节点延迟选择节点, 截止时间, 见base_element.latency
+        :param enabled: 为False时关闭
+        :param options: hedge, hedge_percentile, hedge_delay_ms, hedge_min_delay_ms, min_samples,
+                        deadline_ms, ewma_alpha, window, max_workers
+        :return:
+        """
+        old, self._latency = self._latency, LatencyPolicy(**options) if enabled else None
+        # 旧的客户端使用旧策略的连接类, 先关闭客户端再关闭策略
+        self.close()
+        if old is not None:
+            old.close()
+
+    def set_backend(self, name='elasticsearch'):
+        """
+        选择检索后端
+        :param name: elasticsearch / memory(进程内后端, 用于测试和本地开发, 数据在进程内共享, 见base_element.memory)
+        :return:
+        """
+        if name not in ('elasticsearch', 'memory'):
+            raise ValueError('unknown backend: %s, choices is elasticsearch, memory' % name)
+        self._backend = name
+
+    @property
+    def backend(self):
+        return self._backend
+
+    def _memory_client(self):
+        if self._memory is None:
+            with self._lock:
+                if self._memory is None:
+                    self._memory = MemoryElasticsearch(serializer=self._codec)
+        self._memory.serializer = self._codec
+        return self._memory
+
+    @property
+    def latency_policy(self):
+        return self._latency
+
+    @property
+    def latency_stats(self):
+        """对冲次数, 对冲请求先返回的次数, 超时次数, 各节点的延迟"""
+        return self._latency.stats if self._latency is not None else {}
+
+    @staticmethod
+    def set_cache(max_entries=None, ttl=None, max_bytes=None):
+        """
+        配置进程内检索结果缓存, Doc(catch_usual=True)的检索会使用该缓存
+        :param max_entries: 最多缓存的检索数量
+        :param ttl: 过期时间(秒)
+        :param max_bytes: 内存上限(字节)
+        :return:
+        """
+        query_cache.configure(max_entries=max_entries, ttl=ttl, max_bytes=max_bytes)
+
+    @staticmethod
+    def add_listener(listener):
+        """
+        添加检索统计的监听器, 每次Doc操作(all/first/count/exists/save/update/delete)结束时调用 listener(event)
+        内置: instrument.LoggingListener / MetricsListener / SlowQueryLog / OpenTelemetryListener
+        :param listener: 可调用对象
+        :return:
+        """
+        instrument.add_listener(listener)
+
+    @staticmethod
+    def remove_listener(listener):
+        instrument.remove_listener(listener)
+
+    def set_slow_query_log(self, threshold_ms=500, logger=None):
+        """
+        记录超过阈值的操作及其检索语句, 日志名elasticsearch_tool.slow, 级别WARNING
+        :param threshold_ms: 阈值(毫秒), 为None时关闭
+        :param logger: logging.Logger
+        :return:
+        """
+        if self._slow_log is not None:
+            instrument.remove_listener(self._slow_log)
+        self._slow_log = None if threshold_ms is None else instrument.SlowQueryLog(threshold_ms, logger)
+        if self._slow_log is not None:
+            instrument.add_listener(self._slow_log)
+
+    @property
+    def cache_stats(self):
+        return query_cache.stats
 
     @property
     def host(self):
         return self._host
 
+    @property
+    def hosts(self):
+        if isinstance(self._host, str):
+            return [self._host]
+        return list(self._host)
+
+    @property
+    def transport(self):
+        return dict(self._transport)
+
+    def _client_kwargs(self, opts):
+        kwargs = {
+            'use_ssl': self._use_ssl,
+            'maxsize': opts['maxsize'],
+            'timeout': Timeout(connect=opts['connect_timeout'], read=opts['timeout']),
+            'dead_timeout': opts['dead_timeout'],
+            'timeout_cutoff': opts['timeout_cutoff'],
+            'max_retries': opts['max_retries'],
+            'retry_on_timeout': opts['retry_on_timeout'],
+            'sniff_on_connection_fail': opts['sniff_on_connection_fail'],
+            'serializer': self._codec,
+        }
+        if not opts['keep_alive']:
+            kwargs['headers'] = {'connection': 'close'}
+        if self._latency is not None:
+            kwargs['connection_class'] = self._latency.connection_class
+            kwargs['selector_class'] = self._latency.selector_class
+        return kwargs
+
+    def get_es(self):
+        """
+        获取当前配置对应的共享客户端, 相同的服务器地址和连接参数只会创建一个连接池
+        :return: Elasticsearch
+        """
+        if self._backend == 'memory':
+            return self._memory_client()
+        self._check_fork()
+        key = (tuple(self.hosts), self._use_ssl, tuple(sorted(self._transport.items())), self._codec.name,
+               self._latency)
+        client = self._clients.get(key)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = ES(self.hosts, **self._client_kwargs(self._transport))
+                    self._clients[key] = client
+        return client
+
+    def get_async_es(self):
+        """
+        获取当前事件循环下的共享异步客户端, 依赖elasticsearch_async(pip install elasticsearch-async)
+        异步客户端与事件循环绑定, 所以每个事件循环单独创建一个
+        :return: AsyncElasticsearch
+        """
+        if self._backend == 'memory':
+            return AsyncMemoryElasticsearch(self._memory_client())
+        if AsyncElasticsearch is None:
+            raise UsageError('异步接口需要安装elasticsearch-async。'
+                             'AsyncDoc requires elasticsearch-async, pip install elasticsearch-async')
+        loop = asyncio.get_event_loop()
+        self._check_fork()
+        self._drop_closed_loops()
+        key = (tuple(self.hosts), self._use_ssl, tuple(sorted(self._transport.items())), self._codec.name)
+        client = self._async_clients.get(loop, {}).get(key)
+        if client is None:
+            with self._lock:
+                clients = self._async_clients.setdefault(loop, {})
+                client = clients.get(key)
+                if client is None:
+                    opts = self._transport
+                    client = AsyncElasticsearch(self.hosts, loop=loop, use_ssl=self._use_ssl,
+                                                timeout=opts['timeout'], dead_timeout=opts['dead_timeout'],
+                                                timeout_cutoff=opts['timeout_cutoff'],
+                                                max_retries=opts['max_retries'],
+                                                retry_on_timeout=opts['retry_on_timeout'],
+                                                serializer=self._codec)
+                    clients[key] = client
+        return client
+
+    def _check_fork(self):
+        """
+        连接池不能跨进程共享, fork出的子进程丢弃继承来的客户端, 创建自己的连接池
+        关闭继承的连接只释放子进程中的文件描述符, 不影响父进程; 异步客户端的事件循环不在子进程中运行, 直接丢弃
+        锁可能在fork时被父进程的其他线程持有, 子进程中重新创建
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._lock = threading.Lock()
+        self._pid = pid
+        clients, self._clients = self._clients, {}
+        self._async_clients = weakref.WeakKeyDictionary()
+        for client in clients.values():
+            client.transport.close()
+
+    def _drop_closed_loops(self):
+        """
+        移除已关闭的事件循环的客户端, 客户端引用着事件循环, 不移除的话循环和连接都不会被回收
+        循环关闭后其连接已不可用, 也无法再在该循环中关闭, 直接丢弃
+        """
+        closed = [loop for loop in list(self._async_clients.keys()) if loop.is_closed()]
+        if closed:
+            with self._lock:
+                for loop in closed:
+                    self._async_clients.pop(loop, None)
+
+    @staticmethod
+    def _close_async(loop, client):
+        """
+        在客户端所属的事件循环中关闭连接
+        :param loop: 创建客户端时的事件循环
+        :param client: AsyncElasticsearch
+        """
+        if loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            loop.create_task(client.transport.close())
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.transport.close(), loop)
+        else:
+            loop.run_until_complete(client.transport.close())
+
+    def close(self):
+        """
+        关闭所有连接池, 异步客户端在其事件循环中关闭(在该循环中调用时关闭任务会在下次调度时执行),
+        所属循环已关闭的直接丢弃
+        修改服务器地址/连接池参数/编解码器/延迟策略时自动调用, 旧配置的客户端不再使用
+        """
+        self._check_fork()
+        with self._lock:
+            clients, self._clients = self._clients, {}
+            loops, self._async_clients = list(self._async_clients.items()), weakref.WeakKeyDictionary()
+        for client in clients.values():
+            client.transport.close()
+        for loop, async_clients in loops:
+            for client in async_clients.values():
+                self._close_async(loop, client)
+
 
 Config = Conf()
@@ -0,0 +1,144 @@
+import asyncio
+
+from ..base_element.aggs import AggResult
+from ..base_element.async_tools import AsyncSql
+from ..base_element.elements import Hydrator
+from ..base_element.exceptions import UsageError
+from ..base_element.instrument import instrumented
+from .document import Doc
+
+
+def _sync_only(name, bound_to_class=False):
+    """
+    Doc中发送同步请求的方法, 在AsyncDoc中调用会阻塞事件循环, 改为抛出UsageError
+    :param name: 方法名
+    :param bound_to_class: 是否为classmethod
+    """
+    def method(*args, **kwargs):
+        raise UsageError('AsyncDoc不支持%s(), 该方法发送同步请求, 会阻塞事件循环, 请使用Doc(可在线程中执行)。'
+                         'AsyncDoc.%s() would send synchronous requests and block the event loop, '
+                         'use Doc instead, e.g. in loop.run_in_executor()' % (name, name))
+    method.__name__ = name
+    return classmethod(method) if bound_to_class else method
+
+
+class AsyncDoc(Doc):
+    """
+    异步文档类, 定义方式与Doc完全一致, 检索条件的拼接方法(filter/search/get/order_by/limit...)不变,
+    只有与服务器交互的方法需要await
+
+    class Document(AsyncDoc):
+        __indices__ = 'my_project'
+        __pk__ = 'id'
+        id = Fields.Integer
+
+    docs = await Document().filter(Document.id > 10).all()
+    docs = await Document(catch_usual=True).filter(Document.id > 10).all()    # 与Doc共用进程内缓存
+    async for doc in Document().search(q='单词'):
+        ...
+
+    get_many/aggregate同样需要await, 其他发送请求的方法(iter/parallel_scan/update_all/bulk_save...)
+    没有异步版本, 调用时抛出UsageError, 请使用Doc
+    """
+
+    _sql_class = AsyncSql
+
+    async def _work(self):
+        self._docs = await self._query.search(use_cache=self.catch_usual)
+        self._had_request = True
+        return self._clone()
+
+    @instrumented('first')
+    async def first(self):
+        self._query.query_params.update({'size': 1, 'from_': 0})
+        result = await self._work()
+        return result[0] if result else None
+
+    @instrumented('all')
+    async def all(self):
+        return await self._work()
+
+    @instrumented('count')
+    async def count(self, approx=False, threshold=10000):
+        return await self._query.check_count(self.__pk__, use_cache=self.catch_usual, approx=approx, threshold=threshold)
+
+    @instrumented('exists')
+    async def exists(self):
+        return await self._query.check_exists(self.__pk__, use_cache=self.catch_usual)
+
+    async def get_many(self, ids, chunk_size=1000, workers=None, realtime=True):
+        """
+        与Doc.get_many一致, workers为同时进行的请求数量
+        """
+        chunks = self._id_chunks(ids, chunk_size)
+        if workers and len(chunks) > 1:
+            semaphore = asyncio.Semaphore(workers)
+
+            async def fetch(chunk):
+                async with semaphore:
+                    return await self._query.mget(chunk, realtime=realtime)
+            results = await asyncio.gather(*(fetch(chunk) for chunk in chunks))
+        else:
+            results = [await self._query.mget(chunk, realtime=realtime) for chunk in chunks]
+        return self._hydrate_found(results)
+
+    async def aggregate(self, **aggs):
+        """
+        与Doc.aggregate一致
+        """
+        raw = await self._query.aggregate(self._aggs_body(aggs), use_cache=self.catch_usual)
+        return AggResult((name, agg.parse(raw.get(name, {}))) for name, agg in aggs.items())
+
+    async def _buffered(self, method, *args, **kwargs):
+        """
+        写入缓冲(Doc.buffered())中的save/update/delete, 缓冲满时会阻塞等待, 所以在线程中放入
+        :return: asyncio.Future, await得到该文档的bulk结果
+        """
+        future = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: getattr(self._write_buffer, method)(self, *args, **kwargs))
+        return asyncio.wrap_future(future)
+
+    @instrumented('save')
+    async def save(self):
+        if self._write_buffer is not None:
+            return await self._buffered('save')
+        if self._had_request:
+            return await self._query.put(self, True)
+        return await self._query.post(self)
+
+    @instrumented('update')
+    async def update(self, **key_words):
+        if self._write_buffer is not None:
+            return await self._buffered('update', **key_words)
+        return await self._query.put(self, g=False, body={"doc": Hydrator.of(self.__class__).encode(key_words)})
+
+    @instrumented('delete')
+    async def delete(self):
+        if self._write_buffer is not None:
+            return await self._buffered('delete')
+        return await self._query.delete(self)
+
+    iter = _sync_only('iter')
+    iter_buckets = _sync_only('iter_buckets')
+    to_columns = _sync_only('to_columns')
+    iter_columns = _sync_only('iter_columns')
+    parallel_scan = _sync_only('parallel_scan')
+    profile = _sync_only('profile')
+    explain = _sync_only('explain')
+    compile = _sync_only('compile')
+    update_all = _sync_only('update_all')
+    delete_all = _sync_only('delete_all')
+    batch = _sync_only('batch', bound_to_class=True)
+    create_index = _sync_only('create_index', bound_to_class=True)
+    bulk_load = _sync_only('bulk_load', bound_to_class=True)
+    bulk_save = _sync_only('bulk_save', bound_to_class=True)
+    bulk_update = _sync_only('bulk_update', bound_to_class=True)
+    bulk_delete = _sync_only('bulk_delete', bound_to_class=True)
+
+    async def __aiter__(self):
+        for doc in await self._work():
+            yield doc
+
+    def __bool__(self):
+        raise UsageError('异步文档不能直接判断真假, 请使用 await doc.exists()。'
+                         'Use await AsyncDoc.exists() instead of bool(AsyncDoc)')
@@ -0,0 +1,112 @@
+"""
+多个检索合并为一次_msearch请求
+"""
+from ..base_element.exceptions import UsageError, ServerError
+from ..base_element.sql_tools import hits_total
+
+
+class Deferred(object):
+    """
+    批量检索中的一条检索结果, 批量请求执行后才能获取 result
+    """
+
+    def __init__(self, doc, method):
+        self._doc = doc
+        self._method = method
+        self._done = False
+        self._result = None
+        self._error = None
+
+    def resolve(self, response):
+        """
+        根据_msearch中对应的响应设置结果, 转换方式与单条检索一致
+        :param response: 单条检索的响应
+        :return:
+        """
+        self._done = True
+        if response.get('error'):
+            self._error = response['error']
+        elif self._method == 'count':
+            self._result = hits_total(response)
+        elif self._method == 'exists':
+            self._result = bool(hits_total(response))
+        else:
+            result = self._doc._hydrate(response['hits']['hits'])
+            if self._method == 'first':
+                result = result[0] if result else None
+            self._result = result
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def result(self):
+        if not self._done:
+            raise UsageError('批量检索尚未执行。The batch has not been executed yet, '
+                             'read result after leaving the with block or calling execute()')
+        if self._error is not None:
+            raise ServerError('检索失败。Search failed: %s' % self._error)
+        return self._result
+
+
+class Batch(object):
+    """
+    with Doc.batch() as b:
+        r1 = b.all(Doc().filter(...))
+        r2 = b.count(Doc().search(...))
+    r1.result, r2.result
+    """
+    METHODS = ('all', 'first', 'count', 'exists')
+
+    def __init__(self, chunk_size=50):
+        self.chunk_size = chunk_size
+        self._pending = []
+
+    def add(self, doc, method='all'):
+        """
+        添加一条检索, 检索条件在添加时生成, 之后对doc的修改不影响该检索
+        :param doc: 拼接好检索条件的文档对象
+        :param method: all / first / count / exists
+        :return: Deferred
+        """
+        if method not in self.METHODS:
+            raise ValueError('argument method must be one of %s' % ', '.join(self.METHODS))
+        entry = doc._query.msearch_entry(method)
+        deferred = Deferred(doc, method)
+        self._pending.append((entry, deferred))
+        return deferred
+
+    def all(self, doc):
+        return self.add(doc, 'all')
+
+    def first(self, doc):
+        return self.add(doc, 'first')
+
+    def count(self, doc):
+        return self.add(doc, 'count')
+
+    def exists(self, doc):
+        return self.add(doc, 'exists')
+
+    def execute(self):
+        """
+        发送所有未执行的检索
+        :return:
+        """
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        entries = [entry for entry, _ in pending]
+        responses = pending[0][1]._doc._query.msearch(entries, chunk_size=self.chunk_size)
+        for (_, deferred), response in zip(pending, responses):
+            deferred.resolve(response)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.execute()
+        else:
+            self._pending = []
@@ -0,0 +1,198 @@
+"""
+写入缓冲, save()/update()/delete()进入进程内的缓冲队列, 由后台线程按数量/字节/时间分批, 每批一次_bulk请求发送
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from elasticsearch.helpers import expand_action
+
+from ..base_element.exceptions import UsageError, ServerError
+from ..base_element.sql_tools import Sql, EMPTY
+from ..base_element.elements import Hydrator
+from ..config import Config
+
+_STOP = object()
+
+
+class _Entry(object):
+    """
+    进入缓冲时即序列化为_bulk的操作行和文档行, 发送时直接拼接, 不再序列化
+    size按字符数计算, 与_bulk分批时的计算方式一致
+    """
+    __slots__ = ('index', 'lines', 'size', 'future')
+
+    def __init__(self, action):
+        header, source = expand_action(action)
+        self.index = action['_index']
+        self.lines = [Config.codec.dumps(header)]
+        if source is not None:
+            self.lines.append(Config.codec.dumps(source))
+        self.size = sum(len(line) + 1 for line in self.lines)
+        self.future = Future()
+
+
+class _Flush(object):
+    __slots__ = ('event', )
+
+    def __init__(self):
+        self.event = threading.Event()
+
+
+class WriteBuffer(object):
+    """
+    with Doc.buffered(max_docs=500, max_bytes=5 * 1024 * 1024, max_latency_ms=200):
+        future = Doc(...).save()        # 不等待请求, 返回Future
+    离开with时发送剩余的文档, future.result() 为_bulk中该文档的结果, 失败时抛出ServerError
+    """
+
+    def __init__(self, doc_cls, max_docs=500, max_bytes=5 * 1024 * 1024, max_latency_ms=1000, max_pending=10000,
+                 put_timeout=None):
+        """
+        :param doc_cls: 文档类
+        :param max_docs: 每批最多文档数
+        :param max_bytes: 每批最大字节数
+        :param max_latency_ms: 文档在缓冲中最长等待时间(毫秒), 到时即使未满也发送
+        :param max_pending: 缓冲中最多等待发送的文档数, 满时save()阻塞(背压)
+        :param put_timeout: 缓冲满时最长阻塞时间(秒), 为None则一直等待, 超时抛出ServerError
+        """
+        if max_docs < 1 or max_bytes < 1 or max_latency_ms < 0:
+            raise ValueError('max_docs/max_bytes must be positive and max_latency_ms must not be negative')
+        self.doc_cls = doc_cls
+        self.max_docs = max_docs
+        self.max_bytes = max_bytes
+        self.max_latency = max_latency_ms / 1000.0
+        self.put_timeout = put_timeout
+        self._sql = Sql(None, None)
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._previous = _STOP
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='%s-write-buffer' % doc_cls.__name__, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        if self._closed:
+            raise UsageError('写入缓冲已关闭。The write buffer is closed')
+        try:
+            self._queue.put(item, timeout=self.put_timeout)
+        except queue.Full:
+            raise ServerError('写入缓冲已满。The write buffer is full, %d documents pending' % self._queue.maxsize)
+
+    def add(self, action):
+        """
+        :param action: bulk操作
+        :return: Future
+        """
+        entry = _Entry(action)
+        self._put(entry)
+        return entry.future
+
+    def save(self, doc):
+        op_type = 'index' if doc._had_request or doc.get_pk() in EMPTY else 'create'
+        return self.add(Sql.doc_action(doc, op_type))
+
+    def update(self, doc, **key_words):
+        pk = doc.get_pk()
+        if pk in EMPTY:
+            raise ValueError('id must be not empty value!')
+        return self.add({'_op_type': 'update', '_index': doc.indices, '_type': doc.types, '_id': pk,
+                         'doc': Hydrator.of(doc.__class__).encode(key_words)})
+
+    def delete(self, doc):
+        return self.add(Sql.doc_action(doc, 'delete'))
+
+    def flush(self, timeout=None):
+        """
+        等待在此之前进入缓冲的文档全部发送完成
+        :param timeout: 最长等待时间(秒)
+        :return: 是否在timeout内完成
+        """
+        marker = _Flush()
+        self._put(marker)
+        return marker.event.wait(timeout)
+
+    def close(self):
+        """发送剩余的文档并停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _send(self, batch):
+        if not batch:
+            return
+        lines = [line for entry in batch for line in entry.lines]
+        try:
+            resp = self._sql.bulk_lines(lines, set(entry.index for entry in batch))
+        except Exception as e:
+            for entry in batch:
+                entry.future.set_exception(e)
+            return
+        for entry, item in zip(batch, resp['items']):
+            op_type, info = next(iter(item.items()))
+            if 200 <= info.get('status', 500) < 300:
+                entry.future.set_result({op_type: info})
+            else:
+                entry.future.set_exception(ServerError('写入失败。Bulk write failed: %s' % ({op_type: info}, )))
+
+    def _drain(self):
+        """关闭后发送队列中剩余的文档"""
+        batch = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, _Entry):
+                batch.append(item)
+                if len(batch) >= self.max_docs:
+                    self._send(batch)
+                    batch = []
+            elif isinstance(item, _Flush):
+                item.event.set()
+        self._send(batch)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return self._drain()
+            if isinstance(item, _Flush):
+                item.event.set()
+                continue
+            batch, size = [item], item.size
+            deadline = time.monotonic() + self.max_latency
+            marker = None
+            while len(batch) < self.max_docs and size < self.max_bytes:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if not isinstance(item, _Entry):
+                    marker = item
+                    break
+                batch.append(item)
+                size += item.size
+            self._send(batch)
+            if marker is _STOP:
+                return self._drain()
+            if marker is not None:
+                marker.event.set()
+
+    def __enter__(self):
+        # 只对该文档类(及其子类)生效, 离开时恢复之前的状态
+        self._previous = self.doc_cls.__dict__.get('_write_buffer', _STOP)
+        self.doc_cls._write_buffer = self
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._previous is _STOP:
+            del self.doc_cls._write_buffer
+        else:
+            self.doc_cls._write_buffer = self._previous
+        self.close()
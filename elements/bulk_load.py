@@ -0,0 +1,55 @@
+"""
+全量写入模式: 写入期间关闭自动刷新和副本, 结束后恢复设置, 刷新并可选地合并段
+    with Doc.bulk_load(forcemerge=True):
+        Doc.bulk_save(docs)
+"""
+from ..base_element.mapping import build_index_body
+
+LOAD_SETTINGS = ('refresh_interval', 'number_of_replicas')
+
+
+class BulkLoad(object):
+    """
+    进入时: 索引不存在则按字段声明创建, 记录原来的refresh_interval/number_of_replicas, 设置为 -1 / 0
+    离开时: 恢复原来的设置(原来未设置的恢复为服务器默认值), 刷新索引, forcemerge=True且没有异常时合并段
+    """
+
+    def __init__(self, doc_cls, forcemerge=False, max_num_segments=1, refresh_interval='-1', replicas=0):
+        """
+        :param doc_cls: 文档类
+        :param forcemerge: 结束后是否合并段
+        :param max_num_segments: 合并后每个分片的段数
+        :param refresh_interval: 写入期间的刷新间隔, -1 为不刷新
+        :param replicas: 写入期间的副本数
+        """
+        self.doc_cls = doc_cls
+        self.forcemerge = forcemerge
+        self.max_num_segments = max_num_segments
+        self.load_settings = {'refresh_interval': refresh_interval, 'number_of_replicas': replicas}
+        self.original = {}
+        self.created = False
+
+    def _sql(self):
+        return self.doc_cls()._query
+
+    def __enter__(self):
+        sql = self._sql()
+        if not sql.index_exists():
+            sql.create_index(build_index_body(self.doc_cls))
+            self.created = True
+        for index, data in sql.index_settings().items():
+            settings = data.get('settings', {}).get('index', {})
+            # 未设置的项恢复时为None, 即服务器默认值
+            self.original[index] = dict((name, settings.get(name)) for name in LOAD_SETTINGS)
+        sql.put_settings({'index': self.load_settings})
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        sql = self._sql()
+        for index, settings in self.original.items():
+            sql.indices = index
+            sql.put_settings({'index': settings})
+        sql = self._sql()
+        sql.refresh()
+        if self.forcemerge and exc_type is None:
+            sql.forcemerge(self.max_num_segments)
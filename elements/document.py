@@ -1,8 +1,21 @@
 import copy
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
-from ..base_element.elements import BaseDocument, BaseEle, EleFactory, Factory, ClassOperate
-from ..base_element.sql_tools import Sql, format_name_to_normal
+from ..base_element.elements import BaseDocument, EleFactory, Factory, ClassOperate, Hydrator
+from ..base_element.sql_tools import Sql
 from ..base_element.exceptions import ParamsError, UsageError
+from ..base_element.template import CompiledQuery
+from ..base_element.columns import ColumnBuilder
+from ..base_element.aggs import Agg, AggResult, Composite
+from ..base_element.tasks import Task
+from ..base_element.instrument import instrumented, phase
+from ..base_element.mapping import build_index_body
+from .batch import Batch
+from .buffer import WriteBuffer
+from .bulk_load import BulkLoad
 
 
 class Doc(BaseDocument, metaclass=ClassOperate):
@@ -14,6 +27,10 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         __indices__ = 'my_project'          like database name
         __types__ = 'my_model'              like table name
         __pk__ = 'id'                       your pk field name
+        __datetime_formats__ = {'date': 'epoch_millis'}     Datetime fields format, iso-8601 if not declared
+        __field_options__ = {'text': {'keyword': 'raw'}}    mapping options, see base_element.mapping
+        __shards__ = 3                      number_of_shards when creating index
+        __replicas__ = 1                    number_of_replicas when creating index
         id = Ele(type_=Ele.Integer)         your fields
         text = Ele(type_=Ele.String)
         date = Ele(type_=Ele.Datetime)
@@ -23,38 +40,50 @@ class Doc(BaseDocument, metaclass=ClassOperate):
     __indices__ = None
     __types__ = None
     __pk__ = 'id'
+    __datetime_formats__ = {}
+    __field_options__ = {}
+    __shards__ = None
+    __replicas__ = None
+    _sql_class = Sql
+    _write_buffer = None
 
     def __init__(self, catch_usual=False, *args, **kwargs):
+        """
+        :param catch_usual: 是否使用进程内的检索结果缓存(all/first/count/exists), 缓存参数见Config.set_cache()
+        """
 
-        self.p_c_s = []
-        self.catch_usual = catch_usual
-        self._docs = {}
-        self._p_f_map = {}
-        self._had_request = False
-        self._use_catch = True
-        self._wanted = []
-        if not self.__types__:
-            self.__types__ = self.__class__.__name__
-        self.indices = format_name_to_normal(self.__indices__)
-        self.types = format_name_to_normal(self.__types__)
-
-        self._query = Sql(self.indices, self.types)
-        self._id = None
-
-        self._limit = None
-        self._offset = None
-
-        self._catch = {}
-        self._copy = None
-        all_c = set(dir(self))^set(dir(object))
-        for c in all_c:
-            if c in self.__dict__.keys():
-                continue
-            attr = self.__getattribute__(c)
-            if isinstance(attr, BaseEle):
-                self.p_c_s.append(c)
-        if self.__pk__ not in self.p_c_s:
+        schema = self.__schema__
+        if not schema.has_pk:
             raise ParamsError('文档必须有一个主键字段！！Document obj must declare id/pk(name = __pk__)')
+        if schema.indices is None:
+            raise ParamsError('文档必须声明索引！！Document obj must declare __indices__')
+        self.__dict__.update(
+            p_c_s=schema.fields,
+            catch_usual=catch_usual,
+            _docs={},
+            _p_f_map={},
+            _had_request=False,
+            _wanted=[],
+            indices=schema.indices,
+            types=schema.types,
+            _id=None,
+            _limit=None,
+            _offset=None,
+            _copy=None,
+        )
+
+    @property
+    def _query(self):
+        """检索语句对象, 第一次使用时创建, 检索结果对象大多用不到"""
+        sql = self.__dict__.get('_sql')
+        if sql is None:
+            schema = self.__schema__
+            sql = self.__dict__['_sql'] = self._sql_class(self.indices, self.types, schema.field_types, schema.codecs)
+        return sql
+
+    @_query.setter
+    def _query(self, value):
+        self.__dict__['_sql'] = value
 
     def order_by(self, *args):
         """
@@ -85,6 +114,7 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         option = {'or': 'should'}.get(op, 'must')
         for k, v in key_words.items():
             self._query.match(k, v, op=option)
+        self._query.note('search', key_words)
         return self
 
     def with_raw(self, body):
@@ -112,6 +142,7 @@ class Doc(BaseDocument, metaclass=ClassOperate):
                 self._query.range(None, 'or', condition)
             else:
                 self._query.range(*condition.params)
+            self._query.note('filter', condition)
         return self
 
     def get(self, match=100, op=None, **key_words):
@@ -126,7 +157,7 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         option = {'or': 'should'}.get(op, 'must')
         for k, v in key_words.items():
             self._query.match_phrase(k, v, op=option, match=match)
-
+        self._query.note('get', key_words if match == 100 else dict(key_words, match=match))
         return self
 
     def limit(self, num):
@@ -151,12 +182,15 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         self._query.query_params['from_'] = num
         return self
 
-    def count(self):
+    @instrumented('count')
+    def count(self, approx=False, threshold=10000):
         """
         计数方法，符合条件的文档数量
+        :param approx: 近似计数, 数到threshold即停止, 结果最大为threshold(表示至少有这么多)
+        :param threshold: 近似计数的上限
         :return:
         """
-        return self._query.check_count(self.__pk__)
+        return self._query.check_count(self.__pk__, use_cache=self.catch_usual, approx=approx, threshold=threshold)
 
     def values(self, *args):
         """
@@ -173,13 +207,15 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         self._wanted.extend(args)
         return self
 
+    @instrumented('exists')
     def exists(self):
         """
         轨迹方法，符合条件的文档是否存在
         :return: bool
         """
-        return self._query.check_exists(self.__pk__)
+        return self._query.check_exists(self.__pk__, use_cache=self.catch_usual)
 
+    @instrumented('first')
     def first(self):
         """
         获取第一个
@@ -189,6 +225,7 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         result = self.__work()
         return result[0] if result else None
 
+    @instrumented('all')
     def all(self):
         """
         获取所有
@@ -196,12 +233,259 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         """
         return self.__work()
 
+    def aggregate(self, **aggs):
+        """
+        聚合统计, 与filter()/search()/get()的条件组合使用, 统计在服务器上完成, 不返回文档
+        Doc().filter(...).aggregate(by_day=DateHistogram('date', '1d').aggs(total=Sum('num')),
+                                    top=Terms('word', size=20))
+        :param aggs: name=Agg
+        :return: AggResult {name: 结果}, 分组聚合的结果为 [{'key': .., 'doc_count': .., 子聚合名: ..}, ...]
+        """
+        raw = self._query.aggregate(self._aggs_body(aggs), use_cache=self.catch_usual)
+        return AggResult((name, agg.parse(raw.get(name, {}))) for name, agg in aggs.items())
+
+    @staticmethod
+    def _aggs_body(aggs):
+        """
+        :param aggs: name=Agg
+        :return: 请求中的aggs {name: agg_body}
+        """
+        if not aggs:
+            raise ParamsError('aggregate() requires at least one aggregation')
+        for name, agg in aggs.items():
+            if not isinstance(agg, Agg):
+                raise TypeError('aggregation %s must be instance of Agg' % name)
+        return {name: agg.to_dict() for name, agg in aggs.items()}
+
+    def iter_buckets(self, composite):
+        """
+        分页获取组合分组(Composite)的所有分组
+        for bucket in Doc().filter(...).iter_buckets(Composite(day=DateHistogram('date', '1d'), size=1000)):
+            ...
+        :param composite: Composite
+        :return: generator of bucket
+        """
+        if not isinstance(composite, Composite):
+            raise TypeError('iter_buckets() accepted Composite')
+        body = self._query.build_body()
+        # 翻页位置只保存在这里, 不修改传入的composite, 同一个Composite可以重复/同时使用
+        after = composite.after
+        while True:
+            request = composite.to_dict()
+            if after is not None:
+                request[composite.type]['after'] = after
+            raw = self._query.aggregate({'composite': request}, body=body)
+            page = composite.parse(raw.get('composite', {}))
+            for bucket in page['buckets']:
+                yield bucket
+            if not page['buckets'] or not page['after_key']:
+                break
+            after = page['after_key']
+
+    def _column_builder(self, fields):
+        for field in fields:
+            if field not in self.p_c_s:
+                raise ValueError('no field named %s, choices is %s' % (field, self.p_c_s))
+        fields = list(fields or self.p_c_s)
+        self._query.query_params['_source'] = ','.join(fields)
+        return ColumnBuilder(Hydrator.of(self.__class__), fields)
+
+    def to_columns(self, *fields):
+        """
+        按列获取结果, 不创建文档对象, 每个字段一个numpy.ma.MaskedArray(空值被mask), 需要安装numpy
+        数组类型由字段类型决定: Integer=>int64, Float=>float64, Datetime=>datetime64[ms], Boolean=>bool,
+        String/List=>object
+        分页与all()一致, 获取全部结果请使用iter_columns()
+        :param fields: 字段名, 为空则获取所有字段
+        :return: {field: array}
+        """
+        builder = self._column_builder(fields)
+        self._had_request = True
+        result = self._query.search(use_cache=self.catch_usual)
+        return builder.build(result['hits']['hits'])
+
+    def iter_columns(self, *fields, chunk_size=10000, keep_alive='1m'):
+        """
+        逐批按列获取全部结果, 遍历方式与iter()一致
+        :param fields: 字段名, 为空则获取所有字段
+        :param chunk_size: 每批的文档数量
+        :param keep_alive: 服务器保持游标的时间
+        :return: generator of {field: array}
+        """
+        builder = self._column_builder(fields)
+        chunks = self._query.scan(self.__pk__, chunk_size=chunk_size, keep_alive=keep_alive)
+        try:
+            for hits in chunks:
+                yield builder.build(hits)
+        finally:
+            chunks.close()
+
+    def get_many(self, ids, chunk_size=1000, workers=None, realtime=True):
+        """
+        根据主键批量获取文档, 使用_mget接口, 比filter(Doc.id.in_([...]))更快且是实时的
+        可配合values()仅获取部分字段
+        :param ids: 主键列表
+        :param chunk_size: 每次请求的主键数量
+        :param workers: 并行请求数量, 为空时逐批请求
+        :param realtime: 是否实时获取(不等待refresh)
+        :return: 与ids顺序一致的文档列表, 不存在的文档为None
+        """
+        chunks = self._id_chunks(ids, chunk_size)
+
+        def fetch(chunk):
+            return self._query.mget(chunk, realtime=realtime)
+
+        if workers and len(chunks) > 1:
+            with ThreadPoolExecutor(workers) as pool:
+                results = list(pool.map(fetch, chunks))
+        else:
+            results = [fetch(chunk) for chunk in chunks]
+        return self._hydrate_found(results)
+
+    @staticmethod
+    def _id_chunks(ids, chunk_size):
+        ids = list(ids)
+        return [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+    def _hydrate_found(self, results):
+        """
+        :param results: 各批_mget的docs
+        :return: 与请求顺序一致的文档列表, 不存在的文档为None
+        """
+        self._query.query_params = {}
+        docs = [doc for result in results for doc in result]
+        hydrated = iter(self._hydrate([doc for doc in docs if doc.get('found')]))
+        return [next(hydrated) if doc.get('found') else None for doc in docs]
+
+    @instrumented('profile')
+    def profile(self):
+        """
+        使用 profile: true 执行当前检索, 分析各检索条件在每个分片上的耗时, 不返回文档
+        result = Doc().filter(Doc.num > 1).search(text='单词').profile()
+        print(result)                   # 各分片的耗时树, 每个子句标注来自哪个 filter()/search()/get()
+        result.by_origin()              # {"search(text='单词')": 2.1, 'filter(num > 1)': 0.8} 毫秒
+        result.slowest(3)               # 自身耗时最多的子句
+        :return: ProfileResult
+        """
+        return self._query.profile()
+
+    def explain(self, pk):
+        """
+        文档在当前检索条件下是否符合以及得分的计算过程
+        print(Doc().search(text='单词').explain(10))
+        :param pk: 文档主键
+        :return: Explanation, matched/value/description/details
+        """
+        return self._query.explain(pk)
+
+    def compile(self, server=False):
+        """
+        将当前的检索条件编译为可重复使用的检索模板, 条件中的值可以使用占位符P, 执行时再传入
+        tpl = Doc().filter(Doc.age > P('min_age')).limit(P('size')).compile()
+        tpl.all(min_age=30, size=10)
+        :param server: 为True时使用服务器端检索模板(search template), 参数由服务器替换
+        :return: CompiledQuery, 支持 all/first/count/exists
+        """
+        return CompiledQuery(self, server=server)
+
+    def iter(self, chunk_size=1000, keep_alive='1m'):
+        """
+        逐批获取所有结果, 内存中只保留一批文档, 不受分页深度限制
+        for doc in Doc().filter(...).order_by('date').iter(chunk_size=500):
+            ...
+        排序沿用order_by(), 并自动以主键作为最后的排序字段, 中途break或关闭生成器时会释放服务器上的游标
+        :param chunk_size: 每次请求的文档数量
+        :param keep_alive: 服务器保持游标的时间
+        :return: generator of Doc
+        """
+        chunks = self._query.scan(self.__pk__, chunk_size=chunk_size, keep_alive=keep_alive)
+        try:
+            for hits in chunks:
+                for doc in self._hydrate(hits):
+                    yield doc
+        finally:
+            chunks.close()
+
+    def parallel_scan(self, slices=4, workers=None, fn=None, raw=False, chunk_size=1000, keep_alive='1m',
+                      executor='thread'):
+        """
+        分片并行遍历全部结果, 每个worker并行遍历一个slice, 适合全量导出/重建索引
+        for doc in Doc().filter(...).parallel_scan(slices=8):
+            ...
+        结果按批次到达的先后产出, 不保证顺序
+        :param slices: 分片数量, 建议与主分片数量一致
+        :param workers: 并行数量, 默认与slices一致
+        :param fn: 在worker中对每个结果调用的函数, 产出其返回值
+        :param raw: 为True时不转换为文档对象, 直接使用_source字典
+        :param chunk_size: 每次请求的文档数量
+        :param keep_alive: 服务器保持游标的时间
+        :param executor: thread / process, 使用进程时必须提供fn, 且fn和文档类需要可以被pickle
+        :return: generator
+        """
+        if executor not in ('thread', 'process'):
+            raise ValueError('argument executor must be one of thread, process')
+        if executor == 'process' and fn is None:
+            raise UsageError('executor=process requires fn, results are computed in worker processes')
+        body, params = self._query.scan_body()
+        workers = workers or slices
+        if executor == 'process':
+            manager = multiprocessing.Manager()
+            results, stop = manager.Queue(workers * 2), manager.Event()
+            pool = ProcessPoolExecutor(workers)
+        else:
+            manager = None
+            results, stop = queue.Queue(workers * 2), threading.Event()
+            pool = ThreadPoolExecutor(workers)
+
+        futures = [pool.submit(_scan_slice, self.__class__, body, params, i, slices, chunk_size, keep_alive,
+                               fn, raw, list(self._wanted), results, stop)
+                   for i in range(slices)]
+        try:
+            finished = 0
+            while finished < slices:
+                items = results.get()
+                if items is None:
+                    finished += 1
+                    continue
+                for item in items:
+                    yield item
+            for future in futures:
+                future.result()
+        finally:
+            stop.set()
+            for future in futures:
+                while not future.done():
+                    try:
+                        results.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+            pool.shutdown()
+            if manager is not None:
+                manager.shutdown()
+
+    def _hydrate(self, hits):
+        """
+        将一批原始文档转换为文档对象
+        :param hits: [{'_source': {...}}, ...]
+        :return:
+        """
+        self._had_request = True
+        self._docs = {'hits': {'hits': hits}}
+        try:
+            return self._clone()
+        finally:
+            self._docs = {}
+
+    @instrumented('save')
     def save(self):
         """
         文档创建保存
         有可能是修改后的保存,有可能是创建
+        在buffered()中调用时进入写入缓冲, 返回Future
         :return:
         """
+        if self._write_buffer is not None:
+            return self._write_buffer.save(self)
         if self._had_request:
             return self._query.put(self, True)
         else:
@@ -212,6 +496,13 @@ class Doc(BaseDocument, metaclass=ClassOperate):
             key: self.__getattribute__(key).get_value() for key in self.p_c_s
         }
 
+    def to_source(self):
+        """
+        写入服务器的文档内容, Datetime字段按 __datetime_formats__ 声明的格式编码
+        :return: dict
+        """
+        return Hydrator.of(self.__class__).encode(self.query_to_dict())
+
     def get_pk(self):
         if not (self._id is None):
             return self._id
@@ -224,41 +515,177 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         执行all()和first()方法时的最终操作
         检索结果,并产出文档类型
         :param method: 暂由内部决定
-        :param use_catch: 暂不提供缓存
+        :param use_catch: 是否使用进程内缓存, catch_usual=True时总是使用
         :return:
         """
         self._had_request = True
-        if self.catch_usual:
-            use_catch = self._use_catch or use_catch
-        if not use_catch:
-            self._docs = self._query.search()
-            self._had_request = True
-            self._catch[self._query.sql_string] = self._docs
-            return self._clone()
-        else:
-            if self._catch.get(self._query.sql_string, None) is not None:
-                return self._catch.get(self._query.sql_string)
-            else:
-                self._use_catch = False
-                return self.__work(method=method, use_catch=False)
+        self._docs = self._query.search(use_cache=self.catch_usual or use_catch)
+        return self._clone()
 
+    @instrumented('update')
     def update(self, **key_words):
         """
         文档更新, 用于更新部分字段, 不管是局部更新还是全部更新,es都会执行删除重建的操作,区别是局部更新节省网络资源
         注意,该方式更新后当前文档实例的数据不会更新为新数据,需要重新获取,如果需要同步更新,请使用先修改,再save()的方式
         :param key_words: field=value,field=value
-        :return:
+        :return: 在buffered()中调用时返回Future
         """
-        params = dict(key_words)
+        if self._write_buffer is not None:
+            return self._write_buffer.update(self, **key_words)
+        params = Hydrator.of(self.__class__).encode(key_words)
         return self._query.put(self, g=False, body={"doc": params})
 
+    @instrumented('delete')
     def delete(self):
         """
         文档移除
-        :return:
+        :return: 在buffered()中调用时返回Future
         """
+        if self._write_buffer is not None:
+            return self._write_buffer.delete(self)
         return self._query.delete(self)
 
+    def update_all(self, script=None, params=None, slices=None, requests_per_second=None, conflicts=None,
+                   wait=True, refresh=None, **key_words):
+        """
+        在服务器上更新所有符合当前条件的文档(_update_by_query), 不需要先获取文档
+        Doc().filter(Doc.num > 10).update_all(text='新内容', num=0)
+        Doc().filter(...).update_all(script='ctx._source.num += params.step', params={'step': 1})
+        :param script: painless脚本, 给定时忽略key_words
+        :param params: 脚本参数
+        :param slices: 分片并行执行的数量, int 或 'auto'
+        :param requests_per_second: 限速, 每秒处理的文档数
+        :param conflicts: 版本冲突时 abort(默认, 中止) / proceed(跳过继续)
+        :param wait: 为False时不等待完成, 返回Task
+        :param refresh: 完成后是否刷新索引
+        :param key_words: field=value, 使用脚本逐个赋值
+        :return: 服务器响应 或 Task
+        """
+        if script is None:
+            if not key_words:
+                raise ParamsError('update_all() requires script or field=value')
+            for key in key_words:
+                if key not in self.p_c_s:
+                    raise ValueError('no field named %s, choices is %s' % (key, self.p_c_s))
+            script = ';'.join('ctx._source.%s = params.%s' % (key, key) for key in key_words)
+            params = Hydrator.of(self.__class__).encode(key_words)
+        body = {'source': script, 'lang': 'painless'}
+        if params:
+            body['params'] = params
+        return self.__by_query('update_by_query', body, slices=slices, requests_per_second=requests_per_second,
+                               conflicts=conflicts, wait=wait, refresh=refresh)
+
+    def delete_all(self, slices=None, requests_per_second=None, conflicts=None, wait=True, refresh=None):
+        """
+        在服务器上删除所有符合当前条件的文档(_delete_by_query)
+        Doc().filter(Doc.date < datetime(2020, 1, 1)).delete_all(slices='auto', wait=False)
+        参数同update_all()
+        :return: 服务器响应 或 Task
+        """
+        return self.__by_query('delete_by_query', None, slices=slices, requests_per_second=requests_per_second,
+                               conflicts=conflicts, wait=wait, refresh=refresh)
+
+    def __by_query(self, method, script, wait=True, **options):
+        result = self._query.by_query(method, script, wait_for_completion=None if wait else False, **options)
+        if not wait:
+            return Task(self._query, result['task'])
+        return result
+
+    @staticmethod
+    def batch(chunk_size=50):
+        """
+        将多个检索合并为一次_msearch请求
+        with Doc.batch() as b:
+            r1 = b.all(DocA().filter(...))
+            r2 = b.count(DocB().search(...))
+        print(r1.result, r2.result)
+        :param chunk_size: 每个_msearch请求最多包含的检索数量
+        :return: Batch
+        """
+        return Batch(chunk_size=chunk_size)
+
+    @classmethod
+    def buffered(cls, max_docs=500, max_bytes=5 * 1024 * 1024, max_latency_ms=1000, max_pending=10000,
+                 put_timeout=None):
+        """
+        写入缓冲, with块中该文档类的save()/update()/delete()不再等待请求, 而是进入缓冲由后台线程通过_bulk分批发送,
+        返回的Future在发送后得到该文档的结果, 离开with块时发送剩余的文档
+        with Doc.buffered(max_docs=1000, max_latency_ms=200) as buf:
+            futures = [Doc(...).save() for ...]
+            buf.flush()                         # 等待已进入缓冲的文档发送完成
+        :param max_docs: 每批最多文档数
+        :param max_bytes: 每批最大字节数
+        :param max_latency_ms: 文档在缓冲中最长等待时间(毫秒)
+        :param max_pending: 缓冲中最多等待发送的文档数, 满时save()阻塞
+        :param put_timeout: 缓冲满时最长阻塞时间(秒), 为None则一直等待
+        :return: WriteBuffer
+        """
+        return WriteBuffer(cls, max_docs=max_docs, max_bytes=max_bytes, max_latency_ms=max_latency_ms,
+                           max_pending=max_pending, put_timeout=put_timeout)
+
+    @classmethod
+    def mapping(cls):
+        """
+        根据字段声明和__field_options__/__shards__/__replicas__生成的创建索引请求体
+        :return: {'settings': {...}, 'mappings': {type: {'properties': {...}}}}
+        """
+        return build_index_body(cls)
+
+    @classmethod
+    def create_index(cls):
+        """
+        按mapping()创建索引, 需要在写入第一个文档之前调用, 否则服务器已经按动态映射创建了索引
+        :return:
+        """
+        return cls()._query.create_index(cls.mapping())
+
+    @classmethod
+    def bulk_load(cls, forcemerge=False, max_num_segments=1, refresh_interval='-1', replicas=0):
+        """
+        全量写入模式, with块中关闭自动刷新(refresh_interval=-1)和副本(number_of_replicas=0),
+        离开时恢复原来的设置并刷新索引, 索引不存在时按mapping()创建
+        with Doc.bulk_load(forcemerge=True):
+            Doc.bulk_save(docs)
+        :param forcemerge: 结束后是否合并段(只在没有异常时), 适合之后不再写入的索引
+        :param max_num_segments: 合并后每个分片的段数
+        :param refresh_interval: 写入期间的刷新间隔
+        :param replicas: 写入期间的副本数
+        :return: BulkLoad
+        """
+        return BulkLoad(cls, forcemerge=forcemerge, max_num_segments=max_num_segments,
+                        refresh_interval=refresh_interval, replicas=replicas)
+
+    @classmethod
+    def bulk_save(cls, docs, **options):
+        """
+        批量保存, 与逐个调用save()效果一致, 但通过_bulk接口分批发送
+        :param docs: 可迭代的文档对象, 可以是生成器
+        :param options: chunk_size=500, max_chunk_bytes=100M, thread_count=4(同时发送的批次数), queue_size=4
+        :return: [(ok, item), ...] 与docs顺序一致, 单条失败不会抛出异常
+        """
+        return cls()._query.bulk(docs, **options)
+
+    @classmethod
+    def bulk_update(cls, docs, *fields, **options):
+        """
+        批量局部更新
+        :param docs: 可迭代的文档对象
+        :param fields: 需要更新的字段名, 为空则更新全部字段
+        :param options: 同bulk_save
+        :return: [(ok, item), ...]
+        """
+        return cls()._query.bulk(docs, op_type='update', fields=fields, **options)
+
+    @classmethod
+    def bulk_delete(cls, docs, **options):
+        """
+        批量删除
+        :param docs: 可迭代的文档对象
+        :param options: 同bulk_save
+        :return: [(ok, item), ...]
+        """
+        return cls()._query.bulk(docs, op_type='delete', **options)
+
     @property
     def ele_fields(self):
         """
@@ -278,7 +705,8 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         """
         # 拷贝一个当前对象,然后传给处理函数,处理后作为查询结果返回,本实例仍然初始状态,返回的是一个深拷贝的对象
 
-        result = EleFactory(self)
+        with phase('hydrate'):
+            result = EleFactory(self)
         return result
 
     def __bool__(self):
@@ -302,6 +730,43 @@ class Doc(BaseDocument, metaclass=ClassOperate):
         return self
 
 
+def _put_result(results, item, stop):
+    """向结果队列放入数据, 消费方已停止时放弃"""
+    while not stop.is_set():
+        try:
+            results.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _scan_slice(doc_cls, body, params, slice_id, slices, chunk_size, keep_alive, fn, raw, wanted, results, stop):
+    """
+    parallel_scan的worker, 遍历一个slice, 结果按批放入队列, 结束时放入None
+    """
+    try:
+        doc = doc_cls()
+        doc._wanted = wanted
+        if slices > 1:
+            body = dict(body, slice={'id': slice_id, 'max': slices})
+        chunks = doc._query.scan(doc.__pk__, chunk_size=chunk_size, keep_alive=keep_alive, body=body,
+                                 params=params)
+        try:
+            for hits in chunks:
+                if stop.is_set():
+                    break
+                items = [hit.get('_source', {}) for hit in hits] if raw else doc._hydrate(hits)
+                if fn is not None:
+                    items = [fn(item) for item in items]
+                if not _put_result(results, items, stop):
+                    break
+        finally:
+            chunks.close()
+    finally:
+        _put_result(results, None, stop)
+
+
 class Fields(object):
     """
     目前暂定文档类型的字段为json字符串,取string类型